@@ -0,0 +1,465 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import secrets
+import statistics
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from io import StringIO
+from types import SimpleNamespace
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from batch import SKIPPED, BatchJob
+from export import FORMATS, PARQUET, ResultWriter
+from grading import CRITERIA, LEVEL_INSTRUCTIONS, failover_stats, parse_scores, set_transport
+from history import FULL, GRADERS, HistoryStore, grade_and_record, result_mode
+from limiter import BULK, INTERACTIVE, FairShareLimiter
+from preflight import run_preflight
+
+# ----------- API CONFIGURATION ----------- #
+API_HOST = os.getenv("GRADING_API_HOST", "127.0.0.1")
+# The Streamlit app serves the API alongside the UI when this is set
+API_PORT = int(os.getenv("GRADING_API_PORT", "0"))
+# Optional shared secret; clients send "Authorization: Bearer <token>"
+API_TOKEN = os.getenv("GRADING_API_TOKEN", "")
+# Finished jobs kept for polling and download before the oldest are dropped
+API_MAX_JOBS = int(os.getenv("GRADING_API_MAX_JOBS", "500"))
+API_MAX_BATCH = int(os.getenv("GRADING_API_MAX_BATCH", "1000"))
+DEFAULT_PORT = 8502
+
+_KEEPALIVE_SECONDS = 15
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def row_summary(row, include_feedback: bool = True) -> dict:
+    scores = row.scores or parse_scores(row.feedback)
+    summary = {
+        "row_id": row.row_id,
+        "student_id": row.student_id,
+        "assignment_id": row.assignment_id,
+        "status": row.status,
+        "error": row.error or None,
+        "model": row.model or None,
+        "fallback": row.fallback or None,
+        "attempts": row.attempts,
+        "seconds": round(row.finished_at - row.started_at, 3) if row.started_at and row.finished_at else None,
+        "prompt_tokens": row.prompt_tokens,
+        "completion_tokens": row.completion_tokens,
+        "overall_score": scores["overall"],
+        "letter_grade": scores["letter_grade"],
+        "score_spread": row.score_spread,
+    }
+    summary.update({f"{key}_score": scores[key] for key in CRITERIA})
+    if include_feedback:
+        summary["feedback"] = row.feedback or None
+    return summary
+
+
+class ApiJob:
+    """One API submission: a ``BatchJob`` plus the log of finished rows its event streams replay.
+
+    Rows finish on grading threads; ``on_result`` hands each one to the event
+    loop, which appends it to ``events`` and wakes every open stream. A job is
+    done once every row has produced an event (cancelled rows included), even
+    if writing the row to the export file failed.
+    """
+
+    def __init__(self, job_id: str, batch: BatchJob, level: str, mode: str, samples: int, skipped: list,
+                 writer: ResultWriter, loop: asyncio.AbstractEventLoop):
+        self.id = job_id
+        self.batch = batch
+        self.level = level
+        self.mode = mode
+        self.samples = samples
+        self.skipped = skipped
+        self.writer = writer
+        self.created_at = time.time()
+        self.events = []
+        self.export_errors = 0
+        self._loop = loop
+        self._changed = asyncio.Event()
+
+    def on_result(self, row):
+        try:
+            self.writer.write(row)
+        except Exception as e:
+            # The row is graded either way; streams and job completion mustn't wait on the export file
+            self.export_errors += 1
+            logging.getLogger(__name__).warning("Could not export row %s of job %s: %s", row.row_id, self.id, e)
+        self._loop.call_soon_threadsafe(self._publish, row)
+
+    def _publish(self, row):
+        # Feedback stays compressed in the batch; streams attach it when they send the event
+        self.events.append(row_summary(row, include_feedback=False))
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    @property
+    def changed(self) -> asyncio.Event:
+        return self._changed
+
+    @property
+    def done(self) -> bool:
+        return len(self.events) >= len(self.batch.rows)
+
+    def status(self) -> dict:
+        counts = self.batch.counts()
+        return {
+            "job_id": self.id,
+            "state": "cancelled" if self.batch.cancelled else "done" if self.done else "running",
+            "level": self.level,
+            "mode": self.mode,
+            "samples": self.samples,
+            "created_at": self.created_at,
+            "rows": len(self.batch.rows),
+            "counts": counts,
+            "progress": self.batch.progress(),
+            "export_errors": self.export_errors,
+            "skipped": [{"row_id": row_id, "reason": reason} for row_id, reason in self.skipped],
+        }
+
+    def results(self) -> list:
+        rows = [row_summary(row) for row in self.batch.results()]
+        rows += [{"row_id": row_id, "status": SKIPPED, "error": reason} for row_id, reason in self.skipped]
+        return sorted(rows, key=lambda row: row["row_id"])
+
+
+def _sse(event: str, data, event_id: int = None) -> str:
+    head = f"event: {event}\n" + (f"id: {event_id}\n" if event_id is not None else "")
+    return head + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def create_app(limiter: FairShareLimiter, history: HistoryStore, hedger=None, token: str = API_TOKEN) -> Starlette:
+    """HTTP API over the same grading core, limiter and history/result cache as the Streamlit app.
+
+    ``POST /essays`` grades one essay in the interactive lane; ``POST /jobs``
+    grades a batch in the bulk lane, longest rows first. Both return ``202``
+    with a job id to poll (``GET /jobs/{id}``), stream (``GET /jobs/{id}/events``,
+    server-sent events, resumable with ``Last-Event-ID``), download
+    (``GET /jobs/{id}/results?format=json|csv|parquet|arrow``) or cancel
+    (``DELETE /jobs/{id}``). Identical essays are answered from history unless
+    the request sets ``"reuse": false``; with ``"revision": true`` a student's
+    resubmission for an assignment is graded from the changed paragraphs only.
+    """
+    jobs = OrderedDict()
+    jobs_lock = threading.Lock()
+
+    def protected(handler):
+        @wraps(handler)
+        async def endpoint(request: Request):
+            if token and not secrets.compare_digest(request.headers.get("authorization", ""), f"Bearer {token}"):
+                return JSONResponse({"error": "Missing or invalid bearer token"}, status_code=401)
+            try:
+                return await handler(request)
+            except ApiError as e:
+                return JSONResponse({"error": str(e)}, status_code=e.status)
+        return endpoint
+
+    async def read_json(request: Request) -> dict:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise ApiError(400, "Request body must be JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return body
+
+    def grading_options(body: dict) -> tuple:
+        level = body.get("level", "High School")
+        if level not in LEVEL_INSTRUCTIONS:
+            raise ApiError(422, f"'level' must be one of {', '.join(LEVEL_INSTRUCTIONS)}")
+        mode = body.get("mode", FULL)
+        if mode not in GRADERS:
+            raise ApiError(422, f"'mode' must be one of {', '.join(GRADERS)}")
+        samples = body.get("samples", 1)
+        if not isinstance(samples, int) or not 1 <= samples <= 5:
+            raise ApiError(422, "'samples' must be an integer from 1 to 5")
+        export_format = body.get("export", PARQUET)
+        if export_format not in FORMATS:
+            raise ApiError(422, f"'export' must be one of {', '.join(FORMATS)}")
+        revision = bool(body.get("revision", False))
+        if revision and mode != FULL:
+            raise ApiError(422, "'revision' needs mode 'full'")
+        return level, mode, samples, export_format, bool(body.get("reuse", True)), revision
+
+    def get_job(request: Request) -> ApiJob:
+        with jobs_lock:
+            job = jobs.get(request.path_params["job_id"])
+        if job is None:
+            raise ApiError(404, "Unknown job")
+        return job
+
+    def remember(job: ApiJob):
+        with jobs_lock:
+            jobs[job.id] = job
+            # Drop the oldest finished jobs; running ones stay until they finish
+            for old_id in [old_id for old_id, old in jobs.items() if old.done][:max(len(jobs) - API_MAX_JOBS, 0)]:
+                jobs.pop(old_id).writer.discard()
+
+    async def submit(request: Request, body: dict, essays: list, lane: str) -> Response:
+        level, mode, samples, export_format, reuse, revision = grading_options(body)
+        preflight = await run_in_threadpool(
+            run_preflight,
+            [essay.get("essay") for essay in essays],
+            level,
+            [essay.get("student_id", "") for essay in essays],
+            [essay.get("assignment_id", body.get("assignment_id", "")) for essay in essays],
+            concurrency=limiter.capacity - limiter.reserved
+        )
+        if not preflight.rows:
+            raise ApiError(422, "No gradeable essays: " + "; ".join(f"row {row_id}: {reason}" for row_id, reason in preflight.skipped))
+        grade_fn = partial(GRADERS[mode], samples=samples)
+
+        def grade_row(row):
+            return grade_and_record(row.essay, level, history, row.student_id, row.assignment_id, hedger=hedger,
+                                    grade_fn=grade_fn, mode=result_mode(mode, samples), reuse=reuse, revision=revision)
+
+        # Fair share is per calling system; an LMS can split its traffic with X-Client-Id
+        client = request.headers.get("x-client-id") or (request.client.host if request.client else "anonymous")
+        writer = ResultWriter(level, export_format)
+        batch = BatchJob(
+            preflight.rows,
+            grade_row,
+            workers=limiter.capacity if lane == BULK else 1,
+            limiter=limiter,
+            session_id=f"api:{client}",
+            costs=preflight.row_seconds,
+            lane=lane
+        )
+        job = ApiJob(uuid.uuid4().hex, batch, level, mode, samples, preflight.skipped, writer, asyncio.get_running_loop())
+        batch.on_result = job.on_result
+        remember(job)
+        batch.start()
+        base = f"/jobs/{job.id}"
+        return JSONResponse(
+            {"job_id": job.id, "rows": len(preflight.rows), "skipped": len(preflight.skipped),
+             "status_url": base, "events_url": f"{base}/events", "results_url": f"{base}/results"},
+            status_code=202,
+            headers={"Location": base}
+        )
+
+    # ----------- Routes ----------- #
+    @protected
+    async def submit_essay(request: Request) -> Response:
+        body = await read_json(request)
+        if not isinstance(body.get("essay"), str):
+            raise ApiError(422, "'essay' must be a string")
+        return await submit(request, body, [body], INTERACTIVE)
+
+    @protected
+    async def submit_batch(request: Request) -> Response:
+        body = await read_json(request)
+        essays = body.get("essays")
+        if not isinstance(essays, list) or not essays:
+            raise ApiError(422, "'essays' must be a non-empty list")
+        if len(essays) > API_MAX_BATCH:
+            raise ApiError(413, f"At most {API_MAX_BATCH} essays per job")
+        essays = [{"essay": essay} if isinstance(essay, str) else essay for essay in essays]
+        if not all(isinstance(essay, dict) for essay in essays):
+            raise ApiError(422, "Each essay must be a string or an object with an 'essay' field")
+        return await submit(request, body, essays, BULK)
+
+    @protected
+    async def job_status(request: Request) -> Response:
+        job = get_job(request)
+        status = job.status()
+        status["results"] = [row_summary(row, include_feedback=False) for row in job.batch.results(text=False)]
+        return JSONResponse(status)
+
+    @protected
+    async def job_events(request: Request) -> Response:
+        job = get_job(request)
+        try:
+            cursor = int(request.headers.get("last-event-id", "-1")) + 1
+        except ValueError:
+            cursor = 0
+
+        async def stream():
+            nonlocal cursor
+            while True:
+                changed = job.changed
+                while cursor < len(job.events):
+                    event = job.events[cursor]
+                    yield _sse("row", {**event, "feedback": job.batch.feedback(event["row_id"]) or None}, cursor)
+                    cursor += 1
+                if job.done:
+                    yield _sse("done", job.status())
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), _KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    @protected
+    async def job_results(request: Request) -> Response:
+        job = get_job(request)
+        fmt = request.query_params.get("format", "json")
+        if fmt == "json":
+            return JSONResponse({"job_id": job.id, "state": job.status()["state"], "results": job.results()})
+        if fmt == "csv":
+            rows = job.results()
+            out = StringIO()
+            writer = csv.DictWriter(out, fieldnames=list(row_summary(job.batch.results(text=False)[0])), restval="")
+            writer.writeheader()
+            writer.writerows(rows)
+            return Response(out.getvalue(), media_type="text/csv",
+                            headers={"Content-Disposition": f'attachment; filename="graded_essays_{job.id}.csv"'})
+        if fmt in FORMATS:
+            if fmt != job.writer.format:
+                raise ApiError(409, f"This job exports {job.writer.format}; resubmit with \"export\": \"{fmt}\"")
+            path = await run_in_threadpool(job.writer.close)
+            return FileResponse(path, media_type="application/octet-stream", filename=f"graded_essays_{job.id}{FORMATS[fmt]}")
+        raise ApiError(422, f"'format' must be one of json, csv, {', '.join(FORMATS)}")
+
+    @protected
+    async def cancel_job(request: Request) -> Response:
+        job = get_job(request)
+        if not job.done:
+            await run_in_threadpool(job.batch.cancel)
+        return JSONResponse(job.status())
+
+    async def health(request: Request) -> Response:
+        with jobs_lock:
+            running = sum(not job.done for job in jobs.values())
+        return JSONResponse({
+            "status": "ok",
+            "limiter": limiter.stats(),
+            "latency": limiter.lane_latency(),
+            "models": failover_stats(),
+            "jobs": {"running": running, "kept": len(jobs)},
+        })
+
+    return Starlette(routes=[
+        Route("/health", health),
+        Route("/essays", submit_essay, methods=["POST"]),
+        Route("/jobs", submit_batch, methods=["POST"]),
+        Route("/jobs/{job_id}", job_status),
+        Route("/jobs/{job_id}", cancel_job, methods=["DELETE"]),
+        Route("/jobs/{job_id}/events", job_events),
+        Route("/jobs/{job_id}/results", job_results),
+    ])
+
+
+def serve_in_background(app: Starlette, host: str = API_HOST, port: int = API_PORT) -> uvicorn.Server:
+    """Run ``app`` on a daemon thread (e.g. next to Streamlit) and return once it's accepting connections."""
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="grading-api", daemon=True)
+    thread.start()
+    while not server.started and thread.is_alive():
+        time.sleep(0.01)
+    if not server.started:
+        raise RuntimeError(f"Grading API could not start on {host}:{port}")
+    return server
+
+
+# ----------- LOAD TEST ----------- #
+_MOCK_FEEDBACK = (
+    "## 🎯 OVERALL GRADE\n**Score: 84/100 | Letter Grade: B | Performance Level: PROFICIENT**\n\n## 📊 SCORES\n"
+    + "".join(f"• **{label}:** 17/20\n" for label in CRITERIA.values())
+    + "\n**Rationale:** Mock model response for load testing.\n"
+)
+
+
+class MockModel:
+    """Chat-completion transport that answers every request with a canned report after ``latency`` seconds."""
+
+    def __init__(self, latency: float = 0.5, completion_tokens: int = 1200):
+        self.latency = latency
+        self.completion_tokens = completion_tokens
+
+    def create(self, **request):
+        time.sleep(self.latency)
+        n = request.get("n", 1)
+        prompt_tokens = sum(len(message["content"]) for message in request["messages"]) // 4
+        return SimpleNamespace(
+            model=request["model"],
+            choices=[SimpleNamespace(index=index, finish_reason="stop", message=SimpleNamespace(role="assistant", content=_MOCK_FEEDBACK))
+                     for index in range(n)],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=self.completion_tokens * n,
+                                  total_tokens=prompt_tokens + self.completion_tokens * n),
+        )
+
+
+def _follow(base: str, essay: str) -> float:
+    """Submit one essay, read its event stream to the end and return the client-side latency."""
+    started = time.perf_counter()
+    request = urllib.request.Request(f"{base}/essays", data=json.dumps({"essay": essay, "reuse": False}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    with urllib.request.urlopen(request) as response:
+        job = json.load(response)
+    with urllib.request.urlopen(base + job["events_url"]) as events:
+        for line in events:
+            if line.startswith(b"event: done"):
+                break
+    return time.perf_counter() - started
+
+
+def load_test(requests: int = 200, clients: int = 32, latency: float = 0.5, capacity: int = 8) -> dict:
+    """Drive single-essay submissions through a live server backed by ``MockModel`` and measure sustained throughput."""
+    with tempfile.TemporaryDirectory() as directory:
+        limiter = FairShareLimiter(capacity, reserved=0)
+        server = serve_in_background(create_app(limiter, HistoryStore(os.path.join(directory, "history.db")), token=""), "127.0.0.1", 0)
+        base = "http://127.0.0.1:%d" % server.servers[0].sockets[0].getsockname()[1]
+        set_transport(MockModel(latency))
+        essay = "The school day should start later because teenagers need more sleep to learn well. " * 20
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                latencies = sorted(pool.map(lambda index: _follow(base, f"Essay {index}. {essay}"), range(requests)))
+            elapsed = time.perf_counter() - started
+        finally:
+            set_transport(None)
+            server.should_exit = True
+    return {
+        "requests": requests,
+        "seconds": elapsed,
+        "requests_per_second": requests / elapsed,
+        # Every request holds a limiter slot for the mock latency, so this is the most the limiter admits
+        "ceiling": capacity / latency if latency else float("inf"),
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the grading API or load-test it against a mock model.")
+    parser.add_argument("command", choices=("serve", "load-test"))
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT or DEFAULT_PORT)
+    parser.add_argument("--requests", type=int, default=200, help="load test: essays to submit")
+    parser.add_argument("--clients", type=int, default=32, help="load test: concurrent HTTP clients")
+    parser.add_argument("--latency", type=float, default=0.5, help="load test: mock model seconds per request")
+    parser.add_argument("--capacity", type=int, default=8, help="load test: limiter slots")
+    args = parser.parse_args()
+    if args.command == "serve":
+        # Standalone: its own limiter, but the same history database (and so the same result cache) as the app
+        uvicorn.run(create_app(FairShareLimiter(), HistoryStore()), host=args.host, port=args.port)
+    else:
+        result = load_test(args.requests, args.clients, args.latency, args.capacity)
+        print(
+            f"{result['requests']} essays graded in {result['seconds']:.2f}s: "
+            f"{result['requests_per_second']:.1f} req/s sustained (limiter ceiling {result['ceiling']:.1f} req/s) · "
+            f"p50 {result['p50']:.2f}s · p95 {result['p95']:.2f}s"
+        )
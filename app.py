@@ -3,7 +3,26 @@ import os
 import streamlit as st
 import csv
 import pandas as pd
-from io import StringIO
+import time
+import uuid
+from io import BytesIO, StringIO
+from api import API_PORT, create_app, serve_in_background
+from batch import BatchJob, FAILED, GRADED, SKIPPED, filter_results, search_results
+from cassette import CASSETTE_MODE, PASSTHROUGH, REPLAY, Cassette
+from dataclasses import replace
+from functools import partial
+from export import ARROW, FORMATS, PARQUET, ResultWriter
+from failover import HALF_OPEN, OPEN
+from grading import (CONSISTENCY_SPREAD_THRESHOLD, GRADING_MODEL, REVISION_MAX_CHANGED, GradingError, SCORES_MAX_TOKENS,
+                     build_scores_prompt, failover_stats, grade_essay_by_criteria, grade_essay_scores_only, grade_essay_with_feedback,
+                     set_transport)
+from hedging import Hedger
+from history import FULL, SCORES, HistoryStore, grade_and_record, result_mode
+from ingest import IngestError, read_zip_submissions
+from limiter import BULK, INTERACTIVE, FairShareLimiter
+from preflight import EXPECTED_COMPLETION_TOKENS, clean_id, project, run_preflight
+from profiler import CPROFILE, PROFILE_MODE, RunProfiler
+from similarity import NEAR_DUPLICATE_THRESHOLD, NearDuplicateIndex
 from dotenv import load_dotenv  # Load environment variables from .env file
 
 load_dotenv()  # Load environment variables from .env file
@@ -24,843 +43,183 @@ if not api_key:
 # Set OpenAI API key if we have one
 if api_key:
     openai.api_key = api_key
+    # Keep GRADING_TIMEOUT_SECONDS a real deadline; failed rows go to the retry queue instead
+    openai.max_retries = 0
 
-# Check if API key is configured
-if not api_key:
+# Check if API key is configured (a replayed cassette never calls the API)
+if not api_key and CASSETTE_MODE != REPLAY:
     st.error("⚠️ OpenAI API key not found. Please configure it in your environment variables or Streamlit secrets.")
     st.error("Debug info: Make sure your secrets are saved correctly in Streamlit Cloud.")
     st.stop()
 
-# ----------- GRADING ASSISTANT LOGIC ----------- #
-def grade_essay_with_feedback(essay_text: str, level: str) -> str:
-    level_instructions = {
-        "High School": "Evaluate as an experienced high school English teacher. Focus on fundamental writing skills: clear thesis statements, basic paragraph structure, grammar fundamentals, and developing analytical thinking. Encourage growth while being supportive of developing writers.",
-        "College": "Evaluate as a college professor with high academic standards. Emphasize sophisticated argumentation, college-level analysis, proper citation and evidence use, advanced writing mechanics, and critical thinking skills appropriate for undergraduate work.",
-        "Professional": "Evaluate as a professional editor and writing coach. Apply the highest standards for clarity, precision, persuasiveness, and polish. Expect publication-quality writing with sophisticated analysis, flawless mechanics, and compelling argumentation suitable for professional or graduate-level work."
-    }
+# ----------- PROFILING ----------- #
+# Opt in with GRADING_PROFILE=1 (or =cprofile) or ?profile=1 / ?profile=cprofile in the URL
+profile_mode = st.query_params.get("profile", PROFILE_MODE).lower()
+previous_profiler = st.session_state.get("run_profiler")
+if previous_profiler is not None:
+    # A no-op unless the previous run ended in st.rerun() before reaching the end of the script
+    st.session_state.last_profile = previous_profiler.finish()
+profiler = RunProfiler(
+    profile_mode not in ("", "0", "false", "off"),
+    label=st.session_state.setdefault("session_id", uuid.uuid4().hex)[:8],
+    cprofile=profile_mode == CPROFILE
+)
+if previous_profiler is not None:
+    # Batch rows started in an earlier run record their spans into whichever run is open
+    previous_profiler.hand_off(profiler)
+st.session_state.run_profiler = profiler if profiler.enabled else None
+profiler.phase("setup")
+
+# ----------- SHARED RESOURCES ----------- #
+THEME_CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "theme.css")
+
+@st.cache_resource
+def get_cassette() -> Cassette:
+    # GRADING_CASSETTE_MODE=record|replay; replay serves recorded responses without an API key
+    return Cassette()
+
+@st.cache_resource
+def get_hedger() -> Hedger:
+    # One per server process so the latency percentile reflects every session's traffic;
+    # duplicates only go out on a free limiter slot
+    return Hedger(limiter=get_limiter())
+
+@st.cache_resource
+def get_limiter() -> FairShareLimiter:
+    # Shared by every session so one big batch can't monopolise the API key
+    return FairShareLimiter()
+
+@st.cache_resource
+def get_history_store() -> HistoryStore:
+    return HistoryStore()
+
+@st.cache_resource
+def get_similarity_index() -> NearDuplicateIndex:
+    return NearDuplicateIndex()
+
+@st.cache_resource
+def load_theme_css() -> str:
+    # Read once per server process; the stylesheet is static, so nothing restyles the page after it loads
+    with open(THEME_CSS_PATH, encoding="utf-8") as f:
+        return f.read()
+
+@st.cache_resource
+def get_api_server():
+    # Same process as the UI, so API requests share its limiter slots and history/result cache
+    return serve_in_background(create_app(get_limiter(), get_history_store()))
+
+if CASSETTE_MODE != PASSTHROUGH:
+    set_transport(get_cassette())
+
+if API_PORT:
+    get_api_server()
+
+# ----------- UPLOAD HELPERS ----------- #
+@st.cache_data(show_spinner="📦 Extracting submissions from ZIP...", max_entries=4)
+def load_zip_submissions(file_id: str, _upload) -> tuple:
+    # Cached on the upload's file_id (the underscore keeps the archive bytes out of the cache key),
+    # so the background-job polling reruns neither re-extract nor re-hash the archive
+    submissions, skipped = read_zip_submissions(BytesIO(_upload.getvalue()))
+    df = pd.DataFrame(submissions, columns=["student_id", "essay", "filename"])
+    return df.rename(columns={"student_id": "Student ID", "essay": "Essay", "filename": "Source File"}), skipped
+
+# ----------- GRADING HELPERS ----------- #
+def describe_similarity(matches: list, student_id: str = "") -> list:
+    notes = []
+    for match in matches:
+        owner = f"{match['student_id']}'s essay" if match["student_id"] else "an earlier essay"
+        if match["assignment_id"]:
+            owner += f" ({match['assignment_id']})"
+        if match["student_id"] and match["student_id"] == student_id:
+            kind = "🔁 Likely resubmission of"
+        elif match["similarity"] >= NEAR_DUPLICATE_THRESHOLD:
+            kind = "🚨 Near-duplicate of"
+        else:
+            kind = "⚠️ Shares a large passage with"
+        notes.append(f"{kind} {owner}, {match['overlap']:.0%} overlap: “{match['excerpt']}…”")
+    return notes
 
-    prompt = (
-        f"You are an expert writing instructor with 15+ years of experience grading student essays. {level_instructions[level]}\n\n"
-        
-        "🎯 ENHANCED GRADING FRAMEWORK:\n"
-        "Apply this comprehensive rubric to provide detailed, actionable feedback that drives student improvement. Consider consistency, specificity, and developmental appropriateness in your evaluation.\n\n"
-        
-        "📚 BENCHMARK REFERENCE - EXEMPLARY COLLEGE ESSAY (95/100):\n"
-        "Use this high-performing college essay as a reference point for quality standards, but adjust expectations appropriately for developmental level. This benchmark essay demonstrates:\n"
-        "- EXCEPTIONAL thesis: Clear stance on NCAA settlement's impact on non-revenue sports\n"
-        "- SOPHISTICATED argumentation: Multi-faceted analysis with cause-effect reasoning\n"
-        "- STRONG evidence integration: Current events (House v. NCAA), specific data, real examples\n"
-        "- EXCELLENT organization: Logical flow from problem to impact to solutions\n"
-        "- PROFICIENT writing mechanics: Clear, engaging prose with varied sentence structure\n"
-        "- ORIGINAL critical thinking: Nuanced perspective on complex issue with practical solutions\n\n"
-        
-        "Key strengths to look for based on this benchmark (adjust expectations for student level):\n"
-        "• Specific, arguable thesis that takes a clear position\n"
-        "• Integration of current events and real-world examples\n"
-        "• Logical progression from problem identification to solution proposal\n"
-        "• Use of credible sources and specific data/statistics\n"
-        "• Consideration of multiple stakeholders and perspectives\n"
-        "• Practical, actionable solutions supported by evidence\n"
-        "• Engaging introduction that establishes stakes and importance\n"
-        "• Strong conclusion that reinforces main argument and broader implications\n\n"
-        
-        "📊 DETAILED RUBRIC CRITERIA (each scored out of 20 points):\n\n"
-        
-        "1. 💡 THESIS & ARGUMENT DEVELOPMENT (20 points):\n"
-        "   • 18-20 (EXCEPTIONAL): Crystal-clear, sophisticated thesis that takes a compelling, nuanced position (like the NCAA essay's stance on protecting non-revenue sports). Arguments are logically sequenced, well-reasoned, and demonstrate deep understanding. Counter-arguments or complexities addressed thoughtfully.\n"
-        "   • 15-17 (PROFICIENT): Strong, specific thesis with clear argument structure. Most claims are well-developed and supported. Shows good understanding of topic complexity and multiple perspectives.\n"
-        "   • 12-14 (DEVELOPING): Thesis present and generally clear, though may lack some specificity or sophistication. Arguments are adequate and show understanding, with room for deeper development.\n"
-        "   • 9-11 (EMERGING): Basic thesis present but may be unclear or overly broad. Arguments need development but show some effort toward logical structure.\n"
-        "   • 0-8 (INADEQUATE): No identifiable thesis or argument structure. Claims are unsupported, contradictory, or missing entirely.\n\n"
-        
-        "2. 📚 EVIDENCE & ANALYSIS QUALITY (20 points):\n"
-        "   • 18-20 (EXCEPTIONAL): Rich, credible evidence from multiple high-quality sources (current events, data, real examples like the Stanford case study). Analysis is sophisticated, insightful, and goes beyond surface-level observations. Evidence seamlessly integrated and supports all major claims.\n"
-        "   • 15-17 (PROFICIENT): Good variety of relevant evidence with solid analysis. Sources are credible and mostly well-integrated. Analysis shows clear understanding and some original insight.\n"
-        "   • 12-14 (DEVELOPING): Adequate evidence with basic analysis that demonstrates understanding. Some examples provided, though analysis could be deeper. Evidence generally supports the argument.\n"
-        "   • 9-11 (EMERGING): Limited evidence but shows effort to support claims. Analysis is basic but present. Some sources may be weak but attempts at integration are made.\n"
-        "   • 0-8 (INADEQUATE): Little to no evidence provided. No meaningful analysis present.\n\n"
-        
-        "3. 🏗️ ORGANIZATION & COHERENCE (20 points):\n"
-        "   • 18-20 (EXCEPTIONAL): Masterful organization with seamless transitions and perfect logical flow (problem→impact→solutions structure). Introduction hooks reader and clearly previews structure. Conclusion synthesizes ideas powerfully and addresses broader implications.\n"
-        "   • 15-17 (PROFICIENT): Well-organized with effective transitions between ideas. Clear introduction, focused body paragraphs with topic sentences, and strong conclusion that reinforces main argument.\n"
-        "   • 12-14 (DEVELOPING): Generally well-organized with basic structure evident. Introduction, body, and conclusion present. Some transitions may be simple but structure is clear and logical.\n"
-        "   • 9-11 (EMERGING): Basic organization present with identifiable paragraphs. Structure may be simple but shows understanding of essay format. Some organizational issues but overall coherent.\n"
-        "   • 0-8 (INADEQUATE): No clear organizational pattern. Ideas presented randomly or incoherently.\n\n"
-        
-        "4. ✍️ LANGUAGE MASTERY & STYLE (20 points):\n"
-        "   • 18-20 (EXCEPTIONAL): Exceptional command of language with varied, sophisticated sentence structure. Precise, engaging word choice and tone appropriate for audience. Virtually error-free mechanics.\n"
-        "   • 15-17 (PROFICIENT): Strong control of language with clear, effective writing. Minor errors don't impede understanding. Good sentence variety and appropriate style.\n"
-        "   • 12-14 (DEVELOPING): Generally clear and readable language with adequate word choice. Some mechanical errors but meaning remains clear. Writing communicates ideas effectively with room for refinement.\n"
-        "   • 9-11 (EMERGING): Basic language use that conveys meaning adequately. Some errors present but don't significantly interfere with comprehension. Simple but functional style.\n"
-        "   • 0-8 (INADEQUATE): Serious mechanical problems that severely impact comprehension. Very limited language control.\n\n"
-        
-        "5. 🧠 CRITICAL THINKING & INTELLECTUAL DEPTH (20 points):\n"
-        "   • 18-20 (EXCEPTIONAL): Demonstrates exceptional critical thinking with original insights and intellectual depth (like analyzing unintended consequences of NCAA settlement on non-revenue sports). Makes connections others might miss. Challenges assumptions thoughtfully and considers multiple stakeholder perspectives with practical solutions.\n"
-        "   • 15-17 (PROFICIENT): Shows good critical thinking with some original ideas. Goes beyond obvious interpretations and demonstrates independent thought with consideration of multiple viewpoints.\n"
-        "   • 12-14 (DEVELOPING): Basic critical thinking present with some analysis beyond summary. Shows effort to think independently about the topic, though insights may be straightforward or obvious.\n"
-        "   • 9-11 (EMERGING): Some attempt at analysis or personal perspective, though may rely heavily on summary. Shows beginning stages of critical thinking development.\n"
-        "   • 0-8 (INADEQUATE): No evidence of critical thinking. Purely descriptive or factual with no analysis or original perspective.\n\n"
-        
-        "📋 ENHANCED RESPONSE FORMAT:\n"
-        "Provide detailed, specific feedback using this structure:\n\n"
-        
-        "## 🎯 OVERALL GRADE\n"
-        "**Score: [X]/100 | Letter Grade: [X] | Performance Level: [EXCEPTIONAL/PROFICIENT/DEVELOPING/EMERGING/INADEQUATE]**\n\n"
-        
-        "## 📊 COMPREHENSIVE BREAKDOWN\n"
-        "• **Thesis & Argument Development:** [X]/20 - [Specific explanation with text examples]\n"
-        "• **Evidence & Analysis Quality:** [X]/20 - [Specific explanation with text examples]\n"
-        "• **Organization & Coherence:** [X]/20 - [Specific explanation with text examples]\n"
-        "• **Language Mastery & Style:** [X]/20 - [Specific explanation with text examples]\n"
-        "• **Critical Thinking & Depth:** [X]/20 - [Specific explanation with text examples]\n\n"
-        
-        "## 💪 NOTABLE STRENGTHS\n"
-        "[Highlight 2-3 specific accomplishments with quoted examples from the text. Be specific about what makes these elements successful.]\n\n"
-        
-        "## 🎯 PRIORITY IMPROVEMENT AREAS\n"
-        "[Identify 2-3 most impactful areas for improvement, ranked by importance. Explain why these areas matter and how improvement would elevate the overall essay.]\n\n"
-        
-        "## ✏️ CONCRETE REVISION EXAMPLES\n"
-        "[Provide 3-4 specific examples: quote problematic text and offer improved versions. Show, don't just tell.]\n"
-        "- ORIGINAL: \"[Quote from essay]\"\n"
-        "- REVISED: \"[Your improved version]\"\n"
-        "- WHY: [Brief explanation of improvement]\n\n"
-        
-        "## 🚀 ACTIONABLE NEXT STEPS\n"
-        "1. **Immediate Action:** [One specific revision strategy for this essay]\n"
-        "2. **Skill Building:** [One practice exercise for future essays]\n"
-        "3. **Resource:** [Specific writing resource, technique, or area of study]\n\n"
-        
-        "## 📈 GROWTH TRACKING\n"
-        "[Comment on progress indicators and what to focus on for continued improvement]\n\n"
-        
-        "GRADING SCALE:\n"
-        "A+ = 97-100, A = 93-96, A- = 90-92, B+ = 87-89, B = 83-86, B- = 80-82,\n"
-        "C+ = 77-79, C = 73-76, C- = 70-72, D+ = 67-69, D = 63-66, D- = 60-62, F = below 60\n\n"
-        
-        "**GRADING PRINCIPLES:**\n"
-        "- Use the benchmark essay as a reference point while adjusting expectations appropriately for student level\n"
-        "- Be encouraging and recognize effort while maintaining standards for growth\n"
-        "- Focus on specific, actionable improvements that help students progress toward benchmark quality\n"
-        "- Quote directly from the text when providing examples, showing how to build toward benchmark strengths\n"
-        "- Consider the writer's developmental stage and celebrate progress while pushing for continued growth\n"
-        "- Provide concrete strategies students can immediately implement to improve\n"
-        "- Balance constructive criticism with recognition of effort and existing strengths\n"
-        "- Look for evidence of benchmark qualities while acknowledging different levels of development\n"
-        "- Aim to inspire improvement rather than discourage; be rigorous but fair and supportive"
+# ----------- RESULTS BROWSER ----------- #
+BROWSE_PAGE_SIZES = (10, 25, 50)
+BROWSE_SORTS = ("Upload order", "Lowest score first", "Highest score first")
+
+@st.fragment
+def results_browser(job: BatchJob):
+    """Paged view of a batch's results; only the visible page's feedback is decompressed and sent to the browser.
+
+    Runs as a fragment, so paging and filtering rerun just this block instead
+    of the whole script (and the batch export below it).
+    """
+    st.subheader("🔎 Browse Results")
+    search_col, status_col = st.columns([3, 1])
+    query = search_col.text_input("Search student ID, essay or feedback", key="browse_query", placeholder="e.g. S-1042, thesis, citation")
+    status = status_col.selectbox("Status", ("All", "Graded", "Failed"), key="browse_status")
+    score_col, letter_col, sort_col = st.columns([2, 2, 1])
+    score_range = score_col.slider("Overall score", 0, 100, (0, 100), key="browse_scores")
+    letters = letter_col.multiselect("Letter grade", ["A", "B", "C", "D", "F"], key="browse_letters")
+    sort = sort_col.selectbox("Sort", BROWSE_SORTS, key="browse_sort")
+
+    rows = filter_results(
+        job.results(text=False),
+        search_results(job, query.strip(), st.session_state.setdefault("browse_search", {})) if query.strip() else None,
+        score_range,
+        letters,
+        status
     )
+    if sort != BROWSE_SORTS[0]:
+        scored = [row for row in rows if (row.scores or {}).get("overall") is not None]
+        unscored = [row for row in rows if (row.scores or {}).get("overall") is None]
+        rows = sorted(scored, key=lambda row: row.scores["overall"], reverse=sort == BROWSE_SORTS[2]) + unscored
 
-    try:
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": essay_text}
-            ]
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error grading essay: {str(e)}"
+    page_size = st.session_state.get("browse_page_size", BROWSE_PAGE_SIZES[0])
+    pages = max(1, -(-len(rows) // page_size))
+    filters = (query, status, tuple(score_range), tuple(letters), sort, page_size, id(job))
+    if st.session_state.get("browse_filters") != filters:
+        # New filters start back on the first page
+        st.session_state.browse_filters = filters
+        st.session_state.browse_page = 1
+    st.session_state.browse_page = min(st.session_state.get("browse_page", 1), pages)
 
+    page_col, size_col, count_col = st.columns([1, 1, 2])
+    page = page_col.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key="browse_page")
+    size_col.selectbox("Per page", BROWSE_PAGE_SIZES, key="browse_page_size")
+    start = (page - 1) * page_size
+    if rows:
+        count_col.caption(f"Showing {start + 1}-{min(start + page_size, len(rows))} of {len(rows)} matching essays ({len(job.rows)} in batch)")
+    else:
+        count_col.caption(f"No essays match these filters ({len(job.rows)} in batch)")
+    for row in rows[start:start + page_size]:
+        scores = row.scores or {}
+        grade = f"{scores['overall']:g}/100 {scores.get('letter_grade') or ''}" if scores.get("overall") is not None else "no score"
+        icon = "❌" if row.status == FAILED else "✅"
+        with st.expander(f"{icon} Row {row.row_id + 1} · {row.student_id or 'no ID'} · {grade}"):
+            if row.status == FAILED:
+                st.error(row.error)
+            feedback = job.feedback(row.row_id)
+            if feedback:
+                st.markdown(feedback)
+            st.caption("📄 Essay: " + job.essay(row.row_id)[:300] + "…")
+
+# ----------- CSV EXPORT ----------- #
 def export_grades_csv(grades: list) -> str:
     csv_buffer = StringIO()
     writer = csv.writer(csv_buffer)
-    writer.writerow(["Essay (excerpt)", "Feedback"])
+    writer.writerow(["Student ID", "Essay (excerpt)", "Status", "Feedback", "Error"])
     writer.writerows(grades)
     return csv_buffer.getvalue()
 
 # ----------- STREAMLIT UI ----------- #
 
-# --- Custom CSS for modern dark theme with emerald accents --- #
+# --- Dark theme: colours in .streamlit/config.toml, everything else in theme.css --- #
+profiler.phase("theme CSS")
 st.markdown(
-    """
-    <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">
-    <style>
-    /* Import Google Fonts */
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700;800&display=swap');
-    
-    /* MOBILE-FIRST RESPONSIVE DESIGN */
-    html, body {
-        -webkit-text-size-adjust: 100%;
-        -webkit-font-smoothing: antialiased;
-        -moz-osx-font-smoothing: grayscale;
-    }
-    
-    /* Ensure proper mobile viewport */
-    .stApp {
-        touch-action: manipulation;
-    }
-    
-    body, .stApp {
-        background: linear-gradient(135deg, #0a0b1e 0%, #1a1b3a 25%, #2d1b4e 50%, #1e2c5a 75%, #0f1419 100%) !important;
-        color: white !important;
-        font-family: 'Inter', sans-serif;
-        min-height: 100vh;
-        overflow-x: hidden;
-        overflow-y: auto;
-    }
-    .main, .block-container {
-        background: rgba(15, 23, 42, 0.8);
-        backdrop-filter: blur(25px);
-        border: 1px solid rgba(59, 130, 246, 0.3);
-        border-radius: 24px;
-        box-shadow: 0 32px 64px -12px rgba(0, 0, 0, 0.6), 0 0 0 1px rgba(59, 130, 246, 0.1);
-        padding: 2.5rem 2.5rem 2rem 2.5rem;
-        color: #f1f5f9 !important;
-        position: relative;
-        overflow: visible;
-        max-height: none;
-        height: auto;
-    }
-    
-    /* MOBILE RESPONSIVE LAYOUT */
-    @media (max-width: 768px) {
-        .main, .block-container {
-            padding: 1.5rem 1rem 1rem 1rem !important;
-            border-radius: 16px !important;
-            margin: 0.5rem !important;
-        }
-        
-        .stButton>button {
-            width: 100% !important;
-            padding: 1rem 1.5rem !important;
-            font-size: 1rem !important;
-            margin: 0.5rem 0 !important;
-        }
-        
-        .stTextArea>div>div>textarea {
-            min-height: 200px !important;
-            font-size: 16px !important; /* Prevents zoom on iOS */
-        }
-        
-        .stTextInput>div>div>input {
-            font-size: 16px !important; /* Prevents zoom on iOS */
-        }
-        
-        .stSelectbox>div>div>div>div {
-            font-size: 16px !important; /* Prevents zoom on iOS */
-            min-height: 48px !important; /* Better touch targets */
-        }
-        
-        .stRadio>div>div {
-            margin-bottom: 1rem !important;
-        }
-        
-        .stRadio>div>div>label {
-            font-size: 1rem !important;
-            padding: 0.75rem !important;
-        }
-        
-        .stFileUploader>div>div>div {
-            padding: 2rem 1rem !important;
-            margin: 1rem 0 !important;
-        }
-        
-        .stDownloadButton>button {
-            width: 100% !important;
-            padding: 1rem 1.5rem !important;
-            font-size: 1rem !important;
-            margin: 1rem 0 !important;
-        }
-        
-        /* Better spacing for mobile */
-        .stMarkdown {
-            margin-bottom: 1rem !important;
-        }
-        
-        /* Improve form labels on mobile */
-        .stSelectbox>div>label,
-        .stTextArea>div>label,
-        .stTextInput>div>label,
-        .stFileUploader>div>label,
-        .stRadio>div>label {
-            font-size: 1.1rem !important;
-            margin-bottom: 0.5rem !important;
-            display: block !important;
-        }
-    }
-    
-    @media (max-width: 480px) {
-        .main, .block-container {
-            padding: 1rem 0.75rem 0.75rem 0.75rem !important;
-            border-radius: 12px !important;
-            margin: 0.25rem !important;
-        }
-        
-        .stButton>button {
-            padding: 0.9rem 1.2rem !important;
-            font-size: 0.95rem !important;
-        }
-        
-        .stDownloadButton>button {
-            padding: 0.9rem 1.2rem !important;
-            font-size: 0.95rem !important;
-        }
-        
-        .stTextArea>div>div>textarea {
-            min-height: 180px !important;
-        }
-        
-        /* Smaller form elements on very small screens */
-        .stSelectbox>div>label,
-        .stTextArea>div>label,
-        .stTextInput>div>label,
-        .stFileUploader>div>label,
-        .stRadio>div>label {
-            font-size: 1rem !important;
-        }
-        
-        .stRadio>div>div>label {
-            font-size: 0.95rem !important;
-            padding: 0.6rem !important;
-        }
-    }
-    
-    /* TABLET RESPONSIVE */
-    @media (min-width: 769px) and (max-width: 1024px) {
-        .main, .block-container {
-            padding: 2rem 1.5rem 1.5rem 1.5rem !important;
-        }
-        
-        .stButton>button,
-        .stDownloadButton>button {
-            padding: 0.8rem 2rem !important;
-        }
-    }
-    .main::before, .block-container::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        bottom: 0;
-        background: linear-gradient(45deg, rgba(59, 130, 246, 0.05) 0%, rgba(147, 51, 234, 0.05) 50%, rgba(16, 185, 129, 0.05) 100%);
-        pointer-events: none;
-        z-index: -1;
-    }
-    .stButton>button {
-        background: linear-gradient(135deg, #3b82f6 0%, #1d4ed8 50%, #1e40af 100%);
-        color: white;
-        border-radius: 16px;
-        border: none;
-        padding: 0.9em 2.5em;
-        font-weight: 700;
-        font-size: 1.1em;
-        transition: all 0.4s cubic-bezier(0.4, 0, 0.2, 1);
-        box-shadow: 0 8px 25px rgba(59, 130, 246, 0.4), 0 0 0 1px rgba(59, 130, 246, 0.2);
-        font-family: 'Inter', sans-serif;
-        position: relative;
-        overflow: hidden;
-    }
-    .stButton>button::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: -100%;
-        width: 100%;
-        height: 100%;
-        background: linear-gradient(90deg, transparent, rgba(255, 255, 255, 0.2), transparent);
-        transition: left 0.5s;
-    }
-    .stButton>button:hover::before {
-        left: 100%;
-    }
-    .stButton>button:hover {
-        background: linear-gradient(135deg, #2563eb 0%, #1d4ed8 50%, #1e3a8a 100%);
-        transform: translateY(-3px) scale(1.02);
-        box-shadow: 0 12px 40px rgba(59, 130, 246, 0.5), 0 0 0 1px rgba(59, 130, 246, 0.3);
-    }
-    .stTextInput>div>input, .stTextArea>div>textarea {
-        background: rgba(15, 23, 42, 0.9) !important;
-        border-radius: 16px;
-        border: 2px solid rgba(59, 130, 246, 0.2);
-        color: #f1f5f9 !important;
-        font-family: 'Inter', sans-serif;
-        transition: all 0.3s ease;
-        backdrop-filter: blur(10px);
-        font-size: 1.05em;
-    }
-    .stTextInput input, .stTextArea textarea {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-    }
-    .stTextInput input::placeholder, .stTextArea textarea::placeholder {
-        color: rgba(241, 245, 249, 0.6) !important;
-    }
-    .stTextInput>div>input:focus, .stTextArea>div>textarea:focus {
-        border-color: #3b82f6 !important;
-        box-shadow: 0 0 0 4px rgba(59, 130, 246, 0.15), 0 8px 25px rgba(59, 130, 246, 0.2);
-        background: rgba(15, 23, 42, 0.95) !important;
-        color: #f1f5f9 !important;
-        transform: scale(1.01);
-    }
-    .stSelectbox>div>div>div>div {
-        background: rgba(15, 23, 42, 0.9) !important;
-        border-radius: 16px;
-        border: 2px solid rgba(59, 130, 246, 0.2);
-        color: #f1f5f9 !important;
-        font-family: 'Inter', sans-serif;
-        backdrop-filter: blur(10px);
-        font-size: 1.05em;
-        transition: all 0.3s ease;
-    }
-    .stSelectbox>div>div>div>div>div {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-    }
-    .stSelectbox select {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-    }
-    .stSelectbox option {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-    }
-    /* Additional selectbox targeting */
-    .stSelectbox div[data-baseweb="select"] {
-        background: rgba(15, 23, 42, 0.9) !important;
-        color: #f1f5f9 !important;
-    }
-    .stSelectbox div[data-baseweb="select"] > div {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-    }
-    /* Dropdown menu styling when expanded */
-    .stSelectbox ul[role="listbox"] {
-        background: rgba(15, 23, 42, 0.95) !important;
-        border: 2px solid rgba(59, 130, 246, 0.3) !important;
-        border-radius: 12px !important;
-        backdrop-filter: blur(15px) !important;
-        box-shadow: 0 8px 25px rgba(0, 0, 0, 0.4) !important;
-    }
-    .stSelectbox li[role="option"] {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-        padding: 0.75rem 1rem !important;
-        font-family: 'Inter', sans-serif !important;
-        font-size: 1.05em !important;
-    }
-    .stSelectbox li[role="option"]:hover {
-        background: rgba(59, 130, 246, 0.2) !important;
-        color: #ffffff !important;
-    }
-    /* Target the dropdown options more aggressively */
-    div[data-baseweb="popover"] ul {
-        background: rgba(15, 23, 42, 0.95) !important;
-        border: 2px solid rgba(59, 130, 246, 0.3) !important;
-        border-radius: 12px !important;
-    }
-    div[data-baseweb="popover"] li {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-    }
-    div[data-baseweb="popover"] li:hover {
-        background: rgba(59, 130, 246, 0.2) !important;
-        color: #ffffff !important;
-    }
-    .stRadio>div>label {
-        color: #f1f5f9 !important;
-        font-weight: 700 !important;
-        font-family: 'Inter', sans-serif !important;
-        font-size: 1.1em !important;
-        text-shadow: 0 0 10px rgba(241, 245, 249, 0.3) !important;
-    }
-    .stRadio>div>div>label {
-        color: #f1f5f9 !important;
-        font-weight: 600 !important;
-        font-family: 'Inter', sans-serif !important;
-        font-size: 1.05em !important;
-        text-shadow: 0 1px 3px rgba(0, 0, 0, 0.5) !important;
-    }
-    .stRadio>div>div>label>div {
-        color: #f1f5f9 !important;
-    }
-    .stRadio>div>div {
-        color: #f1f5f9 !important;
-    }
-    .stSelectbox>div>label {
-        color: #f1f5f9 !important;
-        font-weight: 700 !important;
-        font-family: 'Inter', sans-serif !important;
-        font-size: 1.1em !important;
-        text-shadow: 0 0 10px rgba(241, 245, 249, 0.3) !important;
-    }
-    .stTextArea>div>label {
-        color: #f1f5f9 !important;
-        font-weight: 700;
-        font-family: 'Inter', sans-serif;
-        font-size: 1.1em;
-        text-shadow: 0 0 10px rgba(241, 245, 249, 0.3);
-    }
-    .stFileUploader>div>label {
-        color: #f1f5f9 !important;
-        font-weight: 700;
-        font-family: 'Inter', sans-serif;
-        font-size: 1.1em;
-        text-shadow: 0 0 10px rgba(241, 245, 249, 0.3);
-    }
-    .stProgress>div>div>div {
-        background: linear-gradient(90deg, #3b82f6 0%, #8b5cf6 50%, #06b6d4 100%) !important;
-        border-radius: 12px;
-        box-shadow: 0 4px 15px rgba(59, 130, 246, 0.4);
-    }
-    .stDownloadButton>button {
-        background: linear-gradient(135deg, #8b5cf6 0%, #7c3aed 50%, #6d28d9 100%);
-        color: white;
-        border-radius: 16px;
-        border: none;
-        font-weight: 700;
-        font-size: 1.1em;
-        padding: 0.9em 2.5em;
-        transition: all 0.4s cubic-bezier(0.4, 0, 0.2, 1);
-        box-shadow: 0 8px 25px rgba(139, 92, 246, 0.4), 0 0 0 1px rgba(139, 92, 246, 0.2);
-        font-family: 'Inter', sans-serif;
-        position: relative;
-        overflow: hidden;
-    }
-    .stDownloadButton>button::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: -100%;
-        width: 100%;
-        height: 100%;
-        background: linear-gradient(90deg, transparent, rgba(255, 255, 255, 0.2), transparent);
-        transition: left 0.5s;
-    }
-    .stDownloadButton>button:hover::before {
-        left: 100%;
-    }
-    .stDownloadButton>button:hover {
-        background: linear-gradient(135deg, #7c3aed 0%, #6d28d9 50%, #5b21b6 100%);
-        transform: translateY(-3px) scale(1.02);
-        box-shadow: 0 12px 40px rgba(139, 92, 246, 0.5), 0 0 0 1px rgba(139, 92, 246, 0.3);
-    }
-    .stAlert {
-        border-radius: 16px;
-        background: rgba(15, 23, 42, 0.9);
-        border: 2px solid rgba(59, 130, 246, 0.3);
-        backdrop-filter: blur(15px);
-        box-shadow: 0 8px 25px rgba(0, 0, 0, 0.3);
-    }
-    /* Ensure text visibility - AGGRESSIVE OVERRIDES */
-    .main, .block-container, .stTextInput>div>input, .stTextArea>div>textarea, .stSelectbox>div>div>div>div {
-        color: #f1f5f9 !important;
-    }
-    /* Additional text styling for better visibility */
-    .stMarkdown, .stMarkdown p, .stMarkdown h1, .stMarkdown h2, .stMarkdown h3 {
-        color: #f1f5f9 !important;
-    }
-    label, .stSelectbox label, .stTextArea label, .stTextInput label, .stFileUploader label {
-        color: #f1f5f9 !important;
-        font-weight: 700 !important;
-        text-shadow: 0 1px 3px rgba(0, 0, 0, 0.5) !important;
-    }
-    /* FORCE ALL TEXT TO BE VISIBLE */
-    * {
-        color: #f1f5f9 !important;
-    }
-    .stApp, .main, .block-container, div, p, span, label, input, textarea, select {
-        color: #f1f5f9 !important;
-    }
-    
-    /* AGGRESSIVE TEXT INPUT FIXES */
-    .stTextInput input, .stTextArea textarea, 
-    .stTextInput > div > div > input, 
-    .stTextArea > div > div > textarea,
-    [data-testid="textInput"] input,
-    [data-testid="textArea"] textarea {
-        color: #f1f5f9 !important;
-        background-color: rgba(15, 23, 42, 0.9) !important;
-        -webkit-text-fill-color: #f1f5f9 !important;
-    }
-    
-    /* Target Streamlit's specific input classes */
-    .st-emotion-cache-1y4p8pa input,
-    .st-emotion-cache-1y4p8pa textarea {
-        color: #f1f5f9 !important;
-        background-color: rgba(15, 23, 42, 0.9) !important;
-    }
-    
-    /* Target Streamlit's specific dropdown classes */
-    .st-emotion-cache-1y4p8pa select,
-    .st-emotion-cache-1y4p8pa div[data-baseweb="select"],
-    .st-emotion-cache-1y4p8pa ul[role="listbox"],
-    .st-emotion-cache-1y4p8pa li[role="option"],
-    .st-emotion-cache-1y4p8pa div[data-baseweb="popover"],
-    [class*="st-emotion-cache"] ul[role="listbox"] li,
-    [class*="st-emotion-cache"] div[data-baseweb="popover"] li,
-    [class*="st-emotion-cache"] [role="option"] {
-        color: #f1f5f9 !important;
-        background-color: rgba(15, 23, 42, 0.9) !important;
-        -webkit-text-fill-color: #f1f5f9 !important;
-    }
-    /* Custom scrollbar */
-    ::-webkit-scrollbar {
-        width: 10px;
-    }
-    ::-webkit-scrollbar-track {
-        background: rgba(15, 23, 42, 0.6);
-        border-radius: 12px;
-    }
-    ::-webkit-scrollbar-thumb {
-        background: linear-gradient(135deg, #3b82f6 0%, #8b5cf6 100%);
-        border-radius: 12px;
-        border: 2px solid rgba(15, 23, 42, 0.3);
-    }
-    ::-webkit-scrollbar-thumb:hover {
-        background: linear-gradient(135deg, #2563eb 0%, #7c3aed 100%);
-    }
-    /* File uploader styling */
-    .stFileUploader>div>div>div {
-        background: rgba(15, 23, 42, 0.9);
-        border: 3px dashed rgba(59, 130, 246, 0.4);
-        border-radius: 20px;
-        transition: all 0.4s ease;
-        backdrop-filter: blur(15px);
-        position: relative;
-        overflow: hidden;
-    }
-    .stFileUploader>div>div>div::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        bottom: 0;
-        background: linear-gradient(45deg, rgba(59, 130, 246, 0.05) 0%, rgba(139, 92, 246, 0.05) 100%);
-        opacity: 0;
-        transition: opacity 0.3s ease;
-    }
-    .stFileUploader>div>div>div:hover {
-        border-color: #3b82f6;
-        background: rgba(15, 23, 42, 0.95);
-        transform: scale(1.02);
-        box-shadow: 0 8px 25px rgba(59, 130, 246, 0.2);
-    }
-    .stFileUploader>div>div>div:hover::before {
-        opacity: 1;
-    }
-    
-    /* FINAL NUCLEAR OPTION FOR TEXT INPUTS */
-    input[type="text"], textarea, select,
-    .stTextInput input[type="text"],
-    .stTextArea textarea,
-    .stSelectbox select,
-    div[data-testid="textInput"] input,
-    div[data-testid="textArea"] textarea,
-    div[data-testid="selectbox"] select,
-    div[data-baseweb="select"] > div,
-    ul[role="listbox"] li,
-    div[data-baseweb="popover"] li {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-        -webkit-text-fill-color: #f1f5f9 !important;
-        caret-color: #f1f5f9 !important;
-    }
-    
-    /* AGGRESSIVE DROPDOWN TARGETING */
-    [data-baseweb="popover"] {
-        background: rgba(15, 23, 42, 0.95) !important;
-    }
-    [data-baseweb="popover"] * {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-    }
-    [role="listbox"] {
-        background: rgba(15, 23, 42, 0.95) !important;
-    }
-    [role="listbox"] * {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-    }
-    [role="option"] {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-    }
-    [role="option"]:hover {
-        color: #ffffff !important;
-        background: rgba(59, 130, 246, 0.3) !important;
-    }
-    
-    /* Override any Streamlit emotion cache classes */
-    [class*="st-emotion-cache"] input,
-    [class*="st-emotion-cache"] textarea,
-    [class*="st-emotion-cache"] select,
-    [class*="st-emotion-cache"] div[data-baseweb="select"],
-    [class*="st-emotion-cache"] ul[role="listbox"],
-    [class*="st-emotion-cache"] li[role="option"] {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-        -webkit-text-fill-color: #f1f5f9 !important;
-    }
-    
-    /* SPECIFIC FIXES FOR SELECTBOX DROPDOWN TEXT */
-    .stSelectbox [data-baseweb="select"] {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-        cursor: pointer !important;
-        caret-color: transparent !important;
-        outline: none !important;
-        box-shadow: none !important;
-    }
-    
-    .stSelectbox [data-baseweb="select"] span {
-        color: #f1f5f9 !important;
-        -webkit-text-fill-color: #f1f5f9 !important;
-        cursor: pointer !important;
-        caret-color: transparent !important;
-        outline: none !important;
-        box-shadow: none !important;
-    }
-    
-    .stSelectbox [data-baseweb="select"] > div > div {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-        cursor: pointer !important;
-        caret-color: transparent !important;
-        outline: none !important;
-        box-shadow: none !important;
-    }
-    
-    /* DROPDOWN MENU WHEN OPENED */
-    [data-baseweb="popover"] {
-        background: rgba(15, 23, 42, 0.98) !important;
-        border: 2px solid rgba(59, 130, 246, 0.4) !important;
-        border-radius: 12px !important;
-        backdrop-filter: blur(20px) !important;
-        box-shadow: 0 12px 40px rgba(0, 0, 0, 0.6) !important;
-    }
-    
-    [data-baseweb="popover"] ul {
-        background: transparent !important;
-        padding: 8px !important;
-    }
-    
-    [data-baseweb="popover"] li {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.7) !important;
-        border-radius: 8px !important;
-        margin: 2px 0 !important;
-        padding: 12px 16px !important;
-        font-family: 'Inter', sans-serif !important;
-        font-weight: 500 !important;
-        transition: all 0.2s ease !important;
-        -webkit-text-fill-color: #f1f5f9 !important;
-    }
-    
-    [data-baseweb="popover"] li:hover {
-        color: #ffffff !important;
-        background: rgba(59, 130, 246, 0.4) !important;
-        transform: translateX(4px) !important;
-        -webkit-text-fill-color: #ffffff !important;
-    }
-    
-    [data-baseweb="popover"] li[aria-selected="true"] {
-        color: #ffffff !important;
-        background: rgba(59, 130, 246, 0.6) !important;
-        font-weight: 600 !important;
-        -webkit-text-fill-color: #ffffff !important;
-    }
-    
-    /* ADDITIONAL SELECTBOX TARGETING */
-    .stSelectbox div[role="button"] {
-        color: #f1f5f9 !important;
-        background: rgba(15, 23, 42, 0.9) !important;
-        -webkit-text-fill-color: #f1f5f9 !important;
-        cursor: pointer !important;
-        caret-color: transparent !important;
-        outline: none !important;
-        box-shadow: none !important;
-    }
-    
-    .stSelectbox div[role="button"] span {
-        color: #f1f5f9 !important;
-        -webkit-text-fill-color: #f1f5f9 !important;
-        cursor: pointer !important;
-        caret-color: transparent !important;
-        outline: none !important;
-        box-shadow: none !important;
-    }
-    
-    /* FORCE ALL DROPDOWN COMPONENTS */
-    div[data-testid="stSelectbox"] * {
-        color: #f1f5f9 !important;
-        cursor: pointer !important;
-        caret-color: transparent !important;
-        outline: none !important;
-        box-shadow: none !important;
-    }
-    
-    div[data-testid="stSelectbox"] [data-baseweb="select"] * {
-        color: #f1f5f9 !important;
-        -webkit-text-fill-color: #f1f5f9 !important;
-        cursor: pointer !important;
-        caret-color: transparent !important;
-        outline: none !important;
-        box-shadow: none !important;
-    }
-    
-    /* HIDE CURSOR IN ALL SELECTBOX COMPONENTS */
-    .stSelectbox,
-    .stSelectbox *,
-    .stSelectbox [data-baseweb="select"],
-    .stSelectbox [data-baseweb="select"] *,
-    div[data-testid="stSelectbox"],
-    div[data-testid="stSelectbox"] * {
-        caret-color: transparent !important;
-        cursor: pointer !important;
-        outline: none !important;
-        box-shadow: none !important;
-    }
-    
-    /* REMOVE FOCUS OUTLINES AND SELECTION BORDERS */
-    .stSelectbox [data-baseweb="select"]:focus,
-    .stSelectbox [data-baseweb="select"]:focus-within,
-    .stSelectbox [data-baseweb="select"]:active,
-    .stSelectbox div[role="button"]:focus,
-    .stSelectbox div[role="button"]:focus-within,
-    .stSelectbox div[role="button"]:active,
-    div[data-testid="stSelectbox"] *:focus,
-    div[data-testid="stSelectbox"] *:focus-within,
-    div[data-testid="stSelectbox"] *:active {
-        outline: none !important;
-        box-shadow: none !important;
-        border: none !important;
-    }
-    
-    /* MOBILE DROPDOWN IMPROVEMENTS */
-    @media (max-width: 768px) {
-        [data-baseweb="popover"] {
-            max-height: 60vh !important;
-            overflow-y: auto !important;
-        }
-        
-        [data-baseweb="popover"] li {
-            padding: 16px 20px !important;
-            font-size: 16px !important;
-            min-height: 48px !important;
-            display: flex !important;
-            align-items: center !important;
-        }
-        
-        .stSelectbox [data-baseweb="select"] {
-            min-height: 48px !important;
-            font-size: 16px !important;
-        }
-        
-        .stSelectbox [data-baseweb="select"] > div > div {
-            min-height: 48px !important;
-            display: flex !important;
-            align-items: center !important;
-        }
-    }
-    </style>
-    """,
+    '<meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">'
+    f"<style>{load_theme_css()}</style>",
     unsafe_allow_html=True
 )
 
 # --- Logo/Hero Section --- #
+profiler.phase("hero")
 st.markdown(
     """
     <div class="hero-container" style="display: flex; align-items: center; gap: 2em; margin-bottom: 1.5em; padding: 2rem; background: linear-gradient(135deg, rgba(59, 130, 246, 0.15) 0%, rgba(139, 92, 246, 0.15) 50%, rgba(6, 182, 212, 0.15) 100%); border-radius: 24px; border: 2px solid rgba(59, 130, 246, 0.3); backdrop-filter: blur(20px); box-shadow: 0 16px 40px rgba(0, 0, 0, 0.4), inset 0 1px 0 rgba(255, 255, 255, 0.1); position: relative; overflow: hidden;">
@@ -873,309 +232,410 @@ st.markdown(
             <div class="hero-subtitle" style="color: #ffffff; font-size: 1.3em; font-weight: 600; font-family: 'Inter', sans-serif; text-shadow: 0 2px 15px rgba(255, 255, 255, 0.6); opacity: 0.95;">✨ Revolutionary AI-powered essay analysis and intelligent feedback ✨</div>
         </div>
     </div>
-    <style>
-    @keyframes pulse {
-        0%, 100% { transform: scale(1); }
-        50% { transform: scale(1.05); }
-    }
-    
-    /* MOBILE RESPONSIVE STYLES */
-    @media (max-width: 768px) {
-        .hero-container {
-            flex-direction: column !important;
-            text-align: center !important;
-            gap: 1.5em !important;
-            padding: 1.5rem 1rem !important;
-            margin-bottom: 1rem !important;
-        }
-        
-        .hero-icon {
-            padding: 1rem !important;
-        }
-        
-        .hero-icon img {
-            width: 56px !important;
-            height: 56px !important;
-        }
-        
-        .hero-title {
-            font-size: 2em !important;
-            letter-spacing: -1px !important;
-            line-height: 1.1 !important;
-            margin-bottom: 0.5em !important;
-        }
-        
-        .hero-subtitle {
-            font-size: 1em !important;
-            line-height: 1.4 !important;
-        }
-    }
-    
-    @media (max-width: 480px) {
-        .hero-title {
-            font-size: 1.6em !important;
-            letter-spacing: 0px !important;
-        }
-        
-        .hero-subtitle {
-            font-size: 0.9em !important;
-        }
-        
-        .hero-container {
-            padding: 1rem 0.75rem !important;
-            border-radius: 16px !important;
-        }
-    }
-    </style>
     """,
     unsafe_allow_html=True
 )
 
-# Force deployment refresh - text visibility update
-st.markdown("""
-<script>
-document.addEventListener('DOMContentLoaded', function() {
-    // Inject aggressive CSS for dropdowns
-    const style = document.createElement('style');
-    style.textContent = `
-        [data-baseweb="popover"] ul,
-        [data-baseweb="popover"] li,
-        [role="listbox"],
-        [role="listbox"] li,
-        [role="option"] {
-            color: #f1f5f9 !important;
-            background: rgba(15, 23, 42, 0.95) !important;
-            -webkit-text-fill-color: #f1f5f9 !important;
-        }
-        [role="option"]:hover {
-            color: #ffffff !important;
-            background: rgba(59, 130, 246, 0.3) !important;
-        }
-    `;
-    document.head.appendChild(style);
-    
-    // Force text color on all inputs after page loads
-    setTimeout(function() {
-        const inputs = document.querySelectorAll('input, textarea, select, div[data-baseweb="select"], ul[role="listbox"] li, div[data-baseweb="popover"] li, [role="option"]');
-        inputs.forEach(input => {
-            input.style.setProperty('color', '#f1f5f9', 'important');
-            input.style.setProperty('background-color', 'rgba(15, 23, 42, 0.9)', 'important');
-            input.style.setProperty('-webkit-text-fill-color', '#f1f5f9', 'important');
-        });
-    }, 100);
-    
-    // Monitor for new dropdown elements
-    const observer = new MutationObserver(function(mutations) {
-        mutations.forEach(function(mutation) {
-            mutation.addedNodes.forEach(function(node) {
-                if (node.nodeType === 1) { // Element node
-                    const dropdownElements = node.querySelectorAll('[data-baseweb="popover"], [role="listbox"], [role="option"]');
-                    dropdownElements.forEach(element => {
-                        element.style.setProperty('color', '#f1f5f9', 'important');
-                        element.style.setProperty('background', 'rgba(15, 23, 42, 0.95)', 'important');
-                        element.style.setProperty('-webkit-text-fill-color', '#f1f5f9', 'important');
-                    });
-                    
-                    // Also check if the node itself is a dropdown element
-                    if (node.matches && (node.matches('[data-baseweb="popover"]') || node.matches('[role="listbox"]') || node.matches('[role="option"]'))) {
-                        node.style.setProperty('color', '#f1f5f9', 'important');
-                        node.style.setProperty('background', 'rgba(15, 23, 42, 0.95)', 'important');
-                        node.style.setProperty('-webkit-text-fill-color', '#f1f5f9', 'important');
-                    }
-                }
-            });
-        });
-    });
-    
-    observer.observe(document.body, { childList: true, subtree: true });
-});
-</script>
-<style>
-/* EMERGENCY TEXT FIX - HIGHEST PRIORITY */
-input, textarea, select, div[data-baseweb="select"] > div, ul[role="listbox"] li, div[data-baseweb="popover"] li, [role="option"] {
-    color: #f1f5f9 !important;
-    background-color: rgba(15, 23, 42, 0.9) !important;
-    -webkit-text-fill-color: #f1f5f9 !important;
-}
+profiler.phase("controls")
+upload_mode = st.radio("🚀 Choose input mode:", ("📝 Single Essay", "📊 Batch Upload (CSV/ZIP)", "🗂️ Grading History"))
+level = st.selectbox("🎯 Select Evaluation Level:", ("🎓 High School", "🎓 College", "💼 Professional"))
+assignment_id = st.text_input("📌 Assignment ID (optional):", key="assignment_id")
 
-/* EMERGENCY DROPDOWN FIX - SAME PRIORITY */
-[class*="st-emotion-cache"] ul[role="listbox"],
-[class*="st-emotion-cache"] ul[role="listbox"] li,
-[class*="st-emotion-cache"] div[data-baseweb="popover"],
-[class*="st-emotion-cache"] div[data-baseweb="popover"] li,
-[class*="st-emotion-cache"] [role="option"],
-ul[role="listbox"], 
-ul[role="listbox"] li,
-div[data-baseweb="popover"],
-div[data-baseweb="popover"] li,
-div[data-baseweb="popover"] ul,
-div[data-baseweb="popover"] ul li {
-    color: #f1f5f9 !important;
-    background-color: rgba(15, 23, 42, 0.9) !important;
-    -webkit-text-fill-color: #f1f5f9 !important;
-}
-</style>
-""", unsafe_allow_html=True)
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+limiter = get_limiter()
 
-upload_mode = st.radio("🚀 Choose input mode:", ("📝 Single Essay", "📊 Batch Upload (CSV)"))
-level = st.selectbox("🎯 Select Evaluation Level:", ("🎓 High School", "🎓 College", "💼 Professional"))
+with st.expander("⚙️ Advanced Settings"):
+    use_hedging = st.checkbox(
+        "⚡ Hedge slow requests",
+        help="If a request is slower than the observed p90 latency, send a duplicate and keep whichever answers first. Capped to a small share of extra requests, and only sent when a grading slot is free."
+    )
+    if use_hedging:
+        hedge_stats = get_hedger().stats()
+        st.caption(
+            f"Hedged {hedge_stats['hedged']} of {hedge_stats['requests']} requests "
+            f"({hedge_stats['extra_spend']:.0%} extra spend, cap {get_hedger().budget:.0%}) · "
+            f"duplicate won {hedge_stats['hedge_wins']} times"
+            + (f" · {hedge_stats['skipped_busy']} skipped, no free slot" if hedge_stats["skipped_busy"] else "")
+        )
+    fan_out_criteria = st.checkbox(
+        "🏎️ Low-latency single essays",
+        help="Grade the five rubric criteria as parallel requests and merge them into the usual report. Finishes in about the time of the slowest criterion; each criterion uses its own grading slot."
+    )
+    consistency_samples = st.select_slider(
+        "🎲 Consistency samples",
+        options=[1, 3, 5],
+        help="Ask for several gradings of each essay in a single request (the prompt is only paid for once), report the median score and spread, and flag essays whose scores vary widely. Not used by low-latency mode."
+    )
+    export_format = st.selectbox(
+        "🧱 Columnar batch export",
+        [PARQUET, ARROW],
+        format_func={PARQUET: "Parquet", ARROW: "Arrow IPC (Feather v2)"}.get,
+        help="Typed per-essay results (scores, tokens, timestamps, full essay and feedback) written as batch rows finish."
+    )
+    reuse_results = st.checkbox(
+        "♻️ Reuse results for identical essays",
+        help="Answer an essay that was already graded the same way (same text, level and mode) from grading history instead of sending a new request. Shared with the grading API."
+    )
+    revise_resubmissions = st.checkbox(
+        "🔄 Revision mode for resubmissions",
+        help="When a student resubmits for the same assignment (Student ID and Assignment ID set), send only the paragraphs that changed "
+             "plus the feedback on their latest graded draft, and get an updated score with feedback on the changes. Far fewer tokens and "
+             f"faster than a full regrade; without an earlier draft, or when more than {REVISION_MAX_CHANGED:.0%} of the paragraphs changed, "
+             "the essay is graded in full."
+    )
+    if CASSETTE_MODE != PASSTHROUGH:
+        cassette_stats = get_cassette().stats()
+        st.caption(
+            f"📼 Cassette {cassette_stats['mode']} mode ({get_cassette().path}): "
+            f"{cassette_stats['recorded']} recorded · {cassette_stats['hits']} replayed · {cassette_stats['misses']} misses"
+        )
+    lane_latency = limiter.lane_latency()
+    st.caption("🚦 Request latency by lane: " + " · ".join(
+        f"{lane} p50 {stats['p50']:.1f}s / p95 {stats['p95']:.1f}s (queue p95 {stats['wait_p95']:.1f}s, n={stats['count']})"
+        if stats["count"] else f"{lane}: no requests yet"
+        for lane, stats in lane_latency.items()
+    ))
+    failover = failover_stats()
+    st.caption("🔌 Model endpoints: " + " · ".join(
+        f"{name} 🔴 failing fast, retrying in {stats['retry_in']:.0f}s" if stats["state"] == OPEN
+        else f"{name} 🟡 probing" if stats["state"] == HALF_OPEN
+        else f"{name} 🟢 {stats['error_rate']:.0%} errors" + (f", p50 {stats['p50']:.1f}s" if stats["p50"] is not None else "")
+        for name, stats in failover["endpoints"].items()
+    ) + (f" · {failover['failovers']} requests served by the fallback" if failover["failovers"] else ""))
+hedger = get_hedger() if use_hedging else None
 
 grades = []
 
 if upload_mode == "📝 Single Essay":
-    # Custom styled text area with forced colors
-    st.markdown("""
-    <style>
-    .custom-textarea {
-        width: 100%;
-        height: 300px;
-        background: rgba(15, 23, 42, 0.9) !important;
-        color: #f1f5f9 !important;
-        border: 2px solid rgba(59, 130, 246, 0.2);
-        border-radius: 16px;
-        padding: 1rem;
-        font-family: 'Inter', sans-serif;
-        font-size: 1.05em;
-        resize: vertical;
-        outline: none;
-        -webkit-text-fill-color: #f1f5f9 !important;
-    }
-    .custom-textarea:focus {
-        border-color: #3b82f6 !important;
-        box-shadow: 0 0 0 4px rgba(59, 130, 246, 0.15);
-    }
-    .custom-textarea::placeholder {
-        color: rgba(241, 245, 249, 0.6) !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-    
+    student_id = st.text_input("🧑‍🎓 Student ID (optional):", key="student_id")
     essay_input = st.text_area("✍️ Paste Essay Here:", height=300, placeholder="Paste your essay text here for AI analysis...", key="essay_input")
     if st.button("🤖 Grade Essay with AI"):
-        # Add continuous color fixing
-        st.markdown("""
-        <script>
-        // Continuous text color fix - AGGRESSIVE VERSION
-        function fixTextColors() {
-            // Target all possible dropdown selectors
-            const selectors = [
-                'input', 'textarea', 'select',
-                'div[data-baseweb="select"]',
-                'div[data-baseweb="select"] > div',
-                'div[data-baseweb="select"] span',
-                'div[data-baseweb="select"] *',
-                'div[role="button"]',
-                'div[role="button"] span',
-                'ul[role="listbox"]',
-                'ul[role="listbox"] li',
-                'li[role="option"]',
-                '[role="option"]',
-                'div[data-baseweb="popover"]',
-                'div[data-baseweb="popover"] ul',
-                'div[data-baseweb="popover"] li',
-                'div[data-baseweb="popover"] *',
-                '.stSelectbox *',
-                'div[data-testid="stSelectbox"] *'
-            ];
-            
-            selectors.forEach(selector => {
-                const elements = document.querySelectorAll(selector);
-                elements.forEach(element => {
-                    element.style.setProperty('color', '#f1f5f9', 'important');
-                    element.style.setProperty('background-color', 'rgba(15, 23, 42, 0.9)', 'important');
-                    element.style.setProperty('-webkit-text-fill-color', '#f1f5f9', 'important');
-                    element.style.setProperty('background', 'rgba(15, 23, 42, 0.9)', 'important');
-                });
-            });
-            
-            // Also inject CSS directly
-            if (!document.getElementById('aggressive-dropdown-styles')) {
-                const style = document.createElement('style');
-                style.id = 'aggressive-dropdown-styles';
-                style.textContent = `
-                    /* MEGA AGGRESSIVE DROPDOWN FIXES */
-                    [data-baseweb="popover"] * {
-                        color: #f1f5f9 !important;
-                        background: rgba(15, 23, 42, 0.95) !important;
-                        -webkit-text-fill-color: #f1f5f9 !important;
-                    }
-                    [role="listbox"] * {
-                        color: #f1f5f9 !important;
-                        background: rgba(15, 23, 42, 0.95) !important;
-                        -webkit-text-fill-color: #f1f5f9 !important;
-                    }
-                    [role="option"] {
-                        color: #f1f5f9 !important;
-                        background: rgba(15, 23, 42, 0.9) !important;
-                        -webkit-text-fill-color: #f1f5f9 !important;
-                    }
-                    .stSelectbox [data-baseweb="select"] {
-                        color: #f1f5f9 !important;
-                        background: rgba(15, 23, 42, 0.9) !important;
-                    }
-                    .stSelectbox [data-baseweb="select"] * {
-                        color: #f1f5f9 !important;
-                        -webkit-text-fill-color: #f1f5f9 !important;
-                    }
-                    div[data-testid="stSelectbox"] * {
-                        color: #f1f5f9 !important;
-                        -webkit-text-fill-color: #f1f5f9 !important;
-                    }
-                    div[role="button"] {
-                        color: #f1f5f9 !important;
-                        -webkit-text-fill-color: #f1f5f9 !important;
-                    }
-                    div[role="button"] span {
-                        color: #f1f5f9 !important;
-                        -webkit-text-fill-color: #f1f5f9 !important;
-                    }
-                `;
-                document.head.appendChild(style);
-            }
-        }
-        
-        // Run immediately and every 200ms for faster response
-        fixTextColors();
-        setInterval(fixTextColors, 200);
-        
-        // Fix colors on any interaction
-        ['click', 'mousedown', 'focus', 'mouseover'].forEach(event => {
-            document.addEventListener(event, function() {
-                setTimeout(fixTextColors, 50);
-                setTimeout(fixTextColors, 200);
-            });
-        });
-        </script>
-        """, unsafe_allow_html=True)
-        
+        profiler.phase("grading")
         if essay_input.strip():
-            with st.spinner("🔍 AI is analyzing your essay..."):
-                output = grade_essay_with_feedback(essay_input, level.split(' ', 1)[1])  # Remove emoji from level
-            grades.append([essay_input[:30] + "...", output])
-            st.subheader("📋 AI Analysis Results")
-            st.markdown(output)
+            for note in describe_similarity(get_similarity_index().check_and_add(essay_input, student_id, assignment_id), student_id):
+                st.warning(note)
+            queue_status = st.empty()
+            try:
+                with st.spinner("🔍 AI is analyzing your essay..."):
+                    if fan_out_criteria:
+                        # Each criterion request (or the revision request) takes its own interactive slot
+                        interactive_slot = partial(limiter.slot, session_id, INTERACTIVE)
+                        output = grade_and_record(
+                            essay_input, level.split(' ', 1)[1], get_history_store(),  # Remove emoji from level
+                            student_id=student_id, assignment_id=assignment_id, hedger=hedger,
+                            grade_fn=partial(grade_essay_by_criteria, slot=interactive_slot),
+                            reuse=reuse_results, revision=revise_resubmissions, slot=interactive_slot
+                        )
+                    else:
+                        # Interactive lane: jumps ahead of queued batch rows for the next free slot
+                        with limiter.slot(session_id, INTERACTIVE, on_wait=lambda position: queue_status.caption(f"🚦 Server is busy: you're #{position} in line for a grading slot")):
+                            queue_status.empty()
+                            output = grade_and_record(
+                                essay_input, level.split(' ', 1)[1], get_history_store(),  # Remove emoji from level
+                                student_id=student_id, assignment_id=assignment_id, hedger=hedger,
+                                grade_fn=partial(grade_essay_with_feedback, samples=consistency_samples),
+                                mode=result_mode(FULL, consistency_samples), reuse=reuse_results, revision=revise_resubmissions
+                            )
+            except GradingError as e:
+                grades.append([student_id, essay_input[:30] + "...", FAILED, "", str(e)])
+                st.error(f"💥 Error grading essay: {e}")
+            else:
+                grades.append([student_id, essay_input[:30] + "...", GRADED, output.text, ""])
+                if output.consistency and output.consistency["flagged"]:
+                    st.warning(
+                        f"🎲 Scores varied by {output.consistency['spread']:g} points across {output.consistency['samples']} samples; "
+                        f"the median is {output.consistency['median']:g}/100. Worth a manual look."
+                    )
+                if output.revision is not None:
+                    drafted = time.strftime("%Y-%m-%d %H:%M", time.localtime(output.revision["previous_graded_at"]))
+                    earlier = f", then {output.revision['previous_score']:g}/100" if output.revision["previous_score"] is not None else ""
+                    if output.revision["changed"]:
+                        st.caption(
+                            f"🔄 Graded as a revision of the draft from {drafted}{earlier}: {output.revision['changed']} of "
+                            f"{output.revision['paragraphs']} paragraphs changed, and only those were sent "
+                            f"({output.total_tokens:,} tokens)."
+                        )
+                    else:
+                        st.caption(f"🔄 No paragraphs changed since the draft graded {drafted}{earlier}; showing its feedback (no new request).")
+                elif output.cached:
+                    st.caption("♻️ Reused the feedback from an identical essay in grading history (no new request).")
+                elif output.fallback:
+                    st.caption(f"🔀 {GRADING_MODEL} is degraded, so this essay was graded by the fallback {output.fallback} ({output.model}).")
+                st.subheader("📋 AI Analysis Results")
+                st.markdown(output.text)
         else:
             st.warning("⚠️ Please enter an essay before grading.")
 
-elif upload_mode == "📊 Batch Upload (CSV)":
-    uploaded_csv = st.file_uploader("📁 Upload a CSV with a column named 'Essay'", type="csv")
-    if uploaded_csv:
-        try:
-            df = pd.read_csv(uploaded_csv)
-            if "Essay" in df.columns:
-                st.info(f"📊 Found {len(df)} essays to process!")
-                progress_bar = st.progress(0)
-                for idx, row in df.iterrows():
-                    feedback = grade_essay_with_feedback(row["Essay"], level.split(' ', 1)[1])  # Remove emoji from level
-                    grades.append([row["Essay"][:30] + "...", feedback])
-                    progress_bar.progress((idx + 1) / len(df))
-                st.success("✅ Batch grading completed successfully!")
+elif upload_mode == "📊 Batch Upload (CSV/ZIP)":
+    uploaded_file = st.file_uploader(
+        "📁 Upload a CSV with a column named 'Essay' (optional: 'Student ID', 'Assignment ID'), or an LMS export ZIP of .txt/.md/.docx submissions",
+        type=["csv", "zip"]
+    )
+    if uploaded_file:
+        profiler.phase("upload parsing")
+        df = None
+        if uploaded_file.name.lower().endswith(".zip"):
+            try:
+                df, skipped_files = load_zip_submissions(uploaded_file.file_id, uploaded_file)
+            except IngestError as e:
+                st.error(f"💥 Error processing ZIP: {e}")
+            else:
+                if skipped_files:
+                    with st.expander(f"⏭️ Skipped {len(skipped_files)} files"):
+                        for filename, reason in skipped_files:
+                            st.markdown(f"**{filename}:** {reason}")
+        else:
+            try:
+                df = pd.read_csv(uploaded_file)
+            except Exception as e:
+                st.error(f"💥 Error processing CSV: {e}")
+        if df is not None and "Essay" not in df.columns:
+            st.error("❌ CSV must contain a column labeled 'Essay'.")
+        elif df is not None and df.empty:
+            st.error("❌ No essays found in the upload.")
+        elif df is not None:
+            grade_level = level.split(' ', 1)[1]  # Remove emoji from level
+            batch_key = (uploaded_file.name, uploaded_file.size, grade_level)
+            # New upload: validate and estimate locally; nothing is billed until the user confirms
+            if st.session_state.get("batch_key") != batch_key:
+                job = st.session_state.get("batch_job")
+                if job is not None and job.running:
+                    job.cancel()
+                if st.session_state.get("result_writer") is not None:
+                    st.session_state.result_writer.discard()
+                    st.session_state.result_writer = None
+                profiler.phase("preflight")
+                preflight = run_preflight(
+                    df["Essay"],
+                    grade_level,
+                    df["Student ID"] if "Student ID" in df.columns else None,
+                    df["Assignment ID"] if "Assignment ID" in df.columns else [assignment_id] * len(df),
+                    concurrency=limiter.capacity - limiter.reserved
+                )
+                profiler.phase("similarity check")
+                # Flag resubmissions and copying against every essay seen so far, including this upload
+                flags = get_similarity_index().check_and_add_many([(essay, sid, aid) for _, essay, sid, aid in preflight.rows])
+                st.session_state.similarity_flags = {row[0]: matches for row, matches in zip(preflight.rows, flags) if matches}
+                st.session_state.preflight = preflight
+                st.session_state.batch_job = None
+                st.session_state.batch_key = batch_key
+            profiler.phase("batch status")
+            preflight = st.session_state.preflight
+            job = st.session_state.batch_job
+            student_by_row = {row_id: sid for row_id, _, sid, _ in preflight.rows}
+
+            st.info(f"📊 Found {len(df)} essays to process!")
+            if preflight.skipped:
+                with st.expander(f"🧹 {len(preflight.skipped)} rows can't be graded and will be skipped"):
+                    for row_id, reason in preflight.skipped:
+                        st.markdown(f"**Row {row_id + 1}:** {reason}")
+            similarity_flags = st.session_state.get("similarity_flags", {})
+            if similarity_flags:
+                with st.expander(f"🔍 Similarity check: {len(similarity_flags)} essays flagged"):
+                    for row_id, matches in similarity_flags.items():
+                        for note in describe_similarity(matches, student_by_row[row_id]):
+                            st.markdown(f"**Row {row_id + 1}** ({student_by_row[row_id] or 'no ID'}): {note}")
+
+            history = get_history_store()
+
+            def full_feedback(row):
+                return grade_and_record(row.essay, grade_level, history, row.student_id, row.assignment_id, hedger=hedger,
+                                        grade_fn=partial(grade_essay_with_feedback, samples=consistency_samples),
+                                        mode=result_mode(FULL, consistency_samples), reuse=reuse_results,
+                                        revision=revise_resubmissions)
+
+            def scores_only(row):
+                return grade_and_record(row.essay, grade_level, history, row.student_id, row.assignment_id, hedger=hedger,
+                                        grade_fn=partial(grade_essay_scores_only, samples=consistency_samples),
+                                        mode=result_mode(SCORES, consistency_samples), reuse=reuse_results)
+
+            if job is None:
+                triage = st.checkbox(
+                    "⚡ Scores only (fast triage)",
+                    help="Return just the scores, letter grade and a one-line rationale. Much faster and cheaper; request full feedback afterwards for the essays you pick."
+                )
+                # n samples multiply the completion tokens but not the time; the prompt is still sent once per essay
+                if triage:
+                    estimate = project(preflight, SCORES_MAX_TOKENS, build_scores_prompt(grade_level), samples=consistency_samples)
+                else:
+                    estimate = project(preflight, EXPECTED_COMPLETION_TOKENS, samples=consistency_samples)
+                minutes = estimate.seconds / 60
+                st.markdown(
+                    f"**🧮 Pre-flight estimate for {len(estimate.rows)} essays:** "
+                    f"~{estimate.prompt_tokens:,} prompt + ~{estimate.completion_tokens:,} completion tokens · "
+                    f"**~${estimate.cost:,.2f}** · ~{minutes:,.1f} min (limited by {estimate.bottleneck})"
+                )
+                if estimate.rows and st.button(f"🚀 Start Grading {len(estimate.rows)} Essays (~${estimate.cost:,.2f})"):
+                    result_writer = ResultWriter(grade_level, export_format)
+                    job = BatchJob(
+                        preflight.rows,
+                        scores_only if triage else full_feedback,
+                        workers=limiter.capacity,
+                        limiter=limiter,
+                        session_id=session_id,
+                        on_result=result_writer.write,
+                        costs=estimate.row_seconds
+                    )
+                    st.session_state.result_writer = result_writer
+                    st.session_state.batch_job = job
+                    # The job keeps the essays compressed from here on; don't hold a second, raw copy in the session
+                    st.session_state.preflight = replace(preflight, rows=[(row_id, "", sid, aid) for row_id, _, sid, aid in preflight.rows])
+                    st.session_state.batch_triage = triage
+                    st.session_state.full_feedback_rows = set()
+                    job.start()
+                    st.rerun()
             else:
-                st.error("❌ CSV must contain a column labeled 'Essay'.")
-        except Exception as e:
-            st.error(f"💥 Error processing CSV: {e}")
+                counts = job.counts()
+                st.progress(job.progress())
+                if job.running:
+                    remaining = counts["pending"] + counts["running"]
+                    st.caption(f"⏳ {counts[GRADED]} graded · {counts[FAILED]} failed · {remaining} remaining")
+                    load = limiter.stats(session_id, BULK)
+                    queue_note = f" · your next essay is #{load['position']} in line" if load["position"] else ""
+                    st.caption(
+                        f"🚦 Server load: {load['in_flight']}/{load['capacity']} requests in flight, "
+                        f"{load['waiting_sessions']} sessions waiting{queue_note}"
+                    )
+                    if st.button("🛑 Cancel Batch"):
+                        job.cancel()
+                        st.rerun()
+                    # Poll the background job; a Cancel click interrupts this sleep
+                    profiler.phase("poll wait")
+                    time.sleep(0.5)
+                    st.rerun()
+
+                # Text stays compressed in the job; only the export below decompresses it
+                results = job.results(text=False)
+                if job.cancelled:
+                    st.warning("🛑 Batch cancelled. Unfinished essays were moved to the failed queue.")
+                if counts[FAILED]:
+                    st.warning(f"⚠️ {counts[FAILED]} essays failed and are marked as failed in the export.")
+                    with st.expander("❌ Failed rows"):
+                        for row in results:
+                            if row.status == FAILED:
+                                st.markdown(f"**Row {row.row_id + 1}:** {row.error}")
+                    if st.button(f"🔁 Retry {counts[FAILED]} Failed Essays"):
+                        job.retry_failed()
+                        st.rerun()
+                else:
+                    st.success("✅ Batch grading completed successfully!")
+                makespan = job.makespan()
+                if makespan and makespan["rows"] > makespan["slots"]:
+                    saved = makespan["in_order"] - makespan["longest_first"]
+                    st.caption(
+                        f"⏱️ Finished {makespan['rows']} essays in {makespan['makespan']:.1f}s with longest-first dispatch across {makespan['slots']} slots. "
+                        f"Dispatching in upload order would have taken ~{makespan['in_order']:.1f}s; "
+                        f"scheduling saved ~{saved:.1f}s ({saved / max(makespan['in_order'], 1e-9):.0%})."
+                    )
+                stored = job.text_bytes()
+                st.caption(
+                    f"🗜️ Essays and feedback held {stored['codec']}-compressed in this session: "
+                    f"{stored['raw'] / 1e6:,.1f} MB of text in {stored['stored'] / 1e6:,.2f} MB"
+                )
+                fallback_rows = [row for row in results if row.fallback]
+                if fallback_rows:
+                    st.caption(
+                        f"🔀 {len(fallback_rows)} essays were graded by a fallback while {GRADING_MODEL} was degraded "
+                        f"({', '.join(sorted({row.fallback for row in fallback_rows}))}); the columnar export's fallback column and the grading history record the endpoint that answered."
+                    )
+                unstable = [row for row in results if row.score_spread is not None and row.score_spread >= CONSISTENCY_SPREAD_THRESHOLD]
+                if unstable:
+                    with st.expander(f"🎲 {len(unstable)} essays with unstable scores (spread ≥ {CONSISTENCY_SPREAD_THRESHOLD:g} points)"):
+                        for row in unstable:
+                            st.markdown(f"**Row {row.row_id + 1}** ({row.student_id or 'no ID'}): scores spread {row.score_spread:g} points")
+                if st.session_state.get("batch_triage"):
+                    # Scores-only pass: let the teacher pick which essays get the full write-up
+                    triaged = {}
+                    for row in results:
+                        if row.status == GRADED and row.row_id not in st.session_state.full_feedback_rows:
+                            scores = row.scores
+                            triaged[row.row_id] = (scores["overall"] if scores["overall"] is not None else float("inf"), scores["letter_grade"], row.student_id)
+                    if triaged:
+                        chosen = st.multiselect(
+                            f"📝 {len(triaged)} essays have scores only. Pick essays for full feedback (lowest scores first):",
+                            sorted(triaged, key=lambda row_id: triaged[row_id][0]),
+                            format_func=lambda row_id: (
+                                f"Row {row_id + 1} · {triaged[row_id][2] or 'no ID'} · "
+                                + (f"{triaged[row_id][0]:g}/100 {triaged[row_id][1] or ''}" if triaged[row_id][0] != float("inf") else "no score")
+                            )
+                        )
+                        if chosen and st.button(f"📝 Get Full Feedback for {len(chosen)} Essays"):
+                            st.session_state.full_feedback_rows.update(chosen)
+                            job.start(chosen, grade_fn=full_feedback)
+                            st.rerun()
+                results_browser(job)
+                # Built only on request: the CSV decompresses every feedback, and Streamlit holds each
+                # download's bytes in memory for as long as its button is on the page
+                if st.button("📦 Prepare Downloads", help="Build the CSV and columnar files for this batch. They're dropped again on the next interaction."):
+                    # Keep every uploaded row in the export, in upload order, including skipped ones
+                    export_rows = {
+                        row.row_id: [row.student_id, job.essay(row.row_id)[:30] + "...", row.status, job.feedback(row.row_id), row.error]
+                        for row in results
+                    }
+                    essays = df["Essay"].tolist()
+                    raw_student_ids = df["Student ID"].tolist() if "Student ID" in df.columns else [""] * len(df)
+                    for row_id, reason in preflight.skipped:
+                        export_rows[row_id] = [clean_id(raw_student_ids[row_id]), str(essays[row_id])[:30], SKIPPED, "", reason]
+                    grades.extend(export_rows[row_id] for row_id in sorted(export_rows))
+                    result_writer = st.session_state.get("result_writer")
+                    if result_writer is not None:
+                        # Finalize the streamed file; a later retry reopens and appends to it
+                        with open(result_writer.close(), "rb") as columnar:
+                            st.download_button(
+                                f"🧱 Download Results as {'Parquet' if result_writer.format == PARQUET else 'Arrow IPC'}",
+                                columnar.read(),
+                                "graded_essays" + FORMATS[result_writer.format],
+                                "application/vnd.apache.parquet" if result_writer.format == PARQUET else "application/vnd.apache.arrow.file",
+                                on_click="ignore"
+                            )
+
+elif upload_mode == "🗂️ Grading History":
+    profiler.phase("history query")
+    history = get_history_store()
+    st.caption(f"🗄️ {history.count():,} graded essays on record")
+    history_query = st.text_input("🔎 Search essays and feedback:", placeholder="e.g. thesis statement, NCAA, citation")
+    history_student = st.text_input("🧑‍🎓 Filter by Student ID:", key="history_student")
+    started = time.perf_counter()
+    if history_query.strip():
+        matches = history.search(history_query, history_student, assignment_id)
+    else:
+        matches = history.lookup(history_student, assignment_id)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    st.caption(f"⚡ {len(matches)} results in {elapsed_ms:.1f} ms")
+    for match in matches:
+        graded_on = time.strftime("%Y-%m-%d %H:%M", time.localtime(match["graded_at"]))
+        score = f"{match['overall_score']:g}/100" if match["overall_score"] is not None else "no score"
+        title = f"{match['student_id'] or 'Unknown student'} · {match['assignment_id'] or 'No assignment'} · {score} · {graded_on}"
+        with st.expander(title):
+            if match.get("snippet"):
+                st.markdown(f"…{match['snippet']}…")
+            record = history.get(match["id"])
+            st.caption(f"{record['level']} · {record['model']}")
+            st.markdown(record["feedback"])
 
 # ----------- CSV Export Option ----------- #
+profiler.phase("export")
 if grades:
     csv_data = export_grades_csv(grades)
-    st.download_button("� Download Feedback as CSV", csv_data, "graded_essays.csv", "text/csv")
\ No newline at end of file
+    # No rerun on click, so a batch's other prepared download stays on the page
+    st.download_button("� Download Feedback as CSV", csv_data, "graded_essays.csv", "text/csv", on_click="ignore")
+
+# ----------- Profiler Overlay ----------- #
+if profiler.enabled:
+    profiler.phase("profiler overlay")
+    phases = profiler.breakdown()
+    run_seconds = sum(seconds for _, seconds in phases)
+    with st.sidebar.expander("⏱️ Rerun profile", expanded=True):
+        st.caption(f"This run so far: {run_seconds * 1000:,.1f} ms" + (" · cProfile on" if profile_mode == CPROFILE else ""))
+        st.dataframe(
+            pd.DataFrame(
+                [(name, seconds * 1000, seconds / max(run_seconds, 1e-9)) for name, seconds in phases],
+                columns=["Phase", "ms", "Share"]
+            ).style.format({"ms": "{:,.1f}", "Share": "{:.0%}"}),
+            hide_index=True
+        )
+        if profiler.spans:
+            st.markdown("\n".join(f"- **{name}** ({phase}): {seconds * 1000:,.2f} ms" for phase, name, seconds in profiler.spans))
+        if st.session_state.get("last_profile"):
+            st.caption(f"💾 Last profile written to `{st.session_state.last_profile}`")
+    st.session_state.last_profile = profiler.finish()
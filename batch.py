@@ -0,0 +1,354 @@
+import contextvars
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, replace
+
+from compact import CompressedTexts
+from grading import Feedback, parse_scores
+from limiter import BULK, INTERACTIVE
+
+# Row lifecycle: pending -> running -> graded | failed
+PENDING = "pending"
+RUNNING = "running"
+GRADED = "graded"
+FAILED = "failed"
+# Export-only status for rows preflight rejected before they reached a job
+SKIPPED = "skipped"
+
+
+# ----------- Scheduling ----------- #
+def simulate_makespan(durations, workers: int) -> float:
+    """Finish time of the last row when ``durations`` are dispatched in order to ``workers`` slots."""
+    slots = [0.0] * max(workers, 1)
+    for duration in durations:
+        heapq.heappush(slots, heapq.heappop(slots) + duration)
+    return max(slots)
+
+
+def longest_first(row_ids, costs: dict) -> list:
+    # LPT: long rows start while every slot is still busy, so none is left running alone at the end
+    return sorted(row_ids, key=lambda row_id: costs.get(row_id, 0.0), reverse=True)
+
+
+@dataclass
+class RowResult:
+    row_id: int
+    essay: str
+    student_id: str = ""
+    assignment_id: str = ""
+    status: str = PENDING
+    feedback: str = ""
+    error: str = ""
+    attempts: int = 0
+    started_at: float = 0.0
+    finished_at: float = 0.0
+    model: str = ""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Overall-score spread across samples in consistency mode, else None
+    score_spread: float = None
+    # parse_scores() of the feedback, kept so status views needn't decompress it
+    scores: dict = None
+    # Fallback endpoint that graded the row, if the primary model didn't (see Feedback.fallback)
+    fallback: str = ""
+
+
+class BatchJob:
+    """Grades CSV rows on a background pool so the UI can poll, cancel and retry.
+
+    ``rows`` are ``(row_id, essay[, student_id, assignment_id])`` tuples.
+    ``grade_fn`` takes a ``RowResult`` and returns a ``Feedback`` (or plain
+    feedback text), raising on failure.
+    Rows that raise, time out or are cancelled land in the failed queue and can
+    be resubmitted with ``retry_failed`` without touching graded rows.
+    ``start(row_ids, grade_fn)`` re-grades chosen rows with a different function
+    (e.g. full feedback after a scores-only pass); retries keep that choice.
+    With a ``limiter``, every row waits for a server-wide slot under ``session_id``
+    so concurrent sessions share the API key fairly, in ``lane`` (bulk unless a
+    caller is waiting on the result, e.g. a single essay via the API). ``on_result`` is called
+    with a copy of each row as it finishes (graded or failed), outside the lock.
+    With ``costs`` (estimated seconds per row_id) rows are dispatched
+    longest-first; results and exports stay in upload order.
+    Essay and feedback text are held compressed and only decompressed for
+    ``results()``, ``essay``/``feedback`` and the ``on_result`` copies; the
+    ``RowResult``s in ``rows`` carry empty text fields.
+    """
+
+    def __init__(self, rows: list, grade_fn, workers: int = 1, limiter=None, session_id: str = "", on_result=None,
+                 costs: dict = None, lane: str = BULK):
+        self._texts = CompressedTexts()
+        self._essays = {}
+        self._feedback = {}
+        self.rows = {}
+        for row in rows:
+            result = RowResult(*row)
+            self._essays[result.row_id] = self._texts.add(result.essay)
+            result.essay = ""
+            self.rows[result.row_id] = result
+        self.grade_fn = grade_fn
+        self.workers = workers
+        self.limiter = limiter
+        self.session_id = session_id
+        self.on_result = on_result
+        self.costs = costs
+        self.lane = lane
+        # Rows and start time of the latest start() call, for the makespan report
+        self._run_row_ids = []
+        self._run_started = 0.0
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._executor = None
+        # Per-row grade_fn overrides set by start(row_ids, grade_fn)
+        self._row_grade_fns = {}
+        # Dispatch count per row: a result from an older dispatch (e.g. a request still in flight
+        # when the job was cancelled and retried) is dropped instead of overwriting the current one
+        self._generations = dict.fromkeys(self.rows, 0)
+        # Rows whose grade_fn is executing right now, cancelled or not
+        self._in_flight = set()
+        # Bumped whenever a row finishes, so views can cache anything derived from results
+        self.version = 0
+
+    # ----------- Lifecycle ----------- #
+    def start(self, row_ids: list = None, grade_fn=None):
+        row_ids = list(self.rows) if row_ids is None else row_ids
+        if grade_fn is not None:
+            self._row_grade_fns.update(dict.fromkeys(row_ids, grade_fn))
+        if self.costs:
+            row_ids = longest_first(row_ids, self.costs)
+        self._cancel.clear()
+        self._run_row_ids = list(row_ids)
+        self._run_started = time.time()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="grading")
+        for row_id in row_ids:
+            with self._lock:
+                self.rows[row_id].status = PENDING
+                self.rows[row_id].error = ""
+                self.rows[row_id].started_at = 0.0
+                self._generations[row_id] += 1
+                generation = self._generations[row_id]
+            # Carry the caller's context (e.g. the active run profiler) into the worker thread
+            self._executor.submit(contextvars.copy_context().run, self._run_row, row_id, generation)
+        # Let the pool wind down once its queue drains
+        self._executor.shutdown(wait=False)
+
+    def cancel(self):
+        """Stop pending rows immediately and discard in-flight results."""
+        self._cancel.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        finished = []
+        with self._lock:
+            for row in self.rows.values():
+                if row.status in (PENDING, RUNNING):
+                    self._generations[row.row_id] += 1
+                    self._fail(row, "Cancelled before completion")
+                    finished.append(self._materialize(row))
+        self._notify(finished)
+
+    def retry_failed(self) -> int:
+        """Re-queue failed rows; a row whose cancelled request is still in flight waits for a later retry."""
+        with self._lock:
+            failed = [row_id for row_id in self._failed_ids() if row_id not in self._in_flight]
+        if failed:
+            self.start(failed)
+        return len(failed)
+
+    # ----------- Worker ----------- #
+    def _current(self, row: RowResult, generation: int) -> bool:
+        # A cancel (or a later dispatch) while the request was in flight already settled the row
+        return row.status == RUNNING and self._generations[row.row_id] == generation
+
+    def _run_row(self, row_id: int, generation: int):
+        row = self.rows[row_id]
+        with self._lock:
+            if self._cancel.is_set() or row.status != PENDING or self._generations[row_id] != generation:
+                return
+            row.status = RUNNING
+            row.attempts += 1
+            request = self._materialize(row)
+        try:
+            with self._slot():
+                with self._lock:
+                    if not self._current(row, generation):
+                        return
+                    self._in_flight.add(row_id)
+                    # Request start, after any wait for a limiter slot
+                    row.started_at = time.time()
+                try:
+                    feedback = self._row_grade_fns.get(row_id, self.grade_fn)(request)
+                finally:
+                    with self._lock:
+                        self._in_flight.discard(row_id)
+        except Exception as e:
+            with self._lock:
+                if not self._current(row, generation):
+                    return
+                self._fail(row, str(e) or type(e).__name__)
+                finished = self._materialize(row)
+            self._notify([finished])
+            return
+        text = feedback.text if isinstance(feedback, Feedback) else feedback
+        scores = parse_scores(text)
+        with self._lock:
+            if not self._current(row, generation):
+                return
+            row.status = GRADED
+            row.finished_at = time.time()
+            if isinstance(feedback, Feedback):
+                row.model = feedback.model
+                row.fallback = feedback.fallback
+                row.prompt_tokens = feedback.prompt_tokens
+                row.completion_tokens = feedback.completion_tokens
+                row.score_spread = feedback.consistency["spread"] if feedback.consistency else None
+            row.scores = scores
+            self._store_feedback(row_id, text)
+            self.version += 1
+            finished = replace(row, essay=request.essay, feedback=text)
+        self._notify([finished])
+
+    def _slot(self):
+        if self.limiter is None:
+            return nullcontext()
+        return self.limiter.slot(self.session_id, self.lane, cancelled=self._cancel)
+
+    def _notify(self, finished: list):
+        if self.on_result is None:
+            return
+        for row in finished:
+            try:
+                self.on_result(row)
+            except Exception as e:
+                # An export hiccup shouldn't fail a row that's already graded
+                logging.getLogger(__name__).warning("on_result failed for row %s: %s", row.row_id, e)
+
+    # ----------- Text storage ----------- #
+    def _store_feedback(self, row_id: int, text: str):
+        if row_id in self._feedback:
+            self._texts.replace(self._feedback[row_id], text)
+        else:
+            self._feedback[row_id] = self._texts.add(text)
+
+    def _materialize(self, row: RowResult) -> RowResult:
+        return replace(row, essay=self.essay(row.row_id), feedback=self.feedback(row.row_id))
+
+    def essay(self, row_id: int) -> str:
+        return self._texts[self._essays[row_id]]
+
+    def feedback(self, row_id: int) -> str:
+        handle = self._feedback.get(row_id)
+        return self._texts[handle] if handle is not None else ""
+
+    def text_bytes(self) -> dict:
+        """UTF-8 size of the stored essays and feedback against what the compressed store holds."""
+        return {"raw": self._texts.raw_bytes, "stored": self._texts.nbytes, "codec": self._texts.codec}
+
+    def _fail(self, row: RowResult, error: str):
+        self.version += 1
+        row.status = FAILED
+        row.error = error
+        row.finished_at = time.time()
+
+    # ----------- Status ----------- #
+    @property
+    def running(self) -> bool:
+        with self._lock:
+            return any(row.status in (PENDING, RUNNING) for row in self.rows.values())
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def counts(self) -> dict:
+        counts = {PENDING: 0, RUNNING: 0, GRADED: 0, FAILED: 0}
+        with self._lock:
+            for row in self.rows.values():
+                counts[row.status] += 1
+        return counts
+
+    def progress(self) -> float:
+        counts = self.counts()
+        return (counts[GRADED] + counts[FAILED]) / max(len(self.rows), 1)
+
+    @property
+    def slots(self) -> int:
+        """Requests this job can have in flight at once."""
+        if self.limiter is None:
+            return self.workers
+        reserved = 0 if self.lane == INTERACTIVE else self.limiter.reserved
+        return min(self.workers, self.limiter.capacity - reserved)
+
+    def makespan(self) -> dict:
+        """Wall-clock time of the latest run against the same rows dispatched in upload order.
+
+        The in-order figure replays each row's measured request time through
+        ``slots`` in upload order, so it shows what ordering alone would have
+        cost. Returns None until the run has finished.
+        """
+        with self._lock:
+            rows = [self.rows[row_id] for row_id in self._run_row_ids]
+            if not rows or any(row.status in (PENDING, RUNNING) for row in rows):
+                return None
+            durations = {row.row_id: max(row.finished_at - row.started_at, 0.0) for row in rows if row.started_at}
+        return {
+            "rows": len(rows),
+            "slots": self.slots,
+            "makespan": max(row.finished_at for row in rows) - self._run_started,
+            "in_order": simulate_makespan([durations[row_id] for row_id in sorted(durations)], self.slots),
+            "longest_first": simulate_makespan([durations[row_id] for row_id in self._run_row_ids if row_id in durations], self.slots),
+        }
+
+    def failed_ids(self) -> list:
+        with self._lock:
+            return self._failed_ids()
+
+    def _failed_ids(self) -> list:
+        return [row_id for row_id, row in self.rows.items() if row.status == FAILED]
+
+    def results(self, text: bool = True) -> list:
+        """Rows in original upload order; ``text=False`` skips decompressing essays and feedback."""
+        with self._lock:
+            if not text:
+                return [replace(row) for row in self.rows.values()]
+            return [self._materialize(row) for row in self.rows.values()]
+
+
+# ----------- Results browsing ----------- #
+def search_results(job: BatchJob, query: str, cache: dict) -> set:
+    """Row IDs whose student/assignment ID, essay or feedback contains ``query``.
+
+    ``cache`` (e.g. a session's state) keeps the latest search until the job's
+    ``version`` changes, i.e. until another row finishes.
+    """
+    key = (id(job), job.version, query.lower())
+    if key not in cache:
+        needle = query.lower()
+        matches = set()
+        for row in job.results(text=False):
+            # Cheap ID match first; only decompress the text of rows that still need checking
+            if needle in f"{row.student_id} {row.assignment_id}".lower() or needle in job.feedback(row.row_id).lower() or needle in job.essay(row.row_id).lower():
+                matches.add(row.row_id)
+        cache.clear()
+        cache[key] = matches
+    return cache[key]
+
+
+def filter_results(rows: list, matches: set = None, score_range: tuple = (0, 100), letters: list = (), status: str = "All") -> list:
+    """Rows in ``matches`` (all if None) with the given status, overall score range and letter grades."""
+    filtered = []
+    for row in rows:
+        overall = (row.scores or {}).get("overall")
+        letter = (row.scores or {}).get("letter_grade") or ""
+        if matches is not None and row.row_id not in matches:
+            continue
+        if status == "Failed" and row.status != FAILED or status == "Graded" and row.status != GRADED:
+            continue
+        if tuple(score_range) != (0, 100) and (overall is None or not score_range[0] <= overall <= score_range[1]):
+            continue
+        if letters and letter[:1] not in letters:
+            continue
+        filtered.append(row)
+    return filtered
@@ -0,0 +1,243 @@
+import argparse
+import atexit
+import glob
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+import openai
+
+# ----------- CASSETTE CONFIGURATION ----------- #
+# passthrough (default), record or replay
+CASSETTE_MODE = os.getenv("GRADING_CASSETTE_MODE", "passthrough")
+CASSETTE_PATH = os.getenv("GRADING_CASSETTE_PATH", "cassettes/grading.jsonl.gz")
+# Replay latency multiplier: 1 = as recorded, 0 = instant, 0.5 = twice as fast
+CASSETTE_LATENCY_SCALE = float(os.getenv("GRADING_CASSETTE_LATENCY_SCALE", "1"))
+
+PASSTHROUGH = "passthrough"
+RECORD = "record"
+REPLAY = "replay"
+MODES = (PASSTHROUGH, RECORD, REPLAY)
+
+# Per-call options that don't change the answer, so they stay out of the match key
+_UNKEYED = {"timeout"}
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when a request was never recorded."""
+
+
+def request_key(request: dict) -> str:
+    keyed = {name: value for name, value in request.items() if name not in _UNKEYED}
+    return hashlib.sha256(json.dumps(keyed, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _dump_response(response) -> dict:
+    usage = getattr(response, "usage", None)
+    return {
+        "model": getattr(response, "model", None),
+        "choices": [
+            {
+                "index": getattr(choice, "index", index),
+                "content": choice.message.content,
+                "finish_reason": getattr(choice, "finish_reason", None),
+            }
+            for index, choice in enumerate(response.choices)
+        ],
+        "usage": {
+            name: getattr(usage, name, 0) or 0 for name in ("prompt_tokens", "completion_tokens", "total_tokens")
+        } if usage is not None else None,
+    }
+
+
+def _load_response(data: dict):
+    # Just the attributes the grading code reads from a ChatCompletion
+    return SimpleNamespace(
+        model=data["model"],
+        choices=[
+            SimpleNamespace(index=choice["index"], finish_reason=choice["finish_reason"],
+                            message=SimpleNamespace(role="assistant", content=choice["content"]))
+            for choice in data["choices"]
+        ],
+        usage=SimpleNamespace(**data["usage"]) if data.get("usage") else None,
+    )
+
+
+class Cassette:
+    """Chat-completion transport that records to or replays from a gzip'd JSON-lines file.
+
+    ``passthrough`` just calls the OpenAI client. ``record`` also appends each
+    request, its response and its latency, through one gzip stream per session
+    into a ``<path>.*.part`` segment that ``close`` (or interpreter exit)
+    appends to ``path`` in one write, so concurrent sessions and shard worker
+    processes never interleave. ``replay`` answers from
+    the file without touching the network, sleeping the recorded latency times
+    ``latency_scale`` (and raising ``APITimeoutError`` if that exceeds the
+    call's timeout). Requests match on everything but the timeout; a request
+    recorded several times replays its responses in rotation.
+    """
+
+    def __init__(self, mode: str = CASSETTE_MODE, path: str = CASSETTE_PATH, latency_scale: float = CASSETTE_LATENCY_SCALE):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}' (expected one of {', '.join(MODES)})")
+        self.mode = mode
+        self.path = path
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._entries = defaultdict(deque)
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._writer = None
+        self._segment = None
+        if mode == REPLAY:
+            for entry in self.entries():
+                self._entries[entry["key"]].append(entry)
+        elif mode == RECORD and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def entries(self):
+        """Every recorded exchange: closed sessions oldest first, then any still-open (or crashed) sessions."""
+        for path in [self.path] + sorted(glob.glob(glob.escape(self.path) + ".*.part")):
+            if not os.path.exists(path):
+                continue
+            # Each closed recording session is its own gzip member; gzip reads them back as one stream
+            with gzip.open(path, "rt", encoding="utf-8") as cassette:
+                try:
+                    for line in cassette:
+                        if line.strip():
+                            yield json.loads(line)
+                except EOFError:
+                    # An open segment has no gzip trailer yet; every entry it flushed is still readable
+                    continue
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    # ----------- Transport ----------- #
+    def create(self, **request):
+        if self.mode == REPLAY:
+            return self._replay(request)
+        started = time.perf_counter()
+        response = openai.chat.completions.create(**request)
+        if self.mode == RECORD:
+            self._record(request, response, time.perf_counter() - started)
+        return response
+
+    def _record(self, request: dict, response, latency: float):
+        entry = {
+            "key": request_key(request),
+            "recorded_at": time.time(),
+            "latency": latency,
+            "request": {name: value for name, value in request.items() if name not in _UNKEYED},
+            "response": _dump_response(response),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._writer is None:
+                self._segment = f"{self.path}.{os.getpid()}-{uuid.uuid4().hex[:8]}.part"
+                self._writer = gzip.open(self._segment, "wt", encoding="utf-8")
+                atexit.register(self.close)
+            self._writer.write(line)
+            # A sync flush per entry: readable if the process dies, without restarting compression
+            self._writer.flush()
+            self.recorded += 1
+
+    def close(self):
+        """Finish the session's gzip member and append it to the cassette; later recordings start a new one."""
+        with self._lock:
+            if self._writer is None:
+                return
+            self._writer.close()
+            self._writer = None
+            with open(self._segment, "rb") as segment:
+                member = segment.read()
+            with open(self.path, "ab") as cassette:
+                cassette.write(member)
+            os.remove(self._segment)
+
+    def _replay(self, request: dict):
+        key = request_key(request)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded response for this request (key {key[:12]}) in {self.path}")
+            entry = entries[0]
+            entries.rotate(-1)
+            self.hits += 1
+        delay = entry["latency"] * self.latency_scale
+        timeout = request.get("timeout")
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            # Same error the client raises on a real deadline; there is no HTTP request to attach
+            raise openai.APITimeoutError(request=None)
+        if delay > 0:
+            time.sleep(delay)
+        return _load_response(entry["response"])
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses, "recorded": self.recorded, "entries": len(self)}
+
+
+# ----------- LOAD TEST ----------- #
+def load_test(path: str, latency_scale: float = 1.0, concurrency: int = 8, repeat: int = 1) -> dict:
+    """Replay every recorded request through the shared limiter as fast as it admits them."""
+    from batch import BatchJob, GRADED
+    from limiter import FairShareLimiter
+
+    cassette = Cassette(REPLAY, path, latency_scale)
+    requests = [entry["request"] for entry in cassette.entries()] * repeat
+    if not requests:
+        raise CassetteMiss(f"No recorded requests in {path}")
+    limiter = FairShareLimiter(concurrency, reserved=0)
+    job = BatchJob(
+        [(row_id, json.dumps(request)) for row_id, request in enumerate(requests)],
+        lambda row: cassette.create(**json.loads(row.essay)).choices[0].message.content,
+        workers=concurrency,
+        limiter=limiter,
+        session_id="load-test"
+    )
+    started = time.perf_counter()
+    job.start()
+    while job.running:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    counts = job.counts()
+    latency = limiter.lane_latency()["bulk"]
+    return {
+        "requests": len(requests),
+        "graded": counts[GRADED],
+        "seconds": elapsed,
+        "requests_per_second": len(requests) / elapsed if elapsed else 0.0,
+        "p50": latency["p50"],
+        "p95": latency["p95"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect a grading cassette or replay it as a load test.")
+    parser.add_argument("command", choices=("stats", "load-test"))
+    parser.add_argument("path", nargs="?", default=CASSETTE_PATH)
+    parser.add_argument("--scale", type=float, default=1.0, help="latency multiplier for replay")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1, help="replay the cassette this many times")
+    args = parser.parse_args()
+    if args.command == "stats":
+        entries = list(Cassette(PASSTHROUGH, args.path).entries())
+        latencies = sorted(entry["latency"] for entry in entries)
+        print(f"{len(entries)} recorded requests, {len({entry['key'] for entry in entries})} distinct")
+        if latencies:
+            print(f"latency p50 {latencies[len(latencies) // 2]:.2f}s · max {latencies[-1]:.2f}s · total {sum(latencies):.1f}s")
+    else:
+        result = load_test(args.path, args.scale, args.concurrency, args.repeat)
+        print(
+            f"{result['graded']}/{result['requests']} replayed in {result['seconds']:.2f}s "
+            f"({result['requests_per_second']:.1f} req/s) · p50 {result['p50']:.2f}s · p95 {result['p95']:.2f}s"
+        )
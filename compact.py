@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+import zlib
+from array import array
+
+from grading import build_grading_prompt, build_scores_prompt
+
+try:
+    import zstandard
+except ImportError:  # Optional: zlib is always available
+    zstandard = None
+
+# ----------- COMPACT STORAGE CONFIGURATION ----------- #
+ZLIB = "zlib"
+ZSTD = "zstd"
+# zstd when the zstandard package is installed, otherwise zlib
+COMPRESSION_CODEC = os.getenv("GRADING_COMPRESSION_CODEC", ZSTD if zstandard is not None else ZLIB)
+COMPRESSION_LEVEL = int(os.getenv("GRADING_COMPRESSION_LEVEL", "6"))
+
+# Feedback repeats the prompt's headings, rubric labels and phrasing, so the prompts
+# make a good preset dictionary; it mostly helps short texts like scores-only replies
+_DICTIONARY = (build_scores_prompt("High School") + build_grading_prompt("High School")).encode("utf-8")[-32768:]
+
+
+class CompressedTexts:
+    """Thread-safe store of individually compressed strings packed into one ``bytearray``.
+
+    ``add`` returns an integer handle; ``store[handle]`` decompresses just that
+    string. Offsets and lengths live in ``array`` columns rather than per-item
+    objects. ``replace`` appends a new version and repoints the handle; the
+    superseded bytes are reclaimed once they make up half the buffer.
+    """
+
+    def __init__(self, codec: str = COMPRESSION_CODEC, level: int = COMPRESSION_LEVEL):
+        if codec == ZSTD and zstandard is None:
+            raise ValueError("zstd compression needs the 'zstandard' package")
+        if codec not in (ZLIB, ZSTD):
+            raise ValueError(f"Unknown compression codec '{codec}'")
+        self.codec = codec
+        self.level = level
+        self.raw_bytes = 0
+        self._data = bytearray()
+        self._offsets = array("Q")
+        self._lengths = array("I")
+        self._raw_lengths = array("I")
+        self._dead = 0
+        self._lock = threading.Lock()
+        if codec == ZSTD:
+            dictionary = zstandard.ZstdCompressionDict(_DICTIONARY, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+            self._compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+
+    # ----------- Codec ----------- #
+    def _compress(self, raw: bytes) -> bytes:
+        if self.codec == ZSTD:
+            return self._compressor.compress(raw)
+        compressor = zlib.compressobj(self.level, zdict=_DICTIONARY)
+        return compressor.compress(raw) + compressor.flush()
+
+    def _decompress(self, packed: bytes) -> bytes:
+        if self.codec == ZSTD:
+            return self._decompressor.decompress(packed)
+        decompressor = zlib.decompressobj(zdict=_DICTIONARY)
+        return decompressor.decompress(packed) + decompressor.flush()
+
+    # ----------- Storage ----------- #
+    def _pack(self, text: str) -> tuple:
+        raw = (text or "").encode("utf-8")
+        return (self._compress(raw) if raw else b""), len(raw)
+
+    def add(self, text: str) -> int:
+        packed, raw_length = self._pack(text)
+        with self._lock:
+            self._offsets.append(len(self._data))
+            self._lengths.append(len(packed))
+            self._raw_lengths.append(raw_length)
+            self._data += packed
+            self.raw_bytes += raw_length
+            return len(self._offsets) - 1
+
+    def replace(self, handle: int, text: str):
+        packed, raw_length = self._pack(text)
+        with self._lock:
+            self._dead += self._lengths[handle]
+            self.raw_bytes += raw_length - self._raw_lengths[handle]
+            self._offsets[handle] = len(self._data)
+            self._lengths[handle] = len(packed)
+            self._raw_lengths[handle] = raw_length
+            self._data += packed
+            if self._dead * 2 > len(self._data):
+                self._compact()
+
+    def _compact(self):
+        data = bytearray()
+        for handle, (offset, length) in enumerate(zip(self._offsets, self._lengths)):
+            self._offsets[handle] = len(data)
+            data += self._data[offset:offset + length]
+        self._data = data
+        self._dead = 0
+
+    def __getitem__(self, handle: int) -> str:
+        with self._lock:
+            offset, length = self._offsets[handle], self._lengths[handle]
+            packed = bytes(self._data[offset:offset + length])
+        return self._decompress(packed).decode("utf-8") if packed else ""
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the store: the packed buffer plus its index columns."""
+        with self._lock:
+            return (len(self._data) + self._offsets.itemsize * len(self._offsets)
+                    + self._lengths.itemsize * len(self._lengths) + self._raw_lengths.itemsize * len(self._raw_lengths))
+
+
+# ----------- MEMORY BENCHMARK ----------- #
+def _docstring_sentences() -> list:
+    # Real English that isn't in the preset dictionary: sentences from standard-library docstrings
+    import argparse
+    import collections
+    import json
+    import logging
+    import pathlib
+    import statistics
+    docs = [getattr(module, name).__doc__ for module in (argparse, collections, json, logging, pathlib, statistics) for name in dir(module)]
+    return sorted({
+        sentence.strip() + "."
+        for doc in docs if isinstance(doc, str)
+        for sentence in " ".join(doc.split()).split(". ") if len(sentence.split()) > 6
+    })
+
+
+def _prose(sentences: list, words: int, rng) -> str:
+    out, count = [], 0
+    while count < words:
+        out.append(rng.choice(sentences))
+        count += len(out[-1].split())
+    return " ".join(out)
+
+
+def benchmark(rows: int = 1000, essay_words: int = 500, feedback_words: int = 900) -> dict:
+    """Traced memory of ``rows`` graded essays held as plain ``RowResult`` strings vs inside a ``BatchJob``.
+
+    Also sizes the app's download payloads (CSV and Parquet), which Streamlit
+    holds in memory on top of the job while they're prepared.
+    """
+    import csv
+    import io
+    import random
+    import tracemalloc
+    from batch import BatchJob, RowResult
+    from export import PARQUET, ResultWriter
+    from grading import CRITERIA
+
+    rng = random.Random(0)
+    sentences = _docstring_sentences()
+    essays = [_prose(sentences, essay_words, rng) for _ in range(rows)]
+    # Shaped like a real report: emoji headings (which make Python store the whole string at 4 bytes/char) and prose
+    feedback = [
+        "## 🎯 OVERALL GRADE\n**Score: 82/100 | Letter Grade: B- | Performance Level: PROFICIENT**\n\n"
+        + "".join(f"### {label}: {rng.randint(12, 19)}/20\n{_prose(sentences, feedback_words // len(CRITERIA), rng)}\n\n"
+                  for label in CRITERIA.values())
+        + "## 🚀 NEXT STEPS\n" + _prose(sentences, feedback_words // 10, rng)
+        for _ in range(rows)
+    ]
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    # Fresh copies, so the traced total includes the text itself (what the session used to hold)
+    plain = [RowResult(row_id, essays[row_id].encode().decode(), feedback=feedback[row_id].encode().decode()) for row_id in range(rows)]
+    before = tracemalloc.get_traced_memory()[0] - baseline
+    del plain
+    baseline = tracemalloc.get_traced_memory()[0]
+    job = BatchJob([(row_id, essays[row_id]) for row_id in range(rows)], lambda row: feedback[row.row_id], workers=4)
+    job.start()
+    while job.running:
+        time.sleep(0.01)
+    after = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    stored = job.text_bytes()
+    # The same columns the app's CSV export writes
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([row.student_id, job.essay(row.row_id)[:30] + "...", row.status, job.feedback(row.row_id), row.error]
+                                 for row in job.results(text=False))
+    writer = ResultWriter("College", PARQUET)
+    for row in job.results():
+        writer.write(row)
+    path = writer.close()
+    parquet_bytes = os.path.getsize(path)
+    os.remove(path)
+    return {"rows": rows, "before": before, "after": after, "text_bytes": stored["raw"], "stored_bytes": stored["stored"], "codec": stored["codec"],
+            "csv_bytes": len(buffer.getvalue().encode("utf-8")), "parquet_bytes": parquet_bytes}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Measure per-session memory of graded essays with and without compression.")
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+    result = benchmark(args.rows)
+    scale = 1000 / result["rows"]
+    print(
+        f"{result['rows']} essays ({result['text_bytes'] / 1e6:.1f} MB of UTF-8 text). Per 1,000 essays: "
+        f"plain strings {result['before'] * scale / 1e6:.1f} MB → {result['codec']}-compressed {result['after'] * scale / 1e6:.1f} MB "
+        f"({result['before'] / max(result['after'], 1):.1f}x smaller; compressed text alone {result['stored_bytes'] * scale / 1e6:.1f} MB). "
+        f"Prepared downloads add CSV {result['csv_bytes'] * scale / 1e6:.1f} MB + Parquet {result['parquet_bytes'] * scale / 1e6:.1f} MB "
+        f"until the next rerun"
+    )
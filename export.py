@@ -0,0 +1,171 @@
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from grading import CRITERIA, parse_scores
+
+# ----------- EXPORT CONFIGURATION ----------- #
+# Rows buffered before a row group (Parquet) or record batch (Arrow IPC) is written out
+EXPORT_ROW_GROUP_SIZE = int(os.getenv("GRADING_EXPORT_ROW_GROUP_SIZE", "256"))
+
+PARQUET = "parquet"
+ARROW = "arrow"
+FORMATS = {PARQUET: ".parquet", ARROW: ".arrow"}
+
+_TIMESTAMP = pa.timestamp("ms", tz="UTC")
+
+EXPORT_SCHEMA = pa.schema(
+    [
+        ("row_id", pa.int64()),
+        ("student_id", pa.string()),
+        ("assignment_id", pa.string()),
+        ("essay", pa.string()),
+        ("level", pa.string()),
+        ("model", pa.string()),
+        # Endpoint that answered when the primary was degraded; a same-model fallback has the primary's model name
+        ("fallback", pa.string()),
+        ("status", pa.string()),
+        ("error", pa.string()),
+        ("attempts", pa.int32()),
+        ("started_at", _TIMESTAMP),
+        ("finished_at", _TIMESTAMP),
+        ("prompt_tokens", pa.int64()),
+        ("completion_tokens", pa.int64()),
+        ("total_tokens", pa.int64()),
+        ("overall_score", pa.float64()),
+        ("letter_grade", pa.string()),
+        ("score_spread", pa.float64()),
+    ]
+    + [(f"{key}_score", pa.float64()) for key in CRITERIA]
+    + [("feedback", pa.string())]
+)
+
+
+def _timestamp(value: float):
+    return datetime.fromtimestamp(value, timezone.utc) if value else None
+
+
+class ResultWriter:
+    """Streams finished batch rows to a Parquet or Arrow IPC file in row groups.
+
+    Rows are appended in the order they finish, so only one row group is ever
+    held in memory. A row that is re-graded (retry, full feedback after
+    triage) is appended again; the record with the latest ``finished_at`` per
+    ``row_id`` is current. ``close`` finalizes the file for download; writing
+    after that reopens it by streaming the existing row groups into a new file.
+    """
+
+    def __init__(self, level: str, fmt: str = PARQUET, path: str = None, row_group_size: int = EXPORT_ROW_GROUP_SIZE):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}'")
+        self.level = level
+        self.format = fmt
+        if path is None:
+            handle, path = tempfile.mkstemp(prefix="graded_essays_", suffix=FORMATS[fmt])
+            os.close(handle)
+            os.remove(path)
+        self.path = path
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        self._buffer = []
+        self._writer = None
+        self._lock = threading.Lock()
+
+    # ----------- Writing ----------- #
+    def _open(self):
+        previous = None
+        if os.path.exists(self.path):
+            previous = self.path + ".prev"
+            os.replace(self.path, previous)
+        if self.format == PARQUET:
+            self._writer = pq.ParquetWriter(self.path, EXPORT_SCHEMA, compression="zstd")
+        else:
+            self._writer = ipc.new_file(self.path, EXPORT_SCHEMA)
+        if previous is not None:
+            # Carry over what was already written, one row group at a time
+            if self.format == PARQUET:
+                source = pq.ParquetFile(previous)
+                for index in range(source.num_row_groups):
+                    self._writer.write_table(source.read_row_group(index))
+            else:
+                with pa.memory_map(previous) as mapped:
+                    source = ipc.open_file(mapped)
+                    for index in range(source.num_record_batches):
+                        self._writer.write_batch(source.get_batch(index))
+            os.remove(previous)
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        if self._writer is None:
+            self._open()
+        batch = pa.RecordBatch.from_pylist(self._buffer, schema=EXPORT_SCHEMA)
+        if self.format == PARQUET:
+            self._writer.write_batch(batch, row_group_size=len(self._buffer))
+        else:
+            self._writer.write_batch(batch)
+        self.rows_written += len(self._buffer)
+        self._buffer = []
+
+    def _record(self, row) -> dict:
+        scores = row.scores or parse_scores(row.feedback)
+        record = {
+            "row_id": row.row_id,
+            "student_id": row.student_id,
+            "assignment_id": row.assignment_id,
+            "essay": row.essay,
+            "level": self.level,
+            "model": row.model or None,
+            "fallback": row.fallback or None,
+            "status": row.status,
+            "error": row.error or None,
+            "attempts": row.attempts,
+            "started_at": _timestamp(row.started_at),
+            "finished_at": _timestamp(row.finished_at),
+            "prompt_tokens": row.prompt_tokens,
+            "completion_tokens": row.completion_tokens,
+            "total_tokens": row.prompt_tokens + row.completion_tokens,
+            "overall_score": scores["overall"],
+            "letter_grade": scores["letter_grade"],
+            "score_spread": row.score_spread,
+            "feedback": row.feedback or None,
+        }
+        record.update({f"{key}_score": scores[key] for key in CRITERIA})
+        return record
+
+    def write(self, row):
+        """Buffer one finished ``RowResult``; a full buffer becomes a row group."""
+        self.append(self._record(row))
+
+    def append(self, record: dict):
+        """Buffer one ``EXPORT_SCHEMA`` record as-is (e.g. when merging exports)."""
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.row_group_size:
+                self._flush()
+
+    def close(self) -> str:
+        """Flush the partial row group and write the footer; returns the file path."""
+        with self._lock:
+            self._flush()
+            if self._writer is None and not os.path.exists(self.path):
+                # Nothing finished yet: still produce a valid, empty file
+                self._open()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        return self.path
+
+    def discard(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._buffer = []
+            if os.path.exists(self.path):
+                os.remove(self.path)
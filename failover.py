@@ -0,0 +1,226 @@
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import openai
+
+from hedging import LatencyTracker
+
+# ----------- FAILOVER CONFIGURATION ----------- #
+# Model to grade with while the primary is failing; GRADING_FALLBACK_BASE_URL sends it to any
+# OpenAI-compatible server instead (e.g. a self-hosted or Azure deployment)
+FALLBACK_MODEL = os.getenv("GRADING_FALLBACK_MODEL", "")
+FALLBACK_BASE_URL = os.getenv("GRADING_FALLBACK_BASE_URL", "")
+FALLBACK_API_KEY = os.getenv("GRADING_FALLBACK_API_KEY", "")
+# Open an endpoint's breaker once this share of its recent requests failed or were slow...
+BREAKER_ERROR_RATE = float(os.getenv("GRADING_BREAKER_ERROR_RATE", "0.5"))
+# ...out of the last BREAKER_WINDOW requests, once at least BREAKER_MIN_REQUESTS were seen
+BREAKER_WINDOW = int(os.getenv("GRADING_BREAKER_WINDOW", "20"))
+BREAKER_MIN_REQUESTS = int(os.getenv("GRADING_BREAKER_MIN_REQUESTS", "5"))
+# A successful request slower than this still counts against the endpoint
+BREAKER_SLOW_SECONDS = float(os.getenv("GRADING_BREAKER_SLOW_SECONDS", "60"))
+# How long an open breaker fails fast before letting one probe request through
+BREAKER_COOLDOWN = float(os.getenv("GRADING_BREAKER_COOLDOWN_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(Exception):
+    """Raised without sending a request when every endpoint's breaker is open."""
+
+
+def is_endpoint_fault(error: Exception) -> bool:
+    """Timeouts, connection errors and 5xx say the endpoint is unhealthy; a 4xx says the request is.
+
+    A 429 is the account's rate limit, not an outage: the endpoint answered,
+    and opening its breaker would only turn a brief backoff into a cooldown.
+    """
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class CircuitBreaker:
+    """Rolling error rate and latency of one endpoint, with closed / open / half-open states.
+
+    Closed: every request goes through and its outcome joins a window of the
+    last ``window`` requests; a failure or a call slower than ``slow_seconds``
+    is a bad outcome. Once ``error_rate`` of at least ``min_requests`` outcomes
+    are bad the breaker opens and ``allow`` refuses requests for ``cooldown``
+    seconds. Then it is half-open: one probe is let through, and its outcome
+    either closes the breaker (with a fresh window) or reopens it.
+    """
+
+    def __init__(self, error_rate: float = BREAKER_ERROR_RATE, window: int = BREAKER_WINDOW,
+                 min_requests: int = BREAKER_MIN_REQUESTS, slow_seconds: float = BREAKER_SLOW_SECONDS,
+                 cooldown: float = BREAKER_COOLDOWN):
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.latencies = LatencyTracker()
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+        self.trips = 0
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and time.monotonic() >= self._opened_at + self.cooldown:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok: bool, seconds: float):
+        bad = not ok or seconds > self.slow_seconds
+        if ok:
+            self.latencies.record(seconds)
+        with self._lock:
+            self.requests += 1
+            self.failures += not ok
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if bad:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                return
+            self._outcomes.append(bad)
+            if (self.state == CLOSED and len(self._outcomes) >= self.min_requests
+                    and sum(self._outcomes) >= self.error_rate * len(self._outcomes)):
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.trips += 1
+
+    def retry_in(self) -> float:
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.cooldown - time.monotonic())
+
+    def stats(self) -> dict:
+        with self._lock:
+            outcomes = list(self._outcomes)
+            stats = {
+                "state": self.state,
+                "requests": self.requests,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "trips": self.trips,
+            }
+        stats["error_rate"] = sum(outcomes) / len(outcomes) if outcomes else 0.0
+        stats["p50"] = self.latencies.percentile(0.5)
+        stats["p95"] = self.latencies.percentile(0.95)
+        stats["retry_in"] = self.retry_in()
+        return stats
+
+
+class Endpoint:
+    """A model, optionally on its own OpenAI-compatible server, behind its own breaker."""
+
+    def __init__(self, model: str, base_url: str = "", api_key: str = "", breaker: CircuitBreaker = None):
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.breaker = breaker or CircuitBreaker()
+        self._client = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.model} @ {urlparse(self.base_url).netloc or self.base_url}" if self.base_url else self.model
+
+    def send(self, create, request: dict):
+        request = {**request, "model": self.model}
+        if not self.base_url:
+            # Same client/transport as the primary (so cassettes record fallback requests too)
+            return create(**request)
+        if self._client is None:
+            # No client-side retries: the deadline is GRADING_TIMEOUT_SECONDS, as for the primary
+            self._client = openai.OpenAI(base_url=self.base_url, api_key=self.api_key or openai.api_key or "unused", max_retries=0)
+        return self._client.chat.completions.create(**request)
+
+
+class FailoverRouter:
+    """Sends each request to the first endpoint whose breaker allows it.
+
+    The primary is tried first; when its breaker is open, or the request
+    fails with an endpoint fault, the request goes to the fallback instead.
+    With every breaker open it fails fast with ``CircuitOpenError`` rather
+    than waiting out another timeout. Shared process-wide so every session
+    and batch sees the same endpoint health.
+    """
+
+    def __init__(self, endpoints: list):
+        self.endpoints = endpoints
+        self.failovers = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, model: str) -> "FailoverRouter":
+        endpoints = [Endpoint(model)]
+        if FALLBACK_MODEL or FALLBACK_BASE_URL:
+            endpoints.append(Endpoint(FALLBACK_MODEL or model, FALLBACK_BASE_URL, FALLBACK_API_KEY))
+        return cls(endpoints)
+
+    def create(self, create, **request):
+        """Send ``request`` through ``create`` (or a fallback's own client), failing over on endpoint faults."""
+        return self.route(create, **request)[0]
+
+    def route(self, create, **request) -> tuple:
+        """Like ``create``, but returns ``(response, endpoint)``; ``endpoint`` is the fallback that answered, else None."""
+        error = None
+        for index, endpoint in enumerate(self.endpoints):
+            if not endpoint.breaker.allow():
+                continue
+            started = time.monotonic()
+            try:
+                response = endpoint.send(create, request)
+            except Exception as e:
+                fault = is_endpoint_fault(e)
+                # A rejected request (bad input, auth) still means the endpoint answered
+                endpoint.breaker.record(not fault, time.monotonic() - started)
+                if not fault:
+                    raise
+                error = e
+                continue
+            endpoint.breaker.record(True, time.monotonic() - started)
+            if not index:
+                return response, None
+            with self._lock:
+                self.failovers += 1
+            return response, endpoint
+        if error is not None:
+            raise error
+        primary = self.endpoints[0]
+        raise CircuitOpenError(
+            f"{primary.name} is failing ({primary.breaker.stats()['error_rate']:.0%} of recent requests)"
+            + (" and so is the fallback" if len(self.endpoints) > 1 else "")
+            + f"; retrying it in {primary.breaker.retry_in():.0f}s"
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            failovers = self.failovers
+        return {
+            "failovers": failovers,
+            "endpoints": {endpoint.name: endpoint.breaker.stats() for endpoint in self.endpoints},
+        }
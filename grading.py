@@ -0,0 +1,671 @@
+import contextvars
+import difflib
+import openai
+import os
+import re
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+
+from failover import FailoverRouter
+from profiler import span
+
+# ----------- GRADING CONFIGURATION ----------- #
+GRADING_MODEL = os.getenv("GRADING_MODEL", "gpt-4o")
+# Per-call deadline (seconds) so a single hung request can't stall a batch
+REQUEST_TIMEOUT = float(os.getenv("GRADING_TIMEOUT_SECONDS", "90"))
+# Reply cap for scores-only triage; the compact format fits in well under 200 tokens
+SCORES_MAX_TOKENS = int(os.getenv("GRADING_SCORES_MAX_TOKENS", "200"))
+# Completions per request in consistency mode (sent as `n`, so the prompt is only processed once)
+CONSISTENCY_SAMPLES = int(os.getenv("GRADING_CONSISTENCY_SAMPLES", "3"))
+# Spread (highest minus lowest overall score across samples) that flags a grade as unstable
+CONSISTENCY_SPREAD_THRESHOLD = float(os.getenv("GRADING_CONSISTENCY_SPREAD", "8"))
+# Revision mode regrades in full instead once more than this share of the paragraphs changed
+REVISION_MAX_CHANGED = float(os.getenv("GRADING_REVISION_MAX_CHANGED", "0.5"))
+# Reply cap for revision feedback, which only covers what changed
+REVISION_MAX_TOKENS = int(os.getenv("GRADING_REVISION_MAX_TOKENS", "600"))
+
+
+# Optional object with a ``create(**request)`` method standing in for the OpenAI client (see cassette.py)
+_transport = None
+
+
+def set_transport(transport):
+    """Route every grading request through ``transport.create``; ``None`` restores the OpenAI client."""
+    global _transport
+    _transport = transport
+
+
+# Per-endpoint circuit breakers, shared process-wide: fail fast or fail over to GRADING_FALLBACK_MODEL (see failover.py)
+_router = FailoverRouter.from_env(GRADING_MODEL)
+
+
+def set_router(router):
+    """Replace the failover router; ``None`` sends every request straight to GRADING_MODEL."""
+    global _router
+    _router = router
+
+
+def failover_stats() -> dict:
+    return _router.stats() if _router is not None else {"failovers": 0, "endpoints": {}}
+
+
+class GradingError(Exception):
+    """Raised when a grading request fails or misses its deadline."""
+
+
+@dataclass
+class Feedback:
+    """Feedback text plus the model, token usage and timing of the request(s) that produced it."""
+    text: str
+    model: str = GRADING_MODEL
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    started_at: float = 0.0
+    finished_at: float = 0.0
+    # Every completion when the request asked for n > 1, and the summary of their scores
+    samples: list = field(default_factory=list)
+    consistency: dict = None
+    # Answered from history for an identical essay instead of a new request
+    cached: bool = False
+    # Paragraph diff against the earlier draft when graded as a revision (see grade_essay_revision)
+    revision: dict = None
+    # Name of the fallback endpoint that answered (e.g. "gpt-4o @ llm.example.edu"); empty when the primary did
+    fallback: str = ""
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+# Rubric criteria keyed by the short names used in stored/exported scores
+CRITERIA = {
+    "thesis": "Thesis & Argument Development",
+    "evidence": "Evidence & Analysis Quality",
+    "organization": "Organization & Coherence",
+    "language": "Language Mastery & Style",
+    "critical_thinking": "Critical Thinking & Depth",
+}
+
+
+LEVEL_INSTRUCTIONS = {
+    "High School": "Evaluate as an experienced high school English teacher. Focus on fundamental writing skills: clear thesis statements, basic paragraph structure, grammar fundamentals, and developing analytical thinking. Encourage growth while being supportive of developing writers.",
+    "College": "Evaluate as a college professor with high academic standards. Emphasize sophisticated argumentation, college-level analysis, proper citation and evidence use, advanced writing mechanics, and critical thinking skills appropriate for undergraduate work.",
+    "Professional": "Evaluate as a professional editor and writing coach. Apply the highest standards for clarity, precision, persuasiveness, and polish. Expect publication-quality writing with sophisticated analysis, flawless mechanics, and compelling argumentation suitable for professional or graduate-level work."
+}
+
+
+# ----------- PROMPT SECTIONS ----------- #
+_FRAMEWORK = (
+    "🎯 ENHANCED GRADING FRAMEWORK:\n"
+    "Apply this comprehensive rubric to provide detailed, actionable feedback that drives student improvement. Consider consistency, specificity, and developmental appropriateness in your evaluation.\n\n"
+    
+    "📚 BENCHMARK REFERENCE - EXEMPLARY COLLEGE ESSAY (95/100):\n"
+    "Use this high-performing college essay as a reference point for quality standards, but adjust expectations appropriately for developmental level. This benchmark essay demonstrates:\n"
+    "- EXCEPTIONAL thesis: Clear stance on NCAA settlement's impact on non-revenue sports\n"
+    "- SOPHISTICATED argumentation: Multi-faceted analysis with cause-effect reasoning\n"
+    "- STRONG evidence integration: Current events (House v. NCAA), specific data, real examples\n"
+    "- EXCELLENT organization: Logical flow from problem to impact to solutions\n"
+    "- PROFICIENT writing mechanics: Clear, engaging prose with varied sentence structure\n"
+    "- ORIGINAL critical thinking: Nuanced perspective on complex issue with practical solutions\n\n"
+    
+    "Key strengths to look for based on this benchmark (adjust expectations for student level):\n"
+    "• Specific, arguable thesis that takes a clear position\n"
+    "• Integration of current events and real-world examples\n"
+    "• Logical progression from problem identification to solution proposal\n"
+    "• Use of credible sources and specific data/statistics\n"
+    "• Consideration of multiple stakeholders and perspectives\n"
+    "• Practical, actionable solutions supported by evidence\n"
+    "• Engaging introduction that establishes stakes and importance\n"
+    "• Strong conclusion that reinforces main argument and broader implications\n\n"
+)
+
+# Each criterion's rubric, also sent on its own in per-criterion mode
+RUBRIC = {
+    "thesis": (
+        "1. 💡 THESIS & ARGUMENT DEVELOPMENT (20 points):\n"
+        "   • 18-20 (EXCEPTIONAL): Crystal-clear, sophisticated thesis that takes a compelling, nuanced position (like the NCAA essay's stance on protecting non-revenue sports). Arguments are logically sequenced, well-reasoned, and demonstrate deep understanding. Counter-arguments or complexities addressed thoughtfully.\n"
+        "   • 15-17 (PROFICIENT): Strong, specific thesis with clear argument structure. Most claims are well-developed and supported. Shows good understanding of topic complexity and multiple perspectives.\n"
+        "   • 12-14 (DEVELOPING): Thesis present and generally clear, though may lack some specificity or sophistication. Arguments are adequate and show understanding, with room for deeper development.\n"
+        "   • 9-11 (EMERGING): Basic thesis present but may be unclear or overly broad. Arguments need development but show some effort toward logical structure.\n"
+        "   • 0-8 (INADEQUATE): No identifiable thesis or argument structure. Claims are unsupported, contradictory, or missing entirely.\n\n"
+    ),
+    "evidence": (
+        "2. 📚 EVIDENCE & ANALYSIS QUALITY (20 points):\n"
+        "   • 18-20 (EXCEPTIONAL): Rich, credible evidence from multiple high-quality sources (current events, data, real examples like the Stanford case study). Analysis is sophisticated, insightful, and goes beyond surface-level observations. Evidence seamlessly integrated and supports all major claims.\n"
+        "   • 15-17 (PROFICIENT): Good variety of relevant evidence with solid analysis. Sources are credible and mostly well-integrated. Analysis shows clear understanding and some original insight.\n"
+        "   • 12-14 (DEVELOPING): Adequate evidence with basic analysis that demonstrates understanding. Some examples provided, though analysis could be deeper. Evidence generally supports the argument.\n"
+        "   • 9-11 (EMERGING): Limited evidence but shows effort to support claims. Analysis is basic but present. Some sources may be weak but attempts at integration are made.\n"
+        "   • 0-8 (INADEQUATE): Little to no evidence provided. No meaningful analysis present.\n\n"
+    ),
+    "organization": (
+        "3. 🏗️ ORGANIZATION & COHERENCE (20 points):\n"
+        "   • 18-20 (EXCEPTIONAL): Masterful organization with seamless transitions and perfect logical flow (problem→impact→solutions structure). Introduction hooks reader and clearly previews structure. Conclusion synthesizes ideas powerfully and addresses broader implications.\n"
+        "   • 15-17 (PROFICIENT): Well-organized with effective transitions between ideas. Clear introduction, focused body paragraphs with topic sentences, and strong conclusion that reinforces main argument.\n"
+        "   • 12-14 (DEVELOPING): Generally well-organized with basic structure evident. Introduction, body, and conclusion present. Some transitions may be simple but structure is clear and logical.\n"
+        "   • 9-11 (EMERGING): Basic organization present with identifiable paragraphs. Structure may be simple but shows understanding of essay format. Some organizational issues but overall coherent.\n"
+        "   • 0-8 (INADEQUATE): No clear organizational pattern. Ideas presented randomly or incoherently.\n\n"
+    ),
+    "language": (
+        "4. ✍️ LANGUAGE MASTERY & STYLE (20 points):\n"
+        "   • 18-20 (EXCEPTIONAL): Exceptional command of language with varied, sophisticated sentence structure. Precise, engaging word choice and tone appropriate for audience. Virtually error-free mechanics.\n"
+        "   • 15-17 (PROFICIENT): Strong control of language with clear, effective writing. Minor errors don't impede understanding. Good sentence variety and appropriate style.\n"
+        "   • 12-14 (DEVELOPING): Generally clear and readable language with adequate word choice. Some mechanical errors but meaning remains clear. Writing communicates ideas effectively with room for refinement.\n"
+        "   • 9-11 (EMERGING): Basic language use that conveys meaning adequately. Some errors present but don't significantly interfere with comprehension. Simple but functional style.\n"
+        "   • 0-8 (INADEQUATE): Serious mechanical problems that severely impact comprehension. Very limited language control.\n\n"
+    ),
+    "critical_thinking": (
+        "5. 🧠 CRITICAL THINKING & INTELLECTUAL DEPTH (20 points):\n"
+        "   • 18-20 (EXCEPTIONAL): Demonstrates exceptional critical thinking with original insights and intellectual depth (like analyzing unintended consequences of NCAA settlement on non-revenue sports). Makes connections others might miss. Challenges assumptions thoughtfully and considers multiple stakeholder perspectives with practical solutions.\n"
+        "   • 15-17 (PROFICIENT): Shows good critical thinking with some original ideas. Goes beyond obvious interpretations and demonstrates independent thought with consideration of multiple viewpoints.\n"
+        "   • 12-14 (DEVELOPING): Basic critical thinking present with some analysis beyond summary. Shows effort to think independently about the topic, though insights may be straightforward or obvious.\n"
+        "   • 9-11 (EMERGING): Some attempt at analysis or personal perspective, though may rely heavily on summary. Shows beginning stages of critical thinking development.\n"
+        "   • 0-8 (INADEQUATE): No evidence of critical thinking. Purely descriptive or factual with no analysis or original perspective.\n\n"
+    ),
+}
+
+_RESPONSE_FORMAT = (
+    "📋 ENHANCED RESPONSE FORMAT:\n"
+    "Provide detailed, specific feedback using this structure:\n\n"
+    
+    "## 🎯 OVERALL GRADE\n"
+    "**Score: [X]/100 | Letter Grade: [X] | Performance Level: [EXCEPTIONAL/PROFICIENT/DEVELOPING/EMERGING/INADEQUATE]**\n\n"
+    
+    "## 📊 COMPREHENSIVE BREAKDOWN\n"
+    "• **Thesis & Argument Development:** [X]/20 - [Specific explanation with text examples]\n"
+    "• **Evidence & Analysis Quality:** [X]/20 - [Specific explanation with text examples]\n"
+    "• **Organization & Coherence:** [X]/20 - [Specific explanation with text examples]\n"
+    "• **Language Mastery & Style:** [X]/20 - [Specific explanation with text examples]\n"
+    "• **Critical Thinking & Depth:** [X]/20 - [Specific explanation with text examples]\n\n"
+    
+    "## 💪 NOTABLE STRENGTHS\n"
+    "[Highlight 2-3 specific accomplishments with quoted examples from the text. Be specific about what makes these elements successful.]\n\n"
+    
+    "## 🎯 PRIORITY IMPROVEMENT AREAS\n"
+    "[Identify 2-3 most impactful areas for improvement, ranked by importance. Explain why these areas matter and how improvement would elevate the overall essay.]\n\n"
+    
+    "## ✏️ CONCRETE REVISION EXAMPLES\n"
+    "[Provide 3-4 specific examples: quote problematic text and offer improved versions. Show, don't just tell.]\n"
+    "- ORIGINAL: \"[Quote from essay]\"\n"
+    "- REVISED: \"[Your improved version]\"\n"
+    "- WHY: [Brief explanation of improvement]\n\n"
+    
+    "## 🚀 ACTIONABLE NEXT STEPS\n"
+    "1. **Immediate Action:** [One specific revision strategy for this essay]\n"
+    "2. **Skill Building:** [One practice exercise for future essays]\n"
+    "3. **Resource:** [Specific writing resource, technique, or area of study]\n\n"
+    
+    "## 📈 GROWTH TRACKING\n"
+    "[Comment on progress indicators and what to focus on for continued improvement]\n\n"
+)
+
+_SCORES_FORMAT = (
+    "📋 SCORES-ONLY RESPONSE FORMAT:\n"
+    "This is a quick triage pass: give scores only, with no strengths, revision examples or next steps. "
+    "Reply with exactly this structure:\n\n"
+
+    "## 🎯 OVERALL GRADE\n"
+    "**Score: [X]/100 | Letter Grade: [X] | Performance Level: [EXCEPTIONAL/PROFICIENT/DEVELOPING/EMERGING/INADEQUATE]**\n\n"
+
+    "## 📊 SCORES\n"
+    + "".join(f"• **{label}:** [X]/20\n" for label in CRITERIA.values())
+    + "\n**Rationale:** [One sentence naming the biggest factor in this grade]\n\n"
+)
+
+_GRADING_SCALE = (
+    "GRADING SCALE:\n"
+    "A+ = 97-100, A = 93-96, A- = 90-92, B+ = 87-89, B = 83-86, B- = 80-82,\n"
+    "C+ = 77-79, C = 73-76, C- = 70-72, D+ = 67-69, D = 63-66, D- = 60-62, F = below 60\n\n"
+)
+
+_GRADING_PRINCIPLES = (
+    "**GRADING PRINCIPLES:**\n"
+    "- Use the benchmark essay as a reference point while adjusting expectations appropriately for student level\n"
+    "- Be encouraging and recognize effort while maintaining standards for growth\n"
+    "- Focus on specific, actionable improvements that help students progress toward benchmark quality\n"
+    "- Quote directly from the text when providing examples, showing how to build toward benchmark strengths\n"
+    "- Consider the writer's developmental stage and celebrate progress while pushing for continued growth\n"
+    "- Provide concrete strategies students can immediately implement to improve\n"
+    "- Balance constructive criticism with recognition of effort and existing strengths\n"
+    "- Look for evidence of benchmark qualities while acknowledging different levels of development\n"
+    "- Aim to inspire improvement rather than discourage; be rigorous but fair and supportive"
+)
+
+
+def build_grading_prompt(level: str) -> str:
+    return (
+        f"You are an expert writing instructor with 15+ years of experience grading student essays. {LEVEL_INSTRUCTIONS[level]}\n\n"
+        + _FRAMEWORK
+        + "📊 DETAILED RUBRIC CRITERIA (each scored out of 20 points):\n\n"
+        + "".join(RUBRIC.values())
+        + _RESPONSE_FORMAT
+        + _GRADING_SCALE
+        + _GRADING_PRINCIPLES
+    )
+
+
+
+def build_scores_prompt(level: str) -> str:
+    return (
+        f"You are an expert writing instructor with 15+ years of experience grading student essays. {LEVEL_INSTRUCTIONS[level]}\n\n"
+        + _FRAMEWORK
+        + "📊 DETAILED RUBRIC CRITERIA (each scored out of 20 points):\n\n"
+        + "".join(RUBRIC.values())
+        + _SCORES_FORMAT
+        + _GRADING_SCALE
+    )
+
+
+# ----------- GRADING ASSISTANT LOGIC ----------- #
+def _complete(system_prompt: str, essay_text: str, timeout: float = REQUEST_TIMEOUT, hedger=None, **params) -> Feedback:
+    def create_completion():
+        create = _transport.create if _transport is not None else openai.chat.completions.create
+        request = dict(
+            model=GRADING_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": essay_text}
+            ],
+            timeout=timeout,
+            **params
+        )
+        # The router says which endpoint answered; the response's model name can't tell a same-model fallback apart
+        return _router.route(create, **request) if _router is not None else (create(**request), None)
+
+    started_at = time.time()
+    try:
+        # Optionally race a duplicate request against slow stragglers
+        with span("API call"):
+            response, endpoint = hedger.call(create_completion) if hedger else create_completion()
+    except openai.APITimeoutError as e:
+        raise GradingError(f"Request timed out after {timeout:g}s") from e
+    except Exception as e:
+        raise GradingError(str(e)) from e
+    usage = getattr(response, "usage", None)
+    return Feedback(
+        text=response.choices[0].message.content,
+        samples=[choice.message.content for choice in response.choices] if len(response.choices) > 1 else [],
+        model=getattr(response, "model", None) or GRADING_MODEL,
+        prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+        completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        started_at=started_at,
+        finished_at=time.time(),
+        fallback=endpoint.name if endpoint is not None else ""
+    )
+
+
+def grade_essay_with_feedback(essay_text: str, level: str, timeout: float = REQUEST_TIMEOUT, hedger=None,
+                              samples: int = 1) -> Feedback:
+    with span("prompt build"):
+        prompt = build_grading_prompt(level)
+    return _sampled(prompt, essay_text, timeout, hedger, samples)
+
+
+def grade_essay_scores_only(essay_text: str, level: str, timeout: float = REQUEST_TIMEOUT, hedger=None,
+                            max_tokens: int = SCORES_MAX_TOKENS, samples: int = 1) -> Feedback:
+    """Overall score, letter grade, criterion scores and a one-line rationale, for fast triage."""
+    return _sampled(build_scores_prompt(level), essay_text, timeout, hedger, samples, max_tokens=max_tokens)
+
+
+# ----------- CONSISTENCY SAMPLING ----------- #
+def _sampled(system_prompt: str, essay_text: str, timeout: float, hedger, samples: int, **params) -> Feedback:
+    if samples <= 1:
+        return _complete(system_prompt, essay_text, timeout, hedger, **params)
+    # One request, several completions: the prompt is billed and processed once
+    feedback = _complete(system_prompt, essay_text, timeout, hedger, n=samples, **params)
+    summary = summarize_samples(feedback.samples)
+    feedback.consistency = summary
+    if summary["median_sample"] is not None:
+        feedback.text = feedback.samples[summary["median_sample"]]
+    feedback.text = feedback.text.rstrip() + "\n\n" + consistency_section(summary)
+    return feedback
+
+
+def summarize_samples(texts: list) -> dict:
+    """Median, spread and standard deviation of the overall score across sampled feedbacks.
+
+    ``median_sample`` is the index of the sample whose overall score is closest
+    to the median, so the feedback shown agrees with the reported grade.
+    Samples whose score can't be parsed are left out of the statistics.
+    """
+    parsed = [parse_scores(text) for text in texts]
+    overall = [(index, scores["overall"]) for index, scores in enumerate(parsed) if scores["overall"] is not None]
+    summary = {
+        "samples": len(texts),
+        "scores": [scores["overall"] for scores in parsed],
+        "median": None,
+        "spread": None,
+        "stdev": None,
+        "median_sample": None,
+        "flagged": False,
+        "criteria": {},
+    }
+    if not overall:
+        return summary
+    values = [score for _, score in overall]
+    median = statistics.median(values)
+    summary.update(
+        median=median,
+        spread=max(values) - min(values),
+        stdev=statistics.pstdev(values),
+        median_sample=min(overall, key=lambda sample: abs(sample[1] - median))[0],
+    )
+    summary["flagged"] = len(values) > 1 and summary["spread"] >= CONSISTENCY_SPREAD_THRESHOLD
+    for key in CRITERIA:
+        criterion = [scores[key] for scores in parsed if scores[key] is not None]
+        if criterion:
+            summary["criteria"][key] = (statistics.median(criterion), max(criterion) - min(criterion))
+    return summary
+
+
+def consistency_section(summary: dict) -> str:
+    def fmt(score):
+        return f"{score:g}" if score is not None else "—"
+
+    lines = ["## 🎲 CONSISTENCY CHECK"]
+    if summary["median"] is None:
+        lines.append(f"No scores could be read from the {summary['samples']} samples.")
+        return "\n".join(lines)
+    verdict = "⚠️ **High variance — review this grade.**" if summary["flagged"] else "✅ Stable across samples."
+    lines += [
+        f"**Median: {fmt(summary['median'])}/100 | Spread: {fmt(summary['spread'])} points | "
+        f"Std dev: {summary['stdev']:.1f} | Samples: {summary['samples']}** {verdict}",
+        f"Sample scores: {', '.join(fmt(score) for score in summary['scores'])}",
+    ]
+    lines += [
+        f"• {CRITERIA[key]}: median {fmt(median)}/20, spread {fmt(spread)}"
+        for key, (median, spread) in summary["criteria"].items()
+    ]
+    return "\n".join(lines)
+
+
+# ----------- PER-CRITERION GRADING ----------- #
+# Letter grade cut-offs from the grading scale, highest first
+LETTER_GRADES = [
+    (97, "A+"), (93, "A"), (90, "A-"), (87, "B+"), (83, "B"), (80, "B-"),
+    (77, "C+"), (73, "C"), (70, "C-"), (67, "D+"), (63, "D"), (60, "D-"), (0, "F"),
+]
+# Rubric bands scaled to /100: 18-20, 15-17, 12-14, 9-11, 0-8
+PERFORMANCE_LEVELS = [(90, "EXCEPTIONAL"), (75, "PROFICIENT"), (60, "DEVELOPING"), (45, "EMERGING"), (0, "INADEQUATE")]
+
+_CRITERION_FIELDS = ("SCORE", "COMMENT", "STRENGTH", "IMPROVEMENT", "ORIGINAL", "REVISED", "WHY",
+                     "IMMEDIATE ACTION", "SKILL BUILDING", "RESOURCE", "GROWTH")
+
+_CRITERION_FORMAT = (
+    "📋 RESPONSE FORMAT:\n"
+    "Grade ONLY this criterion; the other rubric criteria are graded separately. "
+    "Reply with exactly these labelled lines and nothing else:\n\n"
+    "SCORE: [X]/20\n"
+    "COMMENT: [Specific explanation with text examples]\n"
+    "STRENGTH: [One specific accomplishment for this criterion, with a quoted example]\n"
+    "IMPROVEMENT: [The most impactful improvement for this criterion and why it matters]\n"
+    "ORIGINAL: \"[Quote from essay that shows the problem]\"\n"
+    "REVISED: \"[Your improved version]\"\n"
+    "WHY: [Brief explanation of improvement]\n"
+    "IMMEDIATE ACTION: [One specific revision strategy for this essay]\n"
+    "SKILL BUILDING: [One practice exercise for future essays]\n"
+    "RESOURCE: [Specific writing resource, technique, or area of study]\n"
+    "GROWTH: [Progress indicators for this criterion and what to focus on next]\n\n"
+)
+
+
+def build_criterion_prompt(level: str, criterion: str) -> str:
+    return (
+        f"You are an expert writing instructor with 15+ years of experience grading student essays. {LEVEL_INSTRUCTIONS[level]}\n\n"
+        + _FRAMEWORK
+        + "📊 RUBRIC CRITERION (scored out of 20 points):\n\n"
+        + RUBRIC[criterion]
+        + _CRITERION_FORMAT
+        + _GRADING_PRINCIPLES
+    )
+
+
+def _parse_criterion(text: str) -> dict:
+    fields = {}
+    for line in (text or "").splitlines():
+        match = re.match(r"^\W*(" + "|".join(_CRITERION_FIELDS) + r")\W*:\**\s*(.*)$", line.strip(), re.IGNORECASE)
+        if match:
+            fields[match.group(1).upper()] = match.group(2).strip().strip("*").strip()
+    match = re.search(_NUMBER + r"\s*/\s*20", fields.get("SCORE", ""))
+    fields["SCORE"] = min(max(float(match.group(1)), 0.0), 20.0) if match else None
+    return fields
+
+
+def letter_grade(score: float) -> str:
+    return next(letter for cutoff, letter in LETTER_GRADES if score >= cutoff)
+
+
+def performance_level(score: float) -> str:
+    return next(name for cutoff, name in PERFORMANCE_LEVELS if score >= cutoff)
+
+
+def merge_criterion_feedback(results: dict) -> str:
+    """Assemble per-criterion replies into the full ENHANCED RESPONSE FORMAT layout."""
+    total = sum(result["SCORE"] for result in results.values())
+    ranked = sorted(results, key=lambda key: results[key]["SCORE"])
+    weakest, strongest = results[ranked[0]], ranked[-1]
+
+    def fmt(score):
+        return f"{score:g}"
+
+    lines = [
+        "## 🎯 OVERALL GRADE",
+        f"**Score: {fmt(total)}/100 | Letter Grade: {letter_grade(total)} | Performance Level: {performance_level(total)}**",
+        "",
+        "## 📊 COMPREHENSIVE BREAKDOWN",
+    ]
+    lines += [f"• **{CRITERIA[key]}:** {fmt(results[key]['SCORE'])}/20 - {results[key].get('COMMENT', '')}" for key in CRITERIA]
+    lines += ["", "## 💪 NOTABLE STRENGTHS"]
+    lines += [f"- **{CRITERIA[key]}:** {results[key]['STRENGTH']}" for key in reversed(ranked[-3:]) if results[key].get("STRENGTH")]
+    lines += ["", "## 🎯 PRIORITY IMPROVEMENT AREAS"]
+    lines += [
+        f"{rank}. **{CRITERIA[key]} ({fmt(results[key]['SCORE'])}/20):** {results[key]['IMPROVEMENT']}"
+        for rank, key in enumerate((key for key in ranked[:3] if results[key].get("IMPROVEMENT")), start=1)
+    ]
+    lines += ["", "## ✏️ CONCRETE REVISION EXAMPLES"]
+    for key in ranked[:4]:
+        result = results[key]
+        if result.get("ORIGINAL") and result.get("REVISED"):
+            lines += [
+                f"**{CRITERIA[key]}**",
+                f"- ORIGINAL: {result['ORIGINAL']}",
+                f"- REVISED: {result['REVISED']}",
+                f"- WHY: {result.get('WHY', '')}",
+                "",
+            ]
+    if lines[-1]:
+        lines.append("")
+    lines += [
+        "## 🚀 ACTIONABLE NEXT STEPS",
+        f"1. **Immediate Action:** {weakest.get('IMMEDIATE ACTION', '')}",
+        f"2. **Skill Building:** {weakest.get('SKILL BUILDING', '')}",
+        f"3. **Resource:** {weakest.get('RESOURCE', '')}",
+        "",
+        "## 📈 GROWTH TRACKING",
+        f"Strongest area: **{CRITERIA[strongest]}** ({fmt(results[strongest]['SCORE'])}/20). "
+        f"Focus next on **{CRITERIA[ranked[0]]}** ({fmt(weakest['SCORE'])}/20). {weakest.get('GROWTH', '')}".rstrip(),
+    ]
+    return "\n".join(lines)
+
+
+def grade_essay_by_criteria(essay_text: str, level: str, timeout: float = REQUEST_TIMEOUT, hedger=None, slot=None) -> Feedback:
+    """Grade each rubric criterion as its own concurrent request and merge the replies.
+
+    Each request only writes one criterion's share of the feedback, so the
+    essay takes about as long as the slowest criterion instead of one long
+    completion. ``slot`` returns a context manager wrapped around each request
+    (e.g. a limiter slot); any failed criterion fails the whole essay.
+    """
+    def grade_criterion(criterion):
+        with slot() if slot else nullcontext():
+            reply = _complete(build_criterion_prompt(level, criterion), essay_text, timeout, hedger)
+        result = _parse_criterion(reply.text)
+        if result["SCORE"] is None:
+            raise GradingError(f"No score found in the {CRITERIA[criterion]} reply")
+        return result, reply
+
+    pool = ThreadPoolExecutor(max_workers=len(RUBRIC), thread_name_prefix="criterion")
+    # Each request runs in a copy of the caller's context, so its spans land in the caller's run profile
+    futures = {pool.submit(contextvars.copy_context().run, grade_criterion, criterion): criterion for criterion in RUBRIC}
+    results, replies = {}, []
+    try:
+        for future in as_completed(futures):
+            try:
+                results[futures[future]], reply = future.result()
+            except GradingError as e:
+                raise GradingError(f"{CRITERIA[futures[future]]}: {e}") from e
+            replies.append(reply)
+    finally:
+        # Don't wait on sibling requests once one criterion has failed
+        pool.shutdown(wait=False, cancel_futures=True)
+    return Feedback(
+        text=merge_criterion_feedback({key: results[key] for key in RUBRIC}),
+        model=replies[0].model,
+        prompt_tokens=sum(reply.prompt_tokens for reply in replies),
+        completion_tokens=sum(reply.completion_tokens for reply in replies),
+        started_at=min(reply.started_at for reply in replies),
+        finished_at=max(reply.finished_at for reply in replies),
+        fallback=next((reply.fallback for reply in replies if reply.fallback), "")
+    )
+
+
+# ----------- REVISION GRADING ----------- #
+_REVISION_BRIEF = (
+    "🔄 REVISION REVIEW:\n"
+    "The student has revised an essay you already graded. You are given your previous feedback and ONLY the paragraphs "
+    "that changed; every other paragraph is identical to the earlier draft and keeps its earlier assessment. "
+    "Re-score every criterion: keep a criterion's previous score unless the changes affect it, credit revisions that "
+    "address your earlier improvement areas, and lower a score if a change made the essay weaker.\n\n"
+)
+
+_REVISION_FORMAT = (
+    "📋 REVISION RESPONSE FORMAT:\n"
+    "Reply with exactly this structure, commenting only on what changed:\n\n"
+
+    "## 🎯 OVERALL GRADE\n"
+    "**Score: [X]/100 | Letter Grade: [X] | Performance Level: [EXCEPTIONAL/PROFICIENT/DEVELOPING/EMERGING/INADEQUATE]**\n\n"
+
+    "## 📊 COMPREHENSIVE BREAKDOWN\n"
+    + "".join(f"• **{label}:** [X]/20 - [What the revision changed for this criterion, or 'Unchanged']\n" for label in CRITERIA.values())
+    + "\n## 🔄 REVISION REVIEW\n"
+    "[One or two sentences per changed paragraph: what improved and what still needs work, quoting the revised text]\n\n"
+
+    "## 🚀 NEXT STEPS\n"
+    "[The one or two most impactful improvements that remain]\n\n"
+)
+
+
+def build_revision_prompt(level: str) -> str:
+    # No benchmark or full rubric text: the previous feedback already anchors every score
+    return (
+        f"You are an expert writing instructor with 15+ years of experience grading student essays. {LEVEL_INSTRUCTIONS[level]}\n\n"
+        + _REVISION_BRIEF
+        + "📊 RUBRIC CRITERIA (each scored out of 20 points; 18-20 EXCEPTIONAL, 15-17 PROFICIENT, 12-14 DEVELOPING, "
+        + "9-11 EMERGING, 0-8 INADEQUATE): "
+        + ", ".join(CRITERIA.values()) + "\n\n"
+        + _REVISION_FORMAT
+        + _GRADING_SCALE
+    )
+
+
+def split_paragraphs(text: str) -> list:
+    paragraphs = [paragraph.strip() for paragraph in re.split(r"\n\s*\n", text or "") if paragraph.strip()]
+    if len(paragraphs) == 1:
+        # Pasted text often separates paragraphs with single line breaks
+        paragraphs = [line.strip() for line in paragraphs[0].splitlines() if line.strip()]
+    return paragraphs
+
+
+def diff_paragraphs(previous: str, revised: str) -> dict:
+    """Paragraph-level diff of two drafts; whitespace-only edits don't count as changes.
+
+    Each change is ``{"kind": "revised" | "added" | "removed", "before", "after",
+    "paragraph"}``, where ``paragraph`` is the 1-based position in the revised
+    draft (in the earlier draft for removed paragraphs).
+    """
+    old, new = split_paragraphs(previous), split_paragraphs(revised)
+    matcher = difflib.SequenceMatcher(None, [" ".join(p.split()) for p in old], [" ".join(p.split()) for p in new], autojunk=False)
+    changes = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        for offset in range(max(i2 - i1, j2 - j1)):
+            before = old[i1 + offset] if i1 + offset < i2 else ""
+            after = new[j1 + offset] if j1 + offset < j2 else ""
+            kind = "revised" if before and after else "added" if after else "removed"
+            changes.append({"kind": kind, "before": before, "after": after,
+                            "paragraph": (j1 if after else i1) + offset + 1})
+    return {"changes": changes, "paragraphs": len(new), "previous_paragraphs": len(old),
+            "changed_share": len(changes) / max(len(old), len(new), 1)}
+
+
+# Earlier-feedback sections a re-score doesn't need: praise, rewrites of old text, and the sampling report
+_PRIOR_SECTIONS_SKIPPED = ("NOTABLE STRENGTHS", "CONCRETE REVISION EXAMPLES", "GROWTH TRACKING", "CONSISTENCY CHECK")
+
+
+def prior_feedback_summary(feedback: str) -> str:
+    """The grade, score breakdown, improvement areas and next steps of earlier feedback."""
+    sections = re.split(r"\n(?=## )", feedback.strip())
+    return "\n\n".join(
+        section.strip() for section in sections
+        if not any(name in section.split("\n", 1)[0].upper() for name in _PRIOR_SECTIONS_SKIPPED)
+    )
+
+
+def revision_message(previous_feedback: str, diff: dict) -> str:
+    lines = [
+        "PREVIOUS FEEDBACK (earlier draft):",
+        prior_feedback_summary(previous_feedback),
+        "",
+        f"REVISION: {len(diff['changes'])} paragraph change(s); the revised essay has {diff['paragraphs']} paragraphs "
+        f"and all others are unchanged.",
+    ]
+    for change in diff["changes"]:
+        if change["kind"] == "removed":
+            lines += ["", f"### Earlier paragraph {change['paragraph']} (removed)", f"BEFORE: {change['before']}"]
+            continue
+        lines += ["", f"### Paragraph {change['paragraph']} ({change['kind']})"]
+        if change["before"]:
+            lines.append(f"BEFORE: {change['before']}")
+        lines.append(f"AFTER: {change['after']}")
+    return "\n".join(lines)
+
+
+def grade_essay_revision(essay_text: str, level: str, previous_essay: str, previous_feedback: str,
+                         timeout: float = REQUEST_TIMEOUT, hedger=None, diff: dict = None,
+                         max_tokens: int = REVISION_MAX_TOKENS) -> Feedback:
+    """Updated score and targeted feedback for a revised draft, from the earlier feedback plus only the changed paragraphs."""
+    diff = diff or diff_paragraphs(previous_essay, essay_text)
+    feedback = _complete(build_revision_prompt(level), revision_message(previous_feedback, diff), timeout, hedger,
+                         max_tokens=max_tokens)
+    feedback.revision = {"changed": len(diff["changes"]), "paragraphs": diff["paragraphs"]}
+    return feedback
+
+
+# ----------- FEEDBACK PARSING ----------- #
+_NUMBER = r"\[?(\d+(?:\.\d+)?)\]?"
+
+
+def parse_scores(feedback: str) -> dict:
+    """Pull the overall score, letter grade and criterion scores out of the feedback markdown.
+
+    Missing values come back as None rather than raising, since the model
+    doesn't always follow the response format exactly.
+    """
+    scores = {"overall": None, "letter_grade": None}
+    scores.update({key: None for key in CRITERIA})
+    if not feedback:
+        return scores
+    match = re.search(r"Score:\**\s*" + _NUMBER + r"\s*/\s*100", feedback)
+    if match:
+        scores["overall"] = float(match.group(1))
+    match = re.search(r"Letter Grade:\**\s*\[?([A-F][+-]?)", feedback)
+    if match:
+        scores["letter_grade"] = match.group(1)
+    for key, label in CRITERIA.items():
+        match = re.search(re.escape(label) + r"[:*\s]*" + _NUMBER + r"\s*/\s*20", feedback)
+        if match:
+            scores[key] = float(match.group(1))
+    return scores
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# ----------- HEDGING CONFIGURATION ----------- #
+# Send a duplicate request once the primary is slower than this latency percentile
+HEDGE_PERCENTILE = float(os.getenv("GRADING_HEDGE_PERCENTILE", "0.9"))
+# Cap on duplicate requests as a fraction of all requests (extra spend ceiling)
+HEDGE_BUDGET = float(os.getenv("GRADING_HEDGE_BUDGET", "0.1"))
+# Don't hedge until enough latencies are observed to trust the percentile
+HEDGE_MIN_SAMPLES = int(os.getenv("GRADING_HEDGE_MIN_SAMPLES", "20"))
+# Limiter session that duplicate requests are counted under
+HEDGE_SESSION = "hedge"
+
+
+class LatencyTracker:
+    """Rolling window of successful request latencies."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(int(p * len(samples)), len(samples) - 1)
+        return samples[index]
+
+
+class Hedger:
+    """Races a duplicate request against stragglers, within a spend budget.
+
+    Shared process-wide so the latency percentile reflects every session's
+    traffic. The losing request can't be aborted mid-flight, so each hedge is
+    billed; ``budget`` bounds hedges to that fraction of all requests. With a
+    ``limiter`` a hedge only goes out if a bulk slot is free right now, and that
+    slot is held until both requests finish, so duplicates and losers never
+    push in-flight requests past the limiter's capacity.
+    """
+
+    def __init__(self, percentile: float = HEDGE_PERCENTILE, budget: float = HEDGE_BUDGET,
+                 min_samples: int = HEDGE_MIN_SAMPLES, max_workers: int = 32, limiter=None):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.limiter = limiter
+        self.latencies = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.skipped_busy = 0
+
+    def hedge_delay(self):
+        if len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(self.percentile)
+
+    def _submit(self, fn):
+        started = time.monotonic()
+        future = self._executor.submit(fn)
+
+        def _record(done):
+            if not done.cancelled() and done.exception() is None:
+                self.latencies.record(time.monotonic() - started)
+
+        future.add_done_callback(_record)
+        return future
+
+    def _may_hedge(self):
+        """The limiter ticket for a hedge (True without a limiter), or None if the budget or the slots are used up."""
+        with self._lock:
+            if self.hedged + 1 > self.budget * self.requests:
+                return None
+            ticket = True
+            if self.limiter is not None:
+                ticket = self.limiter.try_acquire(HEDGE_SESSION)
+                if ticket is None:
+                    self.skipped_busy += 1
+                    return None
+            self.hedged += 1
+            return ticket
+
+    def _release_after(self, ticket, futures: list):
+        # The caller's slot is freed as soon as one request wins; this one covers the loser until it finishes
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def _done(_):
+            with lock:
+                remaining[0] -= 1
+                last = not remaining[0]
+            if last:
+                self.limiter.release(ticket, record=False)
+
+        for future in futures:
+            future.add_done_callback(_done)
+
+    def call(self, fn):
+        with self._lock:
+            self.requests += 1
+        delay = self.hedge_delay()
+        primary = self._submit(fn)
+        if delay is None:
+            return primary.result()
+        wait([primary], timeout=delay)
+        if primary.done():
+            return primary.result()
+        ticket = self._may_hedge()
+        if ticket is None:
+            return primary.result()
+
+        backup = self._submit(fn)
+        if self.limiter is not None:
+            self._release_after(ticket, [primary, backup])
+        done, _ = wait([primary, backup], return_when=FIRST_COMPLETED)
+        first = primary if primary in done else backup
+        if first.exception() is not None:
+            # The first to finish failed; the other one is our only chance
+            first = backup if first is primary else primary
+            wait([first])
+        if first is backup and backup.exception() is None:
+            with self._lock:
+                self.hedge_wins += 1
+        return first.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests, hedged, wins, skipped = self.requests, self.hedged, self.hedge_wins, self.skipped_busy
+        return {
+            "requests": requests,
+            "hedged": hedged,
+            "hedge_wins": wins,
+            "skipped_busy": skipped,
+            "extra_spend": hedged / requests if requests else 0.0,
+            "hedge_delay": self.hedge_delay(),
+        }
@@ -0,0 +1,267 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+
+from grading import (CRITERIA, GRADING_MODEL, REVISION_MAX_CHANGED, Feedback, diff_paragraphs, grade_essay_revision,
+                     grade_essay_scores_only, grade_essay_with_feedback, parse_scores)
+
+# ----------- HISTORY CONFIGURATION ----------- #
+HISTORY_DB_PATH = os.getenv("GRADING_HISTORY_DB", "grading_history.db")
+# How long a graded essay can be reused for an identical resubmission; 0 turns the result cache off
+RESULT_CACHE_TTL = float(os.getenv("GRADING_RESULT_CACHE_TTL_HOURS", "168")) * 3600
+
+# What kind of output a row holds, so a scores-only triage never answers a full-feedback request
+FULL = "full"
+SCORES = "scores"
+GRADERS = {FULL: grade_essay_with_feedback, SCORES: grade_essay_scores_only}
+# Targeted feedback on the changed paragraphs of a resubmission (never served by the result cache for FULL)
+REVISION = "revision"
+
+SCORE_COLUMNS = ["overall_score", "letter_grade"] + [f"{key}_score" for key in CRITERIA]
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS graded_essays (
+    id INTEGER PRIMARY KEY,
+    student_id TEXT NOT NULL DEFAULT '',
+    assignment_id TEXT NOT NULL DEFAULT '',
+    level TEXT NOT NULL,
+    model TEXT NOT NULL,
+    graded_at REAL NOT NULL,
+    essay TEXT NOT NULL,
+    feedback TEXT NOT NULL,
+    essay_hash TEXT,
+    mode TEXT NOT NULL DEFAULT 'full',
+    requested_model TEXT,
+    overall_score REAL,
+    letter_grade TEXT,
+    {", ".join(f"{key}_score REAL" for key in CRITERIA)}
+);
+CREATE INDEX IF NOT EXISTS idx_graded_student ON graded_essays (student_id, assignment_id, graded_at);
+CREATE INDEX IF NOT EXISTS idx_graded_assignment ON graded_essays (assignment_id, graded_at);
+
+-- External-content FTS index so essay/feedback text isn't stored twice
+CREATE VIRTUAL TABLE IF NOT EXISTS graded_essays_fts USING fts5 (
+    essay, feedback, content='graded_essays', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS graded_essays_ai AFTER INSERT ON graded_essays BEGIN
+    INSERT INTO graded_essays_fts (rowid, essay, feedback) VALUES (new.id, new.essay, new.feedback);
+END;
+CREATE TRIGGER IF NOT EXISTS graded_essays_ad AFTER DELETE ON graded_essays BEGIN
+    INSERT INTO graded_essays_fts (graded_essays_fts, rowid, essay, feedback) VALUES ('delete', old.id, old.essay, old.feedback);
+END;
+CREATE TRIGGER IF NOT EXISTS graded_essays_au AFTER UPDATE ON graded_essays BEGIN
+    INSERT INTO graded_essays_fts (graded_essays_fts, rowid, essay, feedback) VALUES ('delete', old.id, old.essay, old.feedback);
+    INSERT INTO graded_essays_fts (rowid, essay, feedback) VALUES (new.id, new.essay, new.feedback);
+END;
+"""
+
+# Columns added after the first release; older databases get them on open
+_ADDED_COLUMNS = {"essay_hash": "TEXT", "mode": "TEXT NOT NULL DEFAULT 'full'", "requested_model": "TEXT"}
+# Keyed on the model that was asked for: ``model`` holds the dated version that answered (gpt-4o-2024-08-06)
+_CACHE_INDEX = "CREATE INDEX IF NOT EXISTS idx_graded_result_cache ON graded_essays (essay_hash, level, mode, requested_model, graded_at)"
+# Superseded by idx_graded_result_cache
+_DROPPED_INDEXES = ("idx_graded_cache",)
+
+_SUMMARY_COLUMNS = "id, student_id, assignment_id, level, model, graded_at, " + ", ".join(SCORE_COLUMNS)
+
+
+def _fts_query(text: str) -> str:
+    # Quote every term so user input can't trip FTS5 query syntax (quotes, AND/OR, colons)
+    return " ".join('"' + term.replace('"', '""') + '"' for term in text.split())
+
+
+def essay_hash(essay: str) -> str:
+    # Whitespace-insensitive, so a re-pasted essay with a stray trailing newline still matches
+    return hashlib.sha256(" ".join(essay.split()).encode("utf-8")).hexdigest()
+
+
+def result_mode(kind: str = FULL, samples: int = 1) -> str:
+    # Consistency sampling adds a section to the report, so it's cached separately per sample count
+    return kind if samples <= 1 else f"{kind}x{samples}"
+
+
+class HistoryStore:
+    """Persistent SQLite record of every graded essay, searchable by ID and full text.
+
+    One connection is shared across threads (batch workers, Streamlit sessions)
+    behind a lock; WAL mode keeps readers from blocking the writer.
+    """
+
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(graded_essays)")}
+            for column, definition in _ADDED_COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE graded_essays ADD COLUMN {column} {definition}")
+            for index in _DROPPED_INDEXES:
+                self._conn.execute(f"DROP INDEX IF EXISTS {index}")
+            self._conn.execute(_CACHE_INDEX)
+
+    def record(self, essay: str, feedback: str, level: str, model: str = GRADING_MODEL,
+               student_id: str = "", assignment_id: str = "", graded_at: float = None, mode: str = FULL,
+               requested_model: str = GRADING_MODEL) -> int:
+        scores = parse_scores(feedback)
+        values = {
+            "student_id": student_id or "",
+            "assignment_id": assignment_id or "",
+            "level": level,
+            "model": model,
+            "graded_at": graded_at or time.time(),
+            "essay": essay,
+            "feedback": feedback,
+            "essay_hash": essay_hash(essay),
+            "mode": mode,
+            "requested_model": requested_model,
+            "overall_score": scores["overall"],
+            "letter_grade": scores["letter_grade"],
+        }
+        values.update({f"{key}_score": scores[key] for key in CRITERIA})
+        columns = ", ".join(values)
+        placeholders = ", ".join(f":{name}" for name in values)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(f"INSERT INTO graded_essays ({columns}) VALUES ({placeholders})", values)
+        return cursor.lastrowid
+
+    def cached(self, essay: str, level: str, mode: str = FULL, model: str = GRADING_MODEL, max_age: float = RESULT_CACHE_TTL):
+        """Latest feedback for an identical essay graded the same way within ``max_age`` seconds, or None.
+
+        ``model`` is the model requested, not the (often dated) one the response named.
+        """
+        if max_age <= 0:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, model, feedback FROM graded_essays "
+                "WHERE essay_hash = ? AND level = ? AND mode = ? AND requested_model = ? AND graded_at >= ? "
+                "ORDER BY graded_at DESC LIMIT 1",
+                (essay_hash(essay), level, mode, model, time.time() - max_age)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def previous_submission(self, student_id: str, assignment_id: str, level: str):
+        """The student's latest draft for this assignment graded with feedback at ``level``, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, model, graded_at, essay, feedback, mode, overall_score FROM graded_essays "
+                "WHERE student_id = ? AND assignment_id = ? AND level = ? AND mode NOT LIKE 'scores%' "
+                "ORDER BY graded_at DESC LIMIT 1",
+                (student_id, assignment_id, level)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def lookup(self, student_id: str = "", assignment_id: str = "", limit: int = 50) -> list:
+        """Most recent essays for a student and/or assignment, served from the indexes."""
+        clauses, params = [], []
+        if student_id:
+            clauses.append("student_id = ?")
+            params.append(student_id)
+        if assignment_id:
+            clauses.append("assignment_id = ?")
+            params.append(assignment_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_SUMMARY_COLUMNS} FROM graded_essays {where} ORDER BY graded_at DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def search(self, text: str, student_id: str = "", assignment_id: str = "", limit: int = 50) -> list:
+        """Full-text search over essay and feedback, best matches first."""
+        query = _fts_query(text)
+        if not query:
+            return self.lookup(student_id, assignment_id, limit)
+        clauses, params = ["graded_essays_fts MATCH ?"], [query]
+        if student_id:
+            clauses.append("g.student_id = ?")
+            params.append(student_id)
+        if assignment_id:
+            clauses.append("g.assignment_id = ?")
+            params.append(assignment_id)
+        summary = ", ".join(f"g.{column.strip()}" for column in _SUMMARY_COLUMNS.split(","))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {summary}, snippet(graded_essays_fts, -1, '**', '**', ' … ', 16) AS snippet "
+                f"FROM graded_essays_fts JOIN graded_essays g ON g.id = graded_essays_fts.rowid "
+                f"WHERE {' AND '.join(clauses)} ORDER BY bm25(graded_essays_fts) LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, essay_id: int):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM graded_essays WHERE id = ?", (essay_id,)).fetchone()
+        return dict(row) if row else None
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM graded_essays").fetchone()[0]
+
+
+# ----------- GRADING ----------- #
+def _revise(essay: str, grade_level: str, previous: dict, hedger=None, slot=None):
+    """Feedback and history mode for a resubmission of ``previous``, or None when it needs a full regrade."""
+    diff = diff_paragraphs(previous["essay"], essay)
+    if diff["changed_share"] > REVISION_MAX_CHANGED:
+        return None
+    revision = {"previous_id": previous["id"], "previous_graded_at": previous["graded_at"],
+                "previous_score": previous["overall_score"], "paragraphs": diff["paragraphs"]}
+    if not diff["changes"]:
+        # Only whitespace changed: the earlier feedback still stands, no request needed
+        now = time.time()
+        feedback = Feedback(previous["feedback"], model=previous["model"], started_at=now, finished_at=now, cached=True)
+        feedback.revision = dict(revision, changed=0)
+        return feedback, previous["mode"]
+    with slot() if slot else nullcontext():
+        feedback = grade_essay_revision(essay, grade_level, previous["essay"], previous["feedback"], hedger=hedger, diff=diff)
+    feedback.revision.update(revision)
+    return feedback, REVISION
+
+
+def grade_and_record(essay: str, grade_level: str, history: HistoryStore, student_id: str = "", assignment_id: str = "", hedger=None,
+                     grade_fn=grade_essay_with_feedback, mode: str = FULL, reuse: bool = False, revision: bool = False,
+                     slot=None) -> Feedback:
+    """Grade one essay and save it to history; shared by the Streamlit app and the HTTP API.
+
+    With ``reuse``, an identical essay already graded at this level in this
+    ``mode`` is answered from history without an API call (zero tokens) and
+    recorded again under the new student and assignment. With ``revision``, a
+    resubmission is graded against the same student's latest draft for the
+    assignment: only the earlier feedback and the changed paragraphs are sent.
+    Without an earlier draft, or when more than ``REVISION_MAX_CHANGED`` of the
+    paragraphs changed, ``grade_fn`` grades it in full as usual. ``slot`` returns
+    a context manager held around the revision request, for callers whose
+    ``grade_fn`` takes its own limiter slots rather than running inside one.
+    """
+    hit = history.cached(essay, grade_level, mode) if reuse else None
+    revised = None
+    if hit is None and revision and student_id and assignment_id:
+        previous = history.previous_submission(student_id, assignment_id, grade_level)
+        if previous is not None:
+            revised = _revise(essay, grade_level, previous, hedger, slot)
+    if hit is not None:
+        now = time.time()
+        feedback = Feedback(hit["feedback"], model=hit["model"], started_at=now, finished_at=now, cached=True)
+    elif revised is not None:
+        feedback, mode = revised
+    else:
+        feedback = grade_fn(essay, grade_level, hedger=hedger)
+    try:
+        # A fallback's answer is recorded under its endpoint, so it never answers a request for the primary model
+        history.record(essay, feedback.text, grade_level, model=feedback.model, student_id=student_id, assignment_id=assignment_id,
+                       mode=mode, requested_model=feedback.fallback or GRADING_MODEL)
+    except sqlite3.Error as e:
+        # The essay is graded (and billed); losing the history row shouldn't fail it
+        logging.getLogger(__name__).warning("Could not save graded essay to history: %s", e)
+    return feedback
@@ -0,0 +1,150 @@
+import multiprocessing
+import os
+import re
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from xml.etree import ElementTree
+
+# ----------- INGEST CONFIGURATION ----------- #
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".docx")
+INGEST_WORKERS = int(os.getenv("GRADING_INGEST_WORKERS", str(min(os.cpu_count() or 1, 4))))
+# Refuse oversized members rather than inflating a zip bomb into memory
+MAX_MEMBER_BYTES = 20 * 1024 * 1024
+
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# Moodle: "Full Name_123456_assignsubmission_file_"; Canvas: "doejane_LATE_12345_67890_essay"
+_LMS_NAME = re.compile(r"^(.+?)_(?:LATE_)?\d+_(?:assignsubmission_|\d+_)")
+
+
+class IngestError(Exception):
+    """Raised when a submission file can't be turned into essay text."""
+
+
+# ----------- TEXT EXTRACTION ----------- #
+def _decode_text(data: bytes) -> str:
+    for encoding in ("utf-8-sig", "cp1252"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("latin-1")
+
+
+def _docx_text(data: bytes) -> str:
+    # A .docx is itself a zip; stream word/document.xml and keep only run text
+    try:
+        with zipfile.ZipFile(BytesIO(data)) as docx, docx.open("word/document.xml") as document:
+            paragraphs, runs = [], []
+            for _, element in ElementTree.iterparse(document, events=("end",)):
+                if element.tag == f"{_WORD_NS}t":
+                    runs.append(element.text or "")
+                elif element.tag == f"{_WORD_NS}tab":
+                    runs.append("\t")
+                elif element.tag in (f"{_WORD_NS}br", f"{_WORD_NS}cr"):
+                    runs.append("\n")
+                elif element.tag == f"{_WORD_NS}p":
+                    paragraphs.append("".join(runs))
+                    runs = []
+                    element.clear()
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise IngestError(f"not a readable .docx file ({e})") from e
+    return "\n\n".join(paragraph for paragraph in paragraphs if paragraph.strip())
+
+
+def extract_text(filename: str, data: bytes) -> str:
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".docx":
+        return _docx_text(data)
+    if extension in (".txt", ".md"):
+        return _decode_text(data).strip()
+    raise IngestError(f"unsupported file type '{extension}'")
+
+
+def student_id_from_filename(path: str) -> str:
+    """Best-effort student ID from an LMS export path.
+
+    Moodle names each student's folder (or, without folders, each file)
+    ``Full Name_123456_assignsubmission_file_`` and Canvas names files
+    ``doejane_12345_67890_essay.docx``; both reduce to the name before the
+    numeric IDs. The path segment closest to the file that follows one of these
+    patterns wins, so wrapping folders (``submissions/``) are ignored. Anything
+    else falls back to the file name without its extension.
+    """
+    parts = [part for part in path.replace("\\", "/").split("/") if part]
+    stem = os.path.splitext(parts[-1])[0]
+    for segment in [stem] + parts[-2::-1]:
+        match = _LMS_NAME.match(segment)
+        if match:
+            return match.group(1).strip()
+    return stem.strip()
+
+
+def _extract_member(filename: str, data: bytes) -> tuple:
+    # Runs in a worker process; errors come back as values so one bad file can't sink the upload
+    try:
+        return extract_text(filename, data), ""
+    except IngestError as e:
+        return "", str(e)
+
+
+# ----------- ZIP INGESTION ----------- #
+def _is_submission(info: zipfile.ZipInfo) -> bool:
+    name = os.path.basename(info.filename)
+    return not (info.is_dir() or info.filename.startswith("__MACOSX/") or name.startswith((".", "~$")))
+
+
+def read_zip_submissions(zip_source, workers: int = INGEST_WORKERS) -> tuple:
+    """Extract essay text from every supported file in an LMS export ZIP.
+
+    Members are read one at a time and parsed in a process pool with a bounded
+    number in flight, so the archive is never unpacked into memory all at once.
+    Returns ``(submissions, skipped)``: submissions are dicts with ``student_id``,
+    ``essay`` and ``filename`` in archive order; skipped is ``(filename, reason)`` pairs.
+    """
+    submissions, skipped = [], []
+    try:
+        archive = zipfile.ZipFile(zip_source)
+    except zipfile.BadZipFile as e:
+        raise IngestError(f"not a valid ZIP file ({e})") from e
+    # Spawned, not forked: forking a multithreaded server (Streamlit, uvicorn) can deadlock the child
+    with archive, ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = []
+
+        def collect(oldest):
+            filename, future = oldest
+            text, error = future.result()
+            if error:
+                skipped.append((filename, error))
+            elif not text.strip():
+                skipped.append((filename, "no text found"))
+            else:
+                submissions.append({"student_id": student_id_from_filename(filename), "essay": text, "filename": filename})
+
+        for info in archive.infolist():
+            if not _is_submission(info):
+                continue
+            if not info.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                skipped.append((info.filename, "unsupported file type"))
+                continue
+            if info.file_size > MAX_MEMBER_BYTES:
+                skipped.append((info.filename, "file too large"))
+                continue
+            try:
+                with archive.open(info) as member:
+                    data = member.read(MAX_MEMBER_BYTES + 1)
+            except RuntimeError:
+                # zipfile raises RuntimeError for members that need a password
+                skipped.append((info.filename, "encrypted file"))
+                continue
+            except (zipfile.BadZipFile, zlib.error, OSError) as e:
+                skipped.append((info.filename, f"unreadable file ({e})"))
+                continue
+            pending.append((info.filename, pool.submit(_extract_member, info.filename, data)))
+            # Cap queued member bytes; results are collected in archive order
+            if len(pending) >= workers * 2:
+                collect(pending.pop(0))
+        for oldest in pending:
+            collect(oldest)
+    return submissions, skipped
@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+
+from hedging import LatencyTracker
+
+# ----------- LIMITER CONFIGURATION ----------- #
+# Total grading requests in flight across every session on this server (one shared API key)
+MAX_IN_FLIGHT = int(os.getenv("GRADING_MAX_CONCURRENCY", "8"))
+# Slots bulk work may never take, so an interactive request doesn't wait out a long batch call
+INTERACTIVE_RESERVED = int(os.getenv("GRADING_INTERACTIVE_RESERVED", "1"))
+
+# Priority lanes, highest first
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+
+class SlotCancelled(Exception):
+    """Raised when a queued request is withdrawn before it got a slot."""
+
+
+class _Ticket:
+    __slots__ = ("session_id", "lane", "granted", "queued_at", "granted_at")
+
+    def __init__(self, session_id: str, lane: str):
+        self.session_id = session_id
+        self.lane = lane
+        self.granted = False
+        self.queued_at = time.monotonic()
+        self.granted_at = None
+
+
+class FairShareLimiter:
+    """Caps in-flight requests process-wide and hands out free slots by lane, then round-robin per session.
+
+    Interactive requests (a teacher waiting on one essay) always take the next
+    free slot ahead of bulk rows, and ``reserved`` slots are kept free of bulk
+    work so they rarely wait at all. Within a lane each session gets its own
+    FIFO queue and freed slots rotate between sessions, so a 1,000-row batch
+    only takes every other slot once a second teacher starts grading.
+    """
+
+    def __init__(self, capacity: int = MAX_IN_FLIGHT, reserved: int = INTERACTIVE_RESERVED):
+        self.capacity = capacity
+        self.reserved = min(reserved, capacity - 1)
+        self._cond = threading.Condition()
+        # Per lane, insertion order is the round-robin turn order
+        self._waiting = {lane: OrderedDict() for lane in LANES}
+        self._in_flight = 0
+        self._in_flight_by_session = Counter()
+        # Queue wait and end-to-end (wait + request) latency per lane
+        self._wait_latency = {lane: LatencyTracker() for lane in LANES}
+        self._total_latency = {lane: LatencyTracker() for lane in LANES}
+
+    # ----------- Scheduling ----------- #
+    def _lane_capacity(self, lane: str) -> int:
+        return self.capacity if lane == INTERACTIVE else self.capacity - self.reserved
+
+    def _next_ticket(self):
+        for lane in LANES:
+            if self._waiting[lane] and self._in_flight < self._lane_capacity(lane):
+                waiting = self._waiting[lane]
+                session_id, queue = waiting.popitem(last=False)
+                ticket = queue.popleft()
+                if queue:
+                    # Back of the rotation until every other waiting session has had a turn
+                    waiting[session_id] = queue
+                return ticket
+        return None
+
+    def _dispatch(self):
+        ticket = self._next_ticket()
+        while ticket is not None:
+            ticket.granted = True
+            ticket.granted_at = time.monotonic()
+            self._wait_latency[ticket.lane].record(ticket.granted_at - ticket.queued_at)
+            self._in_flight += 1
+            self._in_flight_by_session[ticket.session_id] += 1
+            ticket = self._next_ticket()
+        self._cond.notify_all()
+
+    def _withdraw(self, ticket: _Ticket):
+        waiting = self._waiting[ticket.lane]
+        queue = waiting.get(ticket.session_id)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del waiting[ticket.session_id]
+
+    def _position(self, session_id: str, lane: str) -> int:
+        # Every higher-priority request goes first, then one per session ahead in this lane's rotation
+        ahead = sum(len(queue) for higher in LANES[:LANES.index(lane)] for queue in self._waiting[higher].values())
+        for position, waiting_session in enumerate(self._waiting[lane], start=1):
+            if waiting_session == session_id:
+                return ahead + position
+        return 0
+
+    def acquire(self, session_id: str, lane: str = BULK, cancelled: threading.Event = None,
+                on_wait=None, poll: float = 0.25) -> _Ticket:
+        """Block until ``session_id`` gets a slot in ``lane``.
+
+        ``cancelled`` withdraws the request from the queue (raising
+        ``SlotCancelled``); ``on_wait`` is called with the queue position while
+        waiting, outside the lock, so callers can update a status display.
+        """
+        ticket = _Ticket(session_id, lane)
+        with self._cond:
+            self._waiting[lane].setdefault(session_id, deque()).append(ticket)
+            self._dispatch()
+        while True:
+            with self._cond:
+                if not ticket.granted:
+                    self._cond.wait(poll)
+                if cancelled is not None and cancelled.is_set():
+                    # A slot granted after cancellation goes straight back to the next session
+                    if ticket.granted:
+                        self._release(ticket, record=False)
+                    else:
+                        self._withdraw(ticket)
+                    raise SlotCancelled("Cancelled while waiting for a grading slot")
+                if ticket.granted:
+                    return ticket
+                position = self._position(session_id, lane)
+            if on_wait is not None:
+                on_wait(position)
+
+    def try_acquire(self, session_id: str, lane: str = BULK):
+        """A slot for ``session_id`` right now, or None if it would have to wait.
+
+        Never jumps the queue: with anything waiting in ``lane`` or a higher one
+        the free slot belongs to them. For optional work such as hedged requests.
+        """
+        with self._cond:
+            if self._in_flight >= self._lane_capacity(lane) or any(self._waiting[higher] for higher in LANES[:LANES.index(lane) + 1]):
+                return None
+            ticket = _Ticket(session_id, lane)
+            ticket.granted = True
+            ticket.granted_at = ticket.queued_at
+            self._in_flight += 1
+            self._in_flight_by_session[session_id] += 1
+            return ticket
+
+    def _release(self, ticket: _Ticket, record: bool = True):
+        if record:
+            self._total_latency[ticket.lane].record(time.monotonic() - ticket.queued_at)
+        self._in_flight -= 1
+        self._in_flight_by_session[ticket.session_id] -= 1
+        if not self._in_flight_by_session[ticket.session_id]:
+            del self._in_flight_by_session[ticket.session_id]
+        self._dispatch()
+
+    def release(self, ticket: _Ticket, record: bool = True):
+        with self._cond:
+            self._release(ticket, record)
+
+    @contextmanager
+    def slot(self, session_id: str, lane: str = BULK, cancelled: threading.Event = None, on_wait=None):
+        ticket = self.acquire(session_id, lane, cancelled, on_wait)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    # ----------- Status ----------- #
+    def queue_position(self, session_id: str, lane: str = BULK) -> int:
+        """1-based turn of this session's next queued request, or 0 if it has nothing waiting."""
+        with self._cond:
+            return self._position(session_id, lane)
+
+    def lane_latency(self) -> dict:
+        """p50/p95 queue wait and end-to-end latency (seconds) per lane over recent requests."""
+        return {
+            lane: {
+                "count": len(self._total_latency[lane]),
+                "p50": self._total_latency[lane].percentile(0.5),
+                "p95": self._total_latency[lane].percentile(0.95),
+                "wait_p95": self._wait_latency[lane].percentile(0.95),
+            }
+            for lane in LANES
+        }
+
+    def stats(self, session_id: str = None, lane: str = BULK) -> dict:
+        with self._cond:
+            stats = {
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "waiting": sum(len(queue) for waiting in self._waiting.values() for queue in waiting.values()),
+                "waiting_sessions": len({session for waiting in self._waiting.values() for session in waiting}),
+            }
+            if session_id is not None:
+                stats["position"] = self._position(session_id, lane)
+                stats["session_in_flight"] = self._in_flight_by_session[session_id]
+                stats["session_waiting"] = sum(len(waiting.get(session_id, ())) for waiting in self._waiting.values())
+        return stats
@@ -0,0 +1,178 @@
+import math
+import os
+import re
+from dataclasses import dataclass, field, replace
+
+from batch import simulate_makespan
+from grading import GRADING_MODEL, build_grading_prompt
+
+# ----------- PREFLIGHT CONFIGURATION ----------- #
+# USD per 1M tokens (input, output); override for other models or price changes
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+}
+INPUT_PRICE_PER_1M = float(os.getenv("GRADING_INPUT_PRICE_PER_1M", MODEL_PRICES.get(GRADING_MODEL, MODEL_PRICES["gpt-4o"])[0]))
+OUTPUT_PRICE_PER_1M = float(os.getenv("GRADING_OUTPUT_PRICE_PER_1M", MODEL_PRICES.get(GRADING_MODEL, MODEL_PRICES["gpt-4o"])[1]))
+# The full feedback format typically runs 900-1,400 tokens
+EXPECTED_COMPLETION_TOKENS = int(os.getenv("GRADING_EXPECTED_OUTPUT_TOKENS", "1200"))
+OUTPUT_TOKENS_PER_SECOND = float(os.getenv("GRADING_OUTPUT_TOKENS_PER_SEC", "50"))
+# Prompt processing is far faster than generation but still grows with essay length
+INPUT_TOKENS_PER_SECOND = float(os.getenv("GRADING_INPUT_TOKENS_PER_SEC", "2500"))
+REQUEST_OVERHEAD_SECONDS = 1.5
+# Account rate limits; 0 means unknown and is left out of the time projection
+RPM_LIMIT = int(os.getenv("GRADING_RPM_LIMIT", "0"))
+TPM_LIMIT = int(os.getenv("GRADING_TPM_LIMIT", "0"))
+# Leave room for the rubric prompt and the response inside a 128k context window
+MAX_ESSAY_TOKENS = 100_000
+MIN_ESSAY_WORDS = 5
+
+# Chat formatting adds a few tokens per message on top of the content
+_MESSAGE_OVERHEAD_TOKENS = 4
+_PIECES = re.compile(r"'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+", re.IGNORECASE)
+
+
+# ----------- TOKEN ESTIMATION ----------- #
+def _load_encoding():
+    # Optional exact counts; tiktoken also needs its BPE file, which may not be downloadable offline
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(GRADING_MODEL)
+    except Exception:
+        return None
+
+
+_encoding = _load_encoding()
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count for ``text``: exact with tiktoken, otherwise a GPT-style pre-tokenizer estimate.
+
+    The fallback splits text the way GPT tokenizers pre-tokenize (words with
+    their leading space, 1-3 digit runs, punctuation runs) and charges longer
+    words extra, which tracks the usual ~4 characters per token on English prose.
+    """
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        stripped = piece.strip()
+        if not stripped:
+            tokens += 1 if "\n" in piece else 0
+        elif stripped[0].isalpha():
+            tokens += 1 if len(stripped) <= 7 else math.ceil(len(stripped) / 4)
+        else:
+            tokens += math.ceil(len(stripped) / 2) if not stripped.isdigit() else 1
+    return tokens
+
+
+# ----------- ROW VALIDATION ----------- #
+def clean_essay(value):
+    """Return ``(text, problem)``; ``text`` is None when the cell can't be graded."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None, "empty cell"
+    if not isinstance(value, str):
+        return None, f"not text ({type(value).__name__})"
+    text = value.replace("\r\n", "\n").strip()
+    if not text:
+        return None, "blank essay"
+    if len(text.split()) < MIN_ESSAY_WORDS:
+        return None, f"fewer than {MIN_ESSAY_WORDS} words"
+    return text, ""
+
+
+def clean_id(value) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    # Numeric IDs come back from pandas as floats when the column has gaps
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+@dataclass
+class PreflightReport:
+    rows: list = field(default_factory=list)
+    skipped: list = field(default_factory=list)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    seconds: float = 0.0
+    bottleneck: str = ""
+    concurrency: int = 1
+    # Per-request system prompt tokens the projection was made with
+    system_tokens: int = 0
+    # row_id -> essay tokens, and row_id -> estimated request seconds (the batch scheduler's costs)
+    essay_tokens: dict = field(default_factory=dict)
+    row_seconds: dict = field(default_factory=dict)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+def run_preflight(essays, level: str, student_ids=None, assignment_ids=None, concurrency: int = 1,
+                  completion_tokens: int = EXPECTED_COMPLETION_TOKENS, samples: int = 1) -> PreflightReport:
+    """Validate essay cells and project tokens, cost and wall-clock time before anything is billed.
+
+    ``rows`` holds ``(row_id, essay, student_id, assignment_id)`` for gradeable
+    rows, keyed by original position; ``skipped`` holds ``(row_id, reason)``.
+    """
+    essays = list(essays)
+    student_ids = list(student_ids) if student_ids is not None else [""] * len(essays)
+    assignment_ids = list(assignment_ids) if assignment_ids is not None else [""] * len(essays)
+    system_tokens = estimate_tokens(build_grading_prompt(level)) + 2 * _MESSAGE_OVERHEAD_TOKENS
+    report = PreflightReport(concurrency=concurrency, system_tokens=system_tokens)
+    for row_id, (value, student_id, assignment_id) in enumerate(zip(essays, student_ids, assignment_ids)):
+        text, problem = clean_essay(value)
+        if text is None:
+            report.skipped.append((row_id, problem))
+            continue
+        essay_tokens = estimate_tokens(text)
+        if essay_tokens > MAX_ESSAY_TOKENS:
+            report.skipped.append((row_id, f"too long ({essay_tokens:,} tokens)"))
+            continue
+        report.rows.append((row_id, text, clean_id(student_id), clean_id(assignment_id)))
+        report.essay_tokens[row_id] = essay_tokens
+        report.prompt_tokens += system_tokens + essay_tokens
+    return project(report, completion_tokens, samples=samples)
+
+
+def estimate_request_seconds(prompt_tokens: int, completion_tokens: int) -> float:
+    return REQUEST_OVERHEAD_SECONDS + prompt_tokens / INPUT_TOKENS_PER_SECOND + completion_tokens / OUTPUT_TOKENS_PER_SECOND
+
+
+def project(report: PreflightReport, completion_tokens: int, system_prompt: str = None,
+            samples: int = 1) -> PreflightReport:
+    """Cost and wall-clock projection for ``report``'s rows at ``completion_tokens`` per reply.
+
+    Lets the UI compare grading modes without re-validating and re-counting
+    every essay; pass ``system_prompt`` when the mode sends a different prompt.
+    ``samples`` replies come back from one request: they are all billed, but
+    they are generated side by side, so a row takes as long as one reply.
+    """
+    system_tokens = report.system_tokens
+    if system_prompt is not None:
+        system_tokens = estimate_tokens(system_prompt) + 2 * _MESSAGE_OVERHEAD_TOKENS
+    report = replace(
+        report,
+        prompt_tokens=report.prompt_tokens + len(report.rows) * (system_tokens - report.system_tokens),
+        completion_tokens=completion_tokens * samples * len(report.rows),
+        system_tokens=system_tokens
+    )
+    report.cost = (report.prompt_tokens * INPUT_PRICE_PER_1M + report.completion_tokens * OUTPUT_PRICE_PER_1M) / 1_000_000
+    report.row_seconds = {
+        row_id: estimate_request_seconds(system_tokens + essay_tokens, completion_tokens)
+        for row_id, essay_tokens in report.essay_tokens.items()
+    }
+    # Wall-clock time is whichever of latency/concurrency, requests/min or tokens/min binds first;
+    # the concurrency bound assumes the batch's longest-first dispatch
+    bounds = {"concurrency": simulate_makespan(sorted(report.row_seconds.values(), reverse=True), report.concurrency)}
+    if RPM_LIMIT:
+        bounds["requests/min limit"] = len(report.rows) / RPM_LIMIT * 60
+    if TPM_LIMIT:
+        bounds["tokens/min limit"] = report.total_tokens / TPM_LIMIT * 60
+    report.bottleneck, report.seconds = max(bounds.items(), key=lambda bound: bound[1])
+    return report
@@ -0,0 +1,146 @@
+import cProfile
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+# ----------- PROFILER CONFIGURATION ----------- #
+# "1" times each script run by phase; "cprofile" also records a cProfile dump
+PROFILE_MODE = os.getenv("GRADING_PROFILE", "")
+PROFILE_DIR = os.getenv("GRADING_PROFILE_DIR", "profiles")
+# Profiles of older runs are deleted once the directory holds this many (every batch poll is a run); 0 keeps all
+PROFILE_KEEP = int(os.getenv("GRADING_PROFILE_KEEP", "200"))
+CPROFILE = "cprofile"
+
+# A context variable rather than a thread-local, so worker threads started with
+# contextvars.copy_context().run (batch rows, criterion fan-out) record into the same run
+_active = contextvars.ContextVar("run_profiler", default=None)
+
+
+def span(name: str):
+    """Time a block inside the active run profiler; a no-op when none is running."""
+    profiler = _active.get()
+    return profiler.span(name) if profiler is not None else nullcontext()
+
+
+def _prune(directory: str, keep: int):
+    stems = sorted({os.path.splitext(name)[0] for name in os.listdir(directory) if name.endswith((".json", ".prof"))})
+    for stem in stems[:max(len(stems) - keep, 0)]:
+        for suffix in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(directory, stem + suffix))
+            except FileNotFoundError:
+                pass
+
+
+class RunProfiler:
+    """Wall-clock breakdown of one Streamlit script run, with optional cProfile.
+
+    The script is a flat top-to-bottom file, so phases are checkpoints:
+    ``phase(name)`` closes the running phase and opens the next one. ``span``
+    times a nested block (prompt building, the API call) inside whichever
+    phase is open; the module-level ``span`` lets helpers record into the
+    profiler active in their context without it being passed around.
+    ``finish`` writes ``<run>.json`` (and ``<run>.prof``) under ``directory``,
+    keeping the newest ``keep`` runs. A span that ends after its run finished
+    (a background batch row) is recorded into the run it was handed off to.
+    A disabled profiler keeps the same interface and does nothing.
+    """
+
+    def __init__(self, enabled: bool = True, label: str = "", cprofile: bool = False, directory: str = PROFILE_DIR,
+                 keep: int = PROFILE_KEEP):
+        self.enabled = enabled
+        self.label = label
+        self.directory = directory
+        self.keep = keep
+        self.started_at = time.time()
+        self.phases = []
+        self.spans = []
+        self.total = 0.0
+        self.path = None
+        self._start = time.perf_counter()
+        self._phase = None
+        self._phase_start = self._start
+        self._profile = cProfile.Profile() if enabled and cprofile else None
+        self._finished = not enabled
+        self._successor = None
+        if not enabled:
+            return
+        _active.set(self)
+        if self._profile is not None:
+            try:
+                self._profile.enable()
+            except ValueError:
+                # Only one cProfile can run at a time; another session's run has it
+                self._profile = None
+
+    # ----------- Timing ----------- #
+    def phase(self, name: str):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.phases.append((self._phase, now - self._phase_start))
+        self._phase, self._phase_start = name, now
+
+    @contextmanager
+    def span(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            target = self._recording()
+            if target is not None:
+                target.spans.append((target._phase, name, time.perf_counter() - start))
+
+    def hand_off(self, successor: "RunProfiler"):
+        """Record spans that end after this run finished into ``successor`` (the session's next run)."""
+        self._successor = successor
+
+    def _recording(self):
+        target = self
+        while target._finished and target._successor is not None:
+            target = target._successor
+        if target is not self:
+            # Point straight at the open run, so the finished runs in between can be freed
+            self._successor = target
+        return target if target.enabled and not target._finished else None
+
+    def breakdown(self) -> list:
+        """``(phase, seconds)`` for the phases closed so far, in run order."""
+        return list(self.phases)
+
+    # ----------- Output ----------- #
+    def finish(self) -> str:
+        """Stop timing and write the profile to disk; safe to call twice. Returns the JSON path."""
+        if self._finished:
+            return self.path
+        self._finished = True
+        self.phase(None)
+        self.total = time.perf_counter() - self._start
+        if _active.get() is self:
+            _active.set(None)
+        if self._profile is not None:
+            self._profile.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        stem = os.path.join(self.directory, time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+                            + f"-{int(self.started_at * 1000) % 1000:03d}" + (f"-{self.label}" if self.label else ""))
+        self.path = stem + ".json"
+        with open(self.path, "w") as out:
+            json.dump({
+                "label": self.label,
+                "started_at": self.started_at,
+                "total_seconds": self.total,
+                "phases": [{"phase": name, "seconds": seconds} for name, seconds in self.phases],
+                "spans": [{"phase": phase, "span": name, "seconds": seconds} for phase, name, seconds in self.spans],
+            }, out, indent=2)
+        if self._profile is not None:
+            # Open with `python -m pstats <file>` or snakeviz
+            self._profile.dump_stats(stem + ".prof")
+        if self.keep:
+            _prune(self.directory, self.keep)
+        return self.path
@@ -0,0 +1,545 @@
+import argparse
+import heapq
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from functools import partial
+
+import numpy as np
+import openai
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from batch import FAILED, GRADED, SKIPPED, BatchJob
+from cassette import CASSETTE_MODE, PASSTHROUGH, Cassette
+from export import EXPORT_ROW_GROUP_SIZE, EXPORT_SCHEMA, FORMATS, PARQUET, ResultWriter
+from grading import set_transport
+from history import FULL, GRADERS, HistoryStore, grade_and_record, result_mode
+from ingest import read_zip_submissions
+from limiter import FairShareLimiter
+from preflight import clean_id, run_preflight
+
+# ----------- SHARD CONFIGURATION ----------- #
+# A worker that stops renewing its lease for this long (crash, lost node) forfeits the shard
+SHARD_LEASE_SECONDS = float(os.getenv("GRADING_SHARD_LEASE_SECONDS", "300"))
+# Automatic retries of a shard's failed rows before its output is published
+SHARD_RETRIES = int(os.getenv("GRADING_SHARD_RETRIES", "1"))
+
+SQLITE = "sqlite"
+DIRECTORY = "directory"
+LEASE_BACKENDS = (SQLITE, DIRECTORY)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+
+_MANIFEST = "manifest.json"
+
+
+class ShardError(Exception):
+    """Raised for a run directory that is missing, incomplete or inconsistent."""
+
+
+def _shard_name(shard: int) -> str:
+    return f"shard-{shard:04d}"
+
+
+# ----------- Leases ----------- #
+class SqliteLeases:
+    """Shard claims in an SQLite table in the run directory.
+
+    Claims are ``BEGIN IMMEDIATE`` transactions, so concurrent workers never get
+    the same shard. Fine for processes on one machine or a network share with
+    working POSIX locks; use ``DirectoryLeases`` where SQLite locking is unreliable.
+    """
+
+    def __init__(self, directory: str, ttl: float = SHARD_LEASE_SECONDS):
+        self.ttl = ttl
+        self._conn = sqlite3.connect(os.path.join(directory, "leases.db"), timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shard_leases (shard INTEGER PRIMARY KEY, state TEXT NOT NULL DEFAULT 'pending', "
+            "worker TEXT, expires_at REAL, attempts INTEGER NOT NULL DEFAULT 0, finished_at REAL)"
+        )
+
+    def create(self, shards: int):
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO shard_leases (shard) VALUES (?)", [(shard,) for shard in range(shards)])
+
+    def claim(self, worker: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT shard FROM shard_leases WHERE state = ? OR (state = ? AND expires_at < ?) ORDER BY attempts, shard LIMIT 1",
+                    (PENDING, RUNNING, now)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE shard_leases SET state = ?, worker = ?, expires_at = ?, attempts = attempts + 1 WHERE shard = ?",
+                        (RUNNING, worker, now + self.ttl, row["shard"])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row["shard"] if row is not None else None
+
+    def renew(self, shard: int, worker: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE shard_leases SET expires_at = ? WHERE shard = ? AND worker = ? AND state = ?",
+                (time.time() + self.ttl, shard, worker, RUNNING)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, shard: int, worker: str):
+        with self._lock:
+            self._conn.execute("UPDATE shard_leases SET state = ?, worker = ?, finished_at = ? WHERE shard = ?", (DONE, worker, time.time(), shard))
+
+    def release(self, shard: int, worker: str):
+        with self._lock:
+            self._conn.execute("UPDATE shard_leases SET state = ?, worker = NULL WHERE shard = ? AND worker = ? AND state = ?",
+                               (PENDING, shard, worker, RUNNING))
+
+    def status(self) -> dict:
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM shard_leases ORDER BY shard").fetchall()
+        return {
+            row["shard"]: {"state": PENDING if row["state"] == RUNNING and row["expires_at"] < now else row["state"],
+                           "worker": row["worker"], "attempts": row["attempts"]}
+            for row in rows
+        }
+
+
+class DirectoryLeases:
+    """Shard claims as lock files, for shared directories where SQLite locking can't be trusted (NFS, SMB).
+
+    A claim is an exclusive create of ``leases/<shard>.lease``; its mtime is the
+    heartbeat. An expired lease is taken over by renaming it away first, which
+    only one contender can do. ``done/<shard>`` marks a published shard.
+    Machines need roughly synchronized clocks relative to the lease length.
+    """
+
+    def __init__(self, directory: str, ttl: float = SHARD_LEASE_SECONDS):
+        self.ttl = ttl
+        self.shards = 0
+        self._leases = os.path.join(directory, "leases")
+        self._done = os.path.join(directory, "done")
+        os.makedirs(self._leases, exist_ok=True)
+        os.makedirs(self._done, exist_ok=True)
+        manifest = os.path.join(directory, _MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest) as source:
+                self.shards = json.load(source)["shards"]
+
+    def _lease(self, shard: int) -> str:
+        return os.path.join(self._leases, _shard_name(shard) + ".lease")
+
+    def _holder(self, shard: int):
+        try:
+            with open(self._lease(shard)) as lease:
+                return lease.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _expired(self, shard: int) -> bool:
+        try:
+            return time.time() - os.stat(self._lease(shard)).st_mtime > self.ttl
+        except FileNotFoundError:
+            return True
+
+    def _is_done(self, shard: int) -> bool:
+        return os.path.exists(os.path.join(self._done, _shard_name(shard)))
+
+    def create(self, shards: int):
+        self.shards = shards
+
+    def claim(self, worker: str):
+        for shard in range(self.shards):
+            if self._is_done(shard):
+                continue
+            path = self._lease(shard)
+            if os.path.exists(path) and self._expired(shard):
+                stale = f"{path}.{uuid.uuid4().hex}.expired"
+                try:
+                    os.rename(path, stale)
+                except FileNotFoundError:
+                    continue
+                if time.time() - os.stat(stale).st_mtime <= self.ttl:
+                    # Another worker took over between our check and rename: put its fresh lease back
+                    try:
+                        os.link(stale, path)
+                    except FileExistsError:
+                        pass
+                    os.remove(stale)
+                    continue
+                os.remove(stale)
+            try:
+                handle = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            with os.fdopen(handle, "w") as lease:
+                lease.write(worker)
+            return shard
+        return None
+
+    def renew(self, shard: int, worker: str) -> bool:
+        if self._is_done(shard) or self._holder(shard) != worker:
+            return False
+        os.utime(self._lease(shard))
+        return True
+
+    def complete(self, shard: int, worker: str):
+        with open(os.path.join(self._done, _shard_name(shard)), "w") as marker:
+            marker.write(worker)
+        if self._holder(shard) == worker:
+            os.remove(self._lease(shard))
+
+    def release(self, shard: int, worker: str):
+        if self._holder(shard) == worker:
+            os.remove(self._lease(shard))
+
+    def status(self) -> dict:
+        status = {}
+        for shard in range(self.shards):
+            holder = self._holder(shard)
+            if self._is_done(shard):
+                state = DONE
+            else:
+                state = RUNNING if holder is not None and not self._expired(shard) else PENDING
+            status[shard] = {"state": state, "worker": holder, "attempts": None}
+        return status
+
+
+def open_leases(directory: str, backend: str = None, ttl: float = SHARD_LEASE_SECONDS):
+    if backend is None:
+        backend = load_manifest(directory)["leases"]
+    if backend not in LEASE_BACKENDS:
+        raise ShardError(f"Unknown lease backend '{backend}' (expected one of {', '.join(LEASE_BACKENDS)})")
+    return SqliteLeases(directory, ttl) if backend == SQLITE else DirectoryLeases(directory, ttl)
+
+
+def load_manifest(directory: str) -> dict:
+    path = os.path.join(directory, _MANIFEST)
+    if not os.path.exists(path):
+        raise ShardError(f"No shard run in {directory} (missing {_MANIFEST}); run `python shard.py split` first")
+    with open(path) as manifest:
+        return json.load(manifest)
+
+
+def output_path(directory: str, shard: int, manifest: dict) -> str:
+    return os.path.join(directory, "outputs", _shard_name(shard) + FORMATS[manifest["format"]])
+
+
+# ----------- Split ----------- #
+def read_submissions(path: str) -> pd.DataFrame:
+    """The CSV or LMS ZIP export the app accepts, as an ``Essay``/``Student ID``/``Assignment ID`` frame."""
+    if path.lower().endswith(".zip"):
+        with open(path, "rb") as archive:
+            submissions, _ = read_zip_submissions(archive)
+        return pd.DataFrame(submissions, columns=["Student ID", "Essay", "Source File"])
+    df = pd.read_csv(path)
+    if "Essay" not in df.columns:
+        raise ShardError("CSV must contain a column labeled 'Essay'.")
+    return df
+
+
+def split(source: str, directory: str, shards: int, level: str, mode: str = FULL, samples: int = 1, fmt: str = PARQUET,
+          leases: str = SQLITE, assignment_id: str = "", reuse: bool = False) -> dict:
+    """Preflight ``source`` and write it as ``shards`` JSON-lines shards plus a manifest and lease table.
+
+    Rows are dealt to shards by estimated request time (heaviest first onto
+    the lightest shard) so shards finish together; each keeps its original
+    ``row_id`` for the merge. Skipped rows are kept in the manifest.
+    """
+    if os.path.exists(os.path.join(directory, _MANIFEST)):
+        raise ShardError(f"{directory} already holds a shard run")
+    if mode not in GRADERS:
+        raise ShardError(f"Unknown mode '{mode}' (expected one of {', '.join(GRADERS)})")
+    df = read_submissions(source)
+    preflight = run_preflight(
+        df["Essay"],
+        level,
+        df["Student ID"] if "Student ID" in df.columns else None,
+        df["Assignment ID"] if "Assignment ID" in df.columns else [assignment_id] * len(df),
+    )
+    shards = max(1, min(shards, len(preflight.rows)))
+    loads = [(0.0, shard) for shard in range(shards)]
+    assigned = {shard: [] for shard in range(shards)}
+    for row_id, essay, student_id, row_assignment in sorted(preflight.rows, key=lambda row: preflight.row_seconds[row[0]], reverse=True):
+        load, shard = heapq.heappop(loads)
+        assigned[shard].append({"row_id": row_id, "essay": essay, "student_id": student_id, "assignment_id": row_assignment,
+                                "seconds": preflight.row_seconds[row_id]})
+        heapq.heappush(loads, (load + preflight.row_seconds[row_id], shard))
+    os.makedirs(os.path.join(directory, "shards"), exist_ok=True)
+    os.makedirs(os.path.join(directory, "outputs"), exist_ok=True)
+    for shard, rows in assigned.items():
+        with open(os.path.join(directory, "shards", _shard_name(shard) + ".jsonl"), "w", encoding="utf-8") as out:
+            for row in sorted(rows, key=lambda row: row["row_id"]):
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+    essays = df["Essay"].tolist()
+    student_ids = df["Student ID"].tolist() if "Student ID" in df.columns else [""] * len(df)
+    assignment_ids = df["Assignment ID"].tolist() if "Assignment ID" in df.columns else [assignment_id] * len(df)
+    manifest = {
+        "source": os.path.abspath(source),
+        "created_at": time.time(),
+        "level": level,
+        "mode": mode,
+        "samples": samples,
+        "format": fmt,
+        "leases": leases,
+        "reuse": reuse,
+        "rows": len(df),
+        "shards": shards,
+        "shard_rows": [len(assigned[shard]) for shard in range(shards)],
+        "shard_seconds": [sum(row["seconds"] for row in assigned[shard]) for shard in range(shards)],
+        "skipped": [
+            {"row_id": row_id, "reason": reason, "student_id": clean_id(student_ids[row_id]), "assignment_id": clean_id(assignment_ids[row_id]),
+             "essay": "" if pd.isna(essays[row_id]) else str(essays[row_id])}
+            for row_id, reason in preflight.skipped
+        ],
+    }
+    with open(os.path.join(directory, _MANIFEST), "w") as out:
+        json.dump(manifest, out, indent=2)
+    open_leases(directory, leases).create(shards)
+    return manifest
+
+
+# ----------- Work ----------- #
+def grade_shard(directory: str, shard: int, manifest: dict, leases, worker: str, limiter: FairShareLimiter, history: HistoryStore) -> dict:
+    """Grade one claimed shard and publish its export; the lease is renewed while rows are in flight.
+
+    The export is written to a worker-private file and renamed into place, so
+    a worker that loses its lease (or crashes) never leaves a half-written
+    output. Returns the row counts, or None if the lease was lost.
+    """
+    with open(os.path.join(directory, "shards", _shard_name(shard) + ".jsonl"), encoding="utf-8") as source:
+        rows = [json.loads(line) for line in source if line.strip()]
+    level, mode, samples = manifest["level"], manifest["mode"], manifest["samples"]
+    grade_fn = partial(GRADERS[mode], samples=samples)
+
+    def grade_row(row):
+        return grade_and_record(row.essay, level, history, row.student_id, row.assignment_id, grade_fn=grade_fn,
+                                mode=result_mode(mode, samples), reuse=manifest["reuse"])
+
+    final = output_path(directory, shard, manifest)
+    writer = ResultWriter(level, manifest["format"], path=f"{final}.{worker}.partial")
+    job = BatchJob(
+        [(row["row_id"], row["essay"], row["student_id"], row["assignment_id"]) for row in rows],
+        grade_row,
+        workers=limiter.capacity,
+        limiter=limiter,
+        session_id=f"shard:{worker}",
+        on_result=writer.write,
+        costs={row["row_id"]: row["seconds"] for row in rows}
+    )
+    job.start()
+    retries = SHARD_RETRIES
+    last_renewal = time.monotonic()
+    try:
+        while True:
+            time.sleep(0.2)
+            if time.monotonic() - last_renewal > leases.ttl / 3:
+                if not leases.renew(shard, worker):
+                    job.cancel()
+                    writer.discard()
+                    return None
+                last_renewal = time.monotonic()
+            if job.running:
+                continue
+            if retries and job.failed_ids():
+                retries -= 1
+                job.retry_failed()
+                continue
+            break
+    except BaseException:
+        job.cancel()
+        writer.discard()
+        raise
+    os.replace(writer.close(), final)
+    leases.complete(shard, worker)
+    return job.counts()
+
+
+def run_worker(directory: str, worker: str = None, limiter: FairShareLimiter = None, history: HistoryStore = None) -> list:
+    """Claim and grade shards until every shard is done; returns ``(shard, counts)`` for each one this worker published."""
+    manifest = load_manifest(directory)
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    leases = open_leases(directory, manifest["leases"])
+    limiter = limiter or FairShareLimiter(reserved=0)
+    history = history or HistoryStore()
+    published = []
+    while True:
+        shard = leases.claim(worker)
+        if shard is None:
+            if all(entry["state"] == DONE for entry in leases.status().values()):
+                return published
+            # Everything left is leased elsewhere; stay around to take over if a holder dies
+            time.sleep(min(leases.ttl / 3, 10))
+            continue
+        started = time.perf_counter()
+        try:
+            counts = grade_shard(directory, shard, manifest, leases, worker, limiter, history)
+        except BaseException:
+            leases.release(shard, worker)
+            raise
+        if counts is None:
+            print(f"[{worker}] lost the lease on {_shard_name(shard)}; another worker took it over", flush=True)
+            continue
+        published.append((shard, counts))
+        print(f"[{worker}] {_shard_name(shard)}: {counts[GRADED]} graded, {counts[FAILED]} failed in {time.perf_counter() - started:.1f}s",
+              flush=True)
+
+
+def _worker_process(directory: str, worker: str):
+    # Each process has its own API key (from its environment / .env), limiter and transport
+    load_dotenv()
+    if os.getenv("OPENAI_API_KEY"):
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        openai.max_retries = 0
+    if CASSETTE_MODE != PASSTHROUGH:
+        set_transport(Cassette())
+    run_worker(directory, worker)
+
+
+# ----------- Merge ----------- #
+def _read_export(path: str, fmt: str) -> pa.Table:
+    if fmt == PARQUET:
+        return pq.read_table(path, schema=EXPORT_SCHEMA)
+    with pa.memory_map(path) as mapped:
+        return ipc.open_file(mapped).read_all()
+
+
+def _latest_per_row(table: pa.Table) -> pa.Table:
+    # A re-graded row appears once per attempt; keep the last one to finish, then order by row_id
+    if not table.num_rows:
+        return table
+    table = table.sort_by([("row_id", "ascending"), ("finished_at", "descending")])
+    row_ids = table.column("row_id").to_numpy()
+    return table.filter(pa.array(np.concatenate(([True], row_ids[1:] != row_ids[:-1]))))
+
+
+def _write_sorted_run(path: str, fmt: str, run_path: str, batch_size: int):
+    # Only this shard is in memory while it's de-duplicated and sorted
+    table = _latest_per_row(_read_export(path, fmt))
+    with ipc.new_file(run_path, EXPORT_SCHEMA) as run:
+        for batch in table.to_batches(max_chunksize=batch_size):
+            run.write_batch(batch)
+
+
+def _run_records(run_path: str):
+    # One record batch at a time from the memory-mapped run
+    with pa.memory_map(run_path) as mapped:
+        reader = ipc.open_file(mapped)
+        for index in range(reader.num_record_batches):
+            yield from reader.get_batch(index).to_pylist()
+
+
+def merge(directory: str, out_path: str, allow_partial: bool = False) -> dict:
+    """Combine every shard's export (plus the skipped rows) into one file in original upload order.
+
+    An external merge sort: each shard is read, de-duplicated and sorted on
+    its own and spilled to a sorted Arrow IPC run next to ``out_path``, then
+    the runs are k-way merged on ``row_id``. Memory holds one shard while its
+    run is written, then one record batch per shard plus the row group being
+    written.
+    """
+    manifest = load_manifest(directory)
+    fmt = manifest["format"]
+    status = open_leases(directory, manifest["leases"]).status()
+    paths = [output_path(directory, shard, manifest) for shard in range(manifest["shards"])]
+    missing = [shard for shard, path in enumerate(paths) if status.get(shard, {}).get("state") != DONE or not os.path.exists(path)]
+    if missing and not allow_partial:
+        raise ShardError(f"{len(missing)} of {manifest['shards']} shards are not finished: {', '.join(map(_shard_name, missing[:10]))}")
+    skipped = [
+        {"row_id": row["row_id"], "student_id": row["student_id"], "assignment_id": row["assignment_id"], "essay": row["essay"],
+         "level": manifest["level"], "status": SKIPPED, "error": row["reason"], "attempts": 0}
+        for row in manifest["skipped"]
+    ]
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    counts = {GRADED: 0, FAILED: 0, SKIPPED: 0}
+    with tempfile.TemporaryDirectory(prefix=".merge-", dir=os.path.dirname(os.path.abspath(out_path))) as runs:
+        sources = [iter(skipped)]
+        for shard, path in enumerate(paths):
+            if shard in missing:
+                continue
+            run_path = os.path.join(runs, f"{_shard_name(shard)}.arrow")
+            _write_sorted_run(path, fmt, run_path, EXPORT_ROW_GROUP_SIZE)
+            sources.append(_run_records(run_path))
+        writer = ResultWriter(manifest["level"], fmt, path=out_path)
+        for record in heapq.merge(*sources, key=lambda record: record["row_id"]):
+            writer.append({name: record.get(name) for name in EXPORT_SCHEMA.names})
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+        writer.close()
+    return {"rows": sum(counts.values()), "counts": counts, "missing_shards": missing, "path": out_path}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split a large batch into shards, grade them from many workers, and merge the results.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    split_parser = commands.add_parser("split", help="preflight a CSV/ZIP and write shards + lease table to a run directory")
+    split_parser.add_argument("source")
+    split_parser.add_argument("directory")
+    split_parser.add_argument("--shards", type=int, default=16)
+    split_parser.add_argument("--level", default="High School", choices=("High School", "College", "Professional"))
+    split_parser.add_argument("--mode", default=FULL, choices=tuple(GRADERS))
+    split_parser.add_argument("--samples", type=int, default=1, choices=(1, 3, 5))
+    split_parser.add_argument("--format", default=PARQUET, choices=tuple(FORMATS))
+    split_parser.add_argument("--leases", default=SQLITE, choices=LEASE_BACKENDS,
+                              help="sqlite lease table, or lock files for network shares without reliable locking")
+    split_parser.add_argument("--assignment-id", default="")
+    split_parser.add_argument("--reuse", action="store_true", help="answer identical essays from this worker's grading history")
+    work_parser = commands.add_parser("work", help="claim and grade shards until none are left")
+    work_parser.add_argument("directory")
+    work_parser.add_argument("--processes", type=int, default=1, help="worker processes on this machine (each gets GRADING_MAX_CONCURRENCY slots)")
+    work_parser.add_argument("--worker-id", default=None)
+    status_parser = commands.add_parser("status", help="show shard progress")
+    status_parser.add_argument("directory")
+    merge_parser = commands.add_parser("merge", help="merge shard exports into one file in upload order")
+    merge_parser.add_argument("directory")
+    merge_parser.add_argument("output")
+    merge_parser.add_argument("--allow-partial", action="store_true", help="merge the finished shards even if some are missing")
+    args = parser.parse_args()
+    if args.command == "split":
+        try:
+            manifest = split(args.source, args.directory, args.shards, args.level, args.mode, args.samples, args.format, args.leases,
+                             args.assignment_id, args.reuse)
+        except ShardError as e:
+            parser.exit(1, f"{e}\n")
+        print(f"{manifest['rows']} rows → {manifest['shards']} shards ({sum(manifest['shard_rows'])} gradeable, {len(manifest['skipped'])} skipped); "
+              f"estimated {min(manifest['shard_seconds']) / 60:.1f}-{max(manifest['shard_seconds']) / 60:.1f} min of requests per shard")
+    elif args.command == "work":
+        base = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        processes = [multiprocessing.Process(target=_worker_process, args=(args.directory, f"{base}-{index}"))
+                     for index in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    elif args.command == "status":
+        manifest = load_manifest(args.directory)
+        status = open_leases(args.directory, manifest["leases"]).status()
+        states = [entry["state"] for entry in status.values()]
+        print(f"{states.count(DONE)}/{manifest['shards']} done · {states.count(RUNNING)} running · {states.count(PENDING)} pending")
+        for shard, entry in status.items():
+            print(f"  {_shard_name(shard)}  {entry['state']:<8} {manifest['shard_rows'][shard]:>6} rows  {entry['worker'] or ''}")
+    else:
+        try:
+            result = merge(args.directory, args.output, args.allow_partial)
+        except ShardError as e:
+            parser.exit(1, f"{e}\n")
+        print(f"Merged {result['rows']} rows into {result['path']}: " + " · ".join(f"{count} {state}" for state, count in result["counts"].items()))
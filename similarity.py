@@ -0,0 +1,201 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# ----------- SIMILARITY CONFIGURATION ----------- #
+SIMILARITY_DB_PATH = os.getenv("GRADING_SIMILARITY_DB", "grading_similarity.db")
+# Estimated Jaccard above which two essays are treated as the same piece of work
+NEAR_DUPLICATE_THRESHOLD = 0.8
+# Share of the shorter essay found in the other one that suggests a copied passage
+OVERLAP_THRESHOLD = 0.4
+
+SHINGLE_WORDS = 5
+NUM_PERM = 120
+# 40 bands x 3 rows puts the LSH candidate threshold near Jaccard 0.3, low enough
+# to surface an essay that copies half of another (Jaccard ~0.33)
+NUM_BANDS = 40
+MAX_CANDIDATES = 50
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS essays (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    student_id TEXT NOT NULL DEFAULT '',
+    assignment_id TEXT NOT NULL DEFAULT '',
+    excerpt TEXT NOT NULL,
+    added_at REAL NOT NULL,
+    shingle_count INTEGER NOT NULL,
+    signature BLOB NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_essays_submission ON essays (content_hash, student_id, assignment_id);
+-- One row per (band bucket, essay); clustered on the bucket key so a query is one probe per band
+CREATE TABLE IF NOT EXISTS lsh_buckets (
+    bucket INTEGER NOT NULL,
+    essay_id INTEGER NOT NULL,
+    PRIMARY KEY (bucket, essay_id)
+) WITHOUT ROWID;
+"""
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set:
+    words = re.findall(r"[a-z0-9']+", str(text).lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(str(text).encode("utf-8")).hexdigest()
+
+
+class NearDuplicateIndex:
+    """MinHash LSH index for spotting resubmissions and copied passages.
+
+    Signatures and band buckets live in SQLite, so memory stays flat as the
+    index grows past 100k essays and every insert/query is a handful of
+    indexed lookups instead of a scan.
+    """
+
+    def __init__(self, path: str = SIMILARITY_DB_PATH, num_perm: int = NUM_PERM,
+                 bands: int = NUM_BANDS, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        # Fixed seed: signatures persisted on disk must stay comparable across restarts
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    # ----------- MinHash ----------- #
+    def signature(self, text: str) -> np.ndarray:
+        return self._minhash(shingles(text))
+
+    def _minhash(self, shingle_set: set) -> np.ndarray:
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingle_set),
+            dtype=np.uint64
+        )
+        if not len(hashes):
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        # (a * x + b) mod p for every permutation at once; a, x < 2**32 so nothing overflows
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return (permuted & _MAX_HASH).min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray) -> list:
+        keys = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows_per_band:(band + 1) * self.rows_per_band]
+            digest = hashlib.blake2b(chunk.tobytes(), digest_size=8, salt=band.to_bytes(2, "little")).digest()
+            keys.append(int.from_bytes(digest, "little", signed=True))
+        return keys
+
+    @staticmethod
+    def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+        return float(np.mean(sig_a == sig_b))
+
+    @staticmethod
+    def overlap(jaccard: float, size_a: int, size_b: int) -> float:
+        """Estimated share of the shorter essay's shingles that also appear in the other."""
+        if not size_a or not size_b:
+            return 0.0
+        shared = jaccard * (size_a + size_b) / (1 + jaccard)
+        return min(shared / min(size_a, size_b), 1.0)
+
+    # ----------- Index ----------- #
+    def _query(self, signature: np.ndarray, size: int, threshold: float, limit: int) -> list:
+        keys = self._band_keys(signature)
+        placeholders = ", ".join("?" * len(keys))
+        candidates = self._conn.execute(
+            f"SELECT e.id, e.content_hash, e.student_id, e.assignment_id, e.excerpt, e.added_at, e.shingle_count, e.signature "
+            f"FROM (SELECT essay_id, COUNT(*) AS hits FROM lsh_buckets WHERE bucket IN ({placeholders}) "
+            f"      GROUP BY essay_id ORDER BY hits DESC LIMIT ?) AS c "
+            f"JOIN essays e ON e.id = c.essay_id",
+            keys + [MAX_CANDIDATES]
+        ).fetchall()
+        matches = []
+        for row in candidates:
+            jaccard = self.similarity(signature, np.frombuffer(row["signature"], dtype=np.uint64))
+            overlap = self.overlap(jaccard, size, row["shingle_count"])
+            if overlap >= threshold:
+                match = {key: row[key] for key in ("id", "content_hash", "student_id", "assignment_id", "excerpt", "added_at")}
+                match["similarity"] = jaccard
+                match["overlap"] = overlap
+                matches.append(match)
+        matches.sort(key=lambda match: (match["similarity"], match["overlap"]), reverse=True)
+        return matches[:limit]
+
+    def _add(self, text: str, signature: np.ndarray, size: int, student_id: str, assignment_id: str):
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO essays (content_hash, student_id, assignment_id, excerpt, added_at, shingle_count, signature) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (content_hash(text), student_id or "", assignment_id or "", str(text)[:80], time.time(), size, signature.tobytes())
+        )
+        if not cursor.rowcount:
+            return None
+        essay_id = cursor.lastrowid
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO lsh_buckets (bucket, essay_id) VALUES (?, ?)",
+            [(key, essay_id) for key in self._band_keys(signature)]
+        )
+        return essay_id
+
+    def query(self, text: str, threshold: float = OVERLAP_THRESHOLD, limit: int = 10) -> list:
+        """Indexed essays sharing at least ``threshold`` of the shorter essay's text with ``text``."""
+        shingle_set = shingles(text)
+        signature = self._minhash(shingle_set)
+        with self._lock:
+            return self._query(signature, len(shingle_set), threshold, limit)
+
+    def add(self, text: str, student_id: str = "", assignment_id: str = ""):
+        """Index an essay; the same text from the same student/assignment is only stored once."""
+        shingle_set = shingles(text)
+        signature = self._minhash(shingle_set)
+        with self._lock, self._conn:
+            return self._add(text, signature, len(shingle_set), student_id, assignment_id)
+
+    def check_and_add(self, text: str, student_id: str = "", assignment_id: str = "",
+                      threshold: float = OVERLAP_THRESHOLD) -> list:
+        return self.check_and_add_many([(text, student_id, assignment_id)], threshold)[0]
+
+    def check_and_add_many(self, submissions: list, threshold: float = OVERLAP_THRESHOLD) -> list:
+        """Check each ``(text, student_id, assignment_id)`` against everything before it, then index it.
+
+        Runs in one transaction so a whole upload is checked (including against
+        itself) in a single pass. Re-checking the exact same submission doesn't
+        report it as a match against itself.
+        """
+        prepared = []
+        for text, student_id, assignment_id in submissions:
+            shingle_set = shingles(text)
+            prepared.append((text, student_id or "", assignment_id or "", self._minhash(shingle_set), len(shingle_set)))
+        results = []
+        with self._lock, self._conn:
+            for text, student_id, assignment_id, signature, size in prepared:
+                own_hash = content_hash(text)
+                results.append([
+                    match for match in self._query(signature, size, threshold, limit=10)
+                    if (match["content_hash"], match["student_id"], match["assignment_id"]) != (own_hash, student_id, assignment_id)
+                ])
+                self._add(text, signature, size, student_id, assignment_id)
+        return results
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM essays").fetchone()[0]
@@ -0,0 +1,70 @@
+import io
+import json
+
+import pyarrow.parquet as pq
+import pytest
+from starlette.testclient import TestClient
+
+import grading
+from api import MockModel, create_app
+from export import ResultWriter
+from history import HistoryStore
+from limiter import FairShareLimiter
+
+ESSAYS = [
+    {"essay": "Schools should start later because teenagers need more sleep.", "student_id": "S1"},
+    {"essay": "Homework should be optional for students in every grade level.", "student_id": "S2"},
+]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(grading, "_transport", MockModel(latency=0))
+    monkeypatch.setattr(grading, "_router", None)
+    app = create_app(FairShareLimiter(4, reserved=1), HistoryStore(str(tmp_path / "history.db")), token="secret")
+    with TestClient(app, headers={"Authorization": "Bearer secret"}) as client:
+        yield client
+
+
+def events(client, job):
+    with client.stream("GET", job["events_url"]) as response:
+        kinds, payloads = [], []
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                kinds.append(line[len("event: "):])
+            elif line.startswith("data: "):
+                payloads.append(json.loads(line[len("data: "):]))
+    return kinds, payloads
+
+
+def test_batch_streams_rows_then_done(client):
+    response = client.post("/jobs", json={"essays": ESSAYS + [""], "level": "College", "reuse": False})
+    assert response.status_code == 202
+    job = response.json()
+    assert (job["rows"], job["skipped"]) == (2, 1)
+    kinds, payloads = events(client, job)
+    assert kinds == ["row", "row", "done"]
+    assert sorted(payload["student_id"] for payload in payloads[:2]) == ["S1", "S2"]
+    assert payloads[-1]["counts"]["graded"] == 2
+    results = client.get(job["results_url"]).json()["results"]
+    assert [row["status"] for row in results] == ["graded", "graded", "skipped"]
+    table = pq.read_table(io.BytesIO(client.get(job["results_url"], params={"format": "parquet"}).content))
+    assert sorted(table.column("student_id").to_pylist()) == ["S1", "S2"]
+
+
+def test_failed_export_write_still_finishes_the_stream(client, monkeypatch):
+    def broken(self, row):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(ResultWriter, "write", broken)
+    job = client.post("/jobs", json={"essays": ESSAYS, "reuse": False}).json()
+    kinds, payloads = events(client, job)
+    assert kinds == ["row", "row", "done"]
+    assert payloads[-1]["state"] == "done" and payloads[-1]["export_errors"] == 2
+
+
+def test_requests_are_authenticated_and_validated(client):
+    assert client.post("/essays", json={"essay": "x"}, headers={"Authorization": ""}).status_code == 401
+    assert client.post("/essays", json={"essay": ESSAYS[0]["essay"], "level": "Kindergarten"}).status_code == 422
+    assert client.post("/jobs", json={"essays": []}).status_code == 422
+    assert client.get("/jobs/missing").status_code == 404
@@ -0,0 +1,161 @@
+import threading
+import time
+
+from batch import FAILED, GRADED, BatchJob, filter_results, longest_first, search_results, simulate_makespan
+from grading import Feedback
+
+
+def wait_for(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while job.running:
+        assert time.monotonic() < deadline, "batch did not finish"
+        time.sleep(0.01)
+
+
+def test_grades_rows_and_keeps_upload_order():
+    job = BatchJob([(0, "first essay"), (1, "second essay", "S1", "A1")], lambda row: f"feedback for {row.essay}", workers=2)
+    job.start()
+    wait_for(job)
+    results = job.results()
+    assert [row.row_id for row in results] == [0, 1]
+    assert [row.status for row in results] == [GRADED, GRADED]
+    assert results[1].feedback == "feedback for second essay"
+    assert results[1].student_id == "S1"
+    assert job.rows[0].essay == ""  # text lives in the compressed store
+
+
+def test_failed_rows_are_retried_without_regrading_graded_rows():
+    calls = []
+
+    def grade(row):
+        calls.append(row.row_id)
+        if row.row_id == 1 and calls.count(1) == 1:
+            raise RuntimeError("boom")
+        return Feedback("**Score: 80/100 | Letter Grade: B-**", model="gpt-4o", prompt_tokens=10, completion_tokens=5)
+
+    job = BatchJob([(0, "a"), (1, "b")], grade)
+    job.start()
+    wait_for(job)
+    assert job.failed_ids() == [1]
+    assert job.rows[1].error == "boom"
+    assert job.retry_failed() == 1
+    wait_for(job)
+    assert sorted(calls) == [0, 1, 1]
+    row = job.results()[1]
+    assert (row.status, row.attempts, row.prompt_tokens, row.scores["overall"]) == (GRADED, 2, 10, 80.0)
+
+
+def test_result_of_a_cancelled_request_never_lands():
+    release = threading.Event()
+    started = threading.Event()
+    finished = []
+    calls = []
+
+    def grade(row):
+        calls.append(row.row_id)
+        if len(calls) == 1:
+            started.set()
+            release.wait(5)
+            return "stale feedback"
+        return "fresh feedback"
+
+    job = BatchJob([(0, "essay")], grade, on_result=finished.append)
+    job.start()
+    assert started.wait(5)
+    job.cancel()
+    assert job.rows[0].status == FAILED
+    # The cancelled request is still running, so the row isn't re-sent yet
+    assert job.retry_failed() == 0
+    release.set()
+    deadline = time.monotonic() + 5
+    while 0 in job._in_flight:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert job.rows[0].status == FAILED
+    assert job.retry_failed() == 1
+    wait_for(job)
+    row = job.results()[0]
+    assert (row.status, row.feedback, row.attempts) == (GRADED, "fresh feedback", 2)
+    assert [(update.status, update.feedback) for update in finished] == [(FAILED, ""), (GRADED, "fresh feedback")]
+
+
+def test_stale_generation_is_dropped_even_after_a_new_dispatch():
+    release = threading.Event()
+    started = threading.Event()
+
+    def grade(row):
+        if not started.is_set():
+            started.set()
+            release.wait(5)
+            return "stale feedback"
+        return "fresh feedback"
+
+    job = BatchJob([(0, "essay")], grade, workers=2)
+    job.start()
+    assert started.wait(5)
+    job.cancel()
+    # Re-dispatch directly (e.g. full feedback after triage) while the old request is in flight
+    job.start([0])
+    wait_for(job)
+    release.set()
+    time.sleep(0.05)
+    assert job.results()[0].feedback == "fresh feedback"
+
+
+def test_longest_first_shortens_the_makespan():
+    costs = {0: 1.0, 1: 1.0, 2: 1.0, 3: 3.0}
+    order = longest_first(costs, costs)
+    assert order[0] == 3
+    assert simulate_makespan([costs[row_id] for row_id in order], 2) == 3.0
+    assert simulate_makespan([costs[row_id] for row_id in sorted(costs)], 2) == 4.0
+
+
+def graded_job():
+    scores = {0: (92, "A-"), 1: (78, "C+"), 2: (55, "F")}
+
+    def grade(row):
+        if row.row_id == 3:
+            raise RuntimeError("boom")
+        score, letter = scores[row.row_id]
+        return Feedback(f"**Score: {score}/100 | Letter Grade: {letter}** notes on {row.essay}")
+
+    job = BatchJob([(0, "sleep and start times", "S-100"), (1, "homework policy", "S-101"), (2, "school uniforms", "S-102"),
+                    (3, "phone bans", "S-103")], grade, workers=2)
+    job.start()
+    wait_for(job)
+    return job
+
+
+def row_ids(rows):
+    return [row.row_id for row in rows]
+
+
+def test_filter_results_by_score_letter_and_status():
+    rows = graded_job().results(text=False)
+    assert row_ids(filter_results(rows)) == [0, 1, 2, 3]
+    # A narrowed score range drops unscored rows
+    assert row_ids(filter_results(rows, score_range=(70, 100))) == [0, 1]
+    assert row_ids(filter_results(rows, letters=["A", "F"])) == [0, 2]
+    assert row_ids(filter_results(rows, status="Failed")) == [3]
+    assert row_ids(filter_results(rows, status="Graded", score_range=(0, 80))) == [1, 2]
+    assert row_ids(filter_results(rows, matches={1, 3}, status="Graded")) == [1]
+
+
+def test_search_results_matches_ids_essays_and_feedback():
+    job = graded_job()
+    cache = {}
+    assert search_results(job, "s-101", cache) == {1}
+    assert search_results(job, "UNIFORMS", cache) == {2}
+    assert search_results(job, "notes on", cache) == {0, 1, 2}
+    # Only the latest search is kept
+    assert len(cache) == 1
+
+
+def test_search_cache_is_dropped_when_a_row_finishes():
+    job = graded_job()
+    cache = {}
+    assert search_results(job, "policy", cache) == {1}
+    job.start([3], grade_fn=lambda row: Feedback("**Score: 81/100 | Letter Grade: B-** a clear policy proposal"))
+    wait_for(job)
+    # The retried row bumped job.version, so the cached search is not reused
+    assert search_results(job, "policy", cache) == {1, 3}
@@ -0,0 +1,74 @@
+import gzip
+import types
+
+import openai
+import pytest
+
+from cassette import PASSTHROUGH, RECORD, REPLAY, Cassette, CassetteMiss
+
+REQUEST = {"model": "gpt-4o", "messages": [{"role": "user", "content": "An essay."}], "timeout": 30}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    replies = iter(["first", "second", "third"])
+
+    def create(**request):
+        choice = types.SimpleNamespace(index=0, finish_reason="stop", message=types.SimpleNamespace(content=next(replies)))
+        return types.SimpleNamespace(model="gpt-4o-2024-08-06", choices=[choice],
+                                     usage=types.SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15))
+
+    monkeypatch.setattr(openai.chat.completions, "create", create)
+
+
+def test_record_then_replay_in_rotation(tmp_path, api):
+    path = str(tmp_path / "grading.jsonl.gz")
+    recorder = Cassette(RECORD, path)
+    recorder.create(**REQUEST)
+    # The timeout isn't part of the match key
+    recorder.create(**{**REQUEST, "timeout": 5})
+    # Entries are readable while the session is still recording
+    assert len(list(Cassette(PASSTHROUGH, path).entries())) == 2
+    recorder.close()
+    recorder.create(**REQUEST)
+    recorder.close()
+    with gzip.open(path, "rt", encoding="utf-8") as cassette:
+        assert len(cassette.readlines()) == 3
+
+    player = Cassette(REPLAY, path, latency_scale=0)
+    replies = [player.create(**REQUEST).choices[0].message.content for _ in range(4)]
+    assert replies == ["first", "second", "third", "first"]
+    assert player.create(**REQUEST).usage.total_tokens == 15
+    with pytest.raises(CassetteMiss):
+        player.create(**{**REQUEST, "messages": [{"role": "user", "content": "Another essay."}]})
+    assert player.stats() == {"mode": REPLAY, "hits": 5, "misses": 1, "recorded": 0, "entries": 3}
+
+
+def test_concurrent_sessions_never_interleave(tmp_path, api):
+    path = str(tmp_path / "grading.jsonl.gz")
+    first, second = Cassette(RECORD, path), Cassette(RECORD, path)
+    first.create(**REQUEST)
+    second.create(**REQUEST)
+    first.create(**REQUEST)
+    assert len(list(Cassette(PASSTHROUGH, path).entries())) == 3
+    second.close()
+    first.close()
+    assert [entry["response"]["choices"][0]["content"] for entry in Cassette(PASSTHROUGH, path).entries()] == [
+        "second", "first", "third"
+    ]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["grading.jsonl.gz"]
+
+
+def test_replay_past_the_timeout_raises_like_the_client(tmp_path, api):
+    path = str(tmp_path / "grading.jsonl.gz")
+    recorder = Cassette(RECORD, path)
+    recorder.create(**REQUEST)
+    recorder.close()
+    player = Cassette(REPLAY, path, latency_scale=1e9)
+    with pytest.raises(openai.APITimeoutError):
+        player.create(**{**REQUEST, "timeout": 0.01})
+
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        Cassette("rewind", str(tmp_path / "grading.jsonl.gz"))
@@ -0,0 +1,33 @@
+import pytest
+
+from compact import ZLIB, ZSTD, CompressedTexts, zstandard
+
+CODECS = [ZLIB] + ([ZSTD] if zstandard is not None else [])
+FEEDBACK = "## 🎯 OVERALL GRADE\n**Score: 84/100 | Letter Grade: B | Performance Level: PROFICIENT**\n" * 5
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_round_trips_and_compresses(codec):
+    store = CompressedTexts(codec)
+    handles = [store.add(text) for text in (FEEDBACK, "", "naïve café ✏️")]
+    assert [store[handle] for handle in handles] == [FEEDBACK, "", "naïve café ✏️"]
+    assert len(store) == 3
+    assert store.nbytes < store.raw_bytes
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_replace_repoints_and_reclaims_dead_bytes(codec):
+    store = CompressedTexts(codec)
+    keep = store.add("kept essay text")
+    handle = store.add(FEEDBACK)
+    for attempt in range(10):
+        store.replace(handle, f"attempt {attempt} " + FEEDBACK)
+    assert store[handle] == "attempt 9 " + FEEDBACK and store[keep] == "kept essay text"
+    # Superseded versions are compacted away once they are half the buffer
+    assert len(store._data) < 3 * len(store._compress(("attempt 9 " + FEEDBACK).encode("utf-8")))
+    assert store.raw_bytes == len("kept essay text") + len(("attempt 9 " + FEEDBACK).encode("utf-8"))
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        CompressedTexts("lz4")
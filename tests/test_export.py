@@ -0,0 +1,70 @@
+from dataclasses import replace
+
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+import pytest
+
+from batch import GRADED, RowResult
+from export import ARROW, EXPORT_SCHEMA, PARQUET, ResultWriter
+
+FEEDBACK = (
+    "## 🎯 OVERALL GRADE\n**Score: 84/100 | Letter Grade: B | Performance Level: PROFICIENT**\n"
+    "• **Thesis & Argument Development:** 17/20 - clear claim\n"
+)
+
+
+def _row(row_id, finished_at=1_700_000_000.0):
+    return RowResult(row_id, f"essay {row_id}", student_id=f"S{row_id}", status=GRADED, feedback=FEEDBACK,
+                     attempts=1, started_at=finished_at - 5, finished_at=finished_at, model="gpt-4o",
+                     prompt_tokens=100, completion_tokens=50)
+
+
+def _read(path, fmt):
+    if fmt == PARQUET:
+        return pq.read_table(path)
+    with ipc.open_file(path) as reader:
+        return reader.read_all()
+
+
+@pytest.mark.parametrize("fmt", [PARQUET, ARROW])
+def test_rows_stream_out_in_row_groups(tmp_path, fmt):
+    writer = ResultWriter("College", fmt, path=str(tmp_path / f"out.{fmt}"), row_group_size=2)
+    for row_id in range(5):
+        writer.write(_row(row_id))
+    # Two full row groups are on disk before close; the fifth row is still buffered
+    assert writer.rows_written == 4
+    table = _read(writer.close(), fmt)
+    assert table.schema.equals(EXPORT_SCHEMA)
+    assert table.column("row_id").to_pylist() == [0, 1, 2, 3, 4]
+    record = table.slice(0, 1).to_pylist()[0]
+    assert (record["overall_score"], record["letter_grade"], record["thesis_score"]) == (84.0, "B", 17.0)
+    assert record["evidence_score"] is None and record["total_tokens"] == 150
+    if fmt == PARQUET:
+        assert pq.ParquetFile(writer.path).num_row_groups == 3
+
+
+@pytest.mark.parametrize("fmt", [PARQUET, ARROW])
+def test_writing_after_close_keeps_earlier_rows(tmp_path, fmt):
+    writer = ResultWriter("College", fmt, path=str(tmp_path / f"out.{fmt}"))
+    writer.write(_row(0))
+    writer.close()
+    writer.write(_row(0, finished_at=1_700_000_100.0))
+    table = _read(writer.close(), fmt)
+    assert table.column("row_id").to_pylist() == [0, 0]
+
+
+def test_fallback_endpoint_is_exported(tmp_path):
+    writer = ResultWriter("College", path=str(tmp_path / "out.parquet"))
+    writer.write(_row(0))
+    writer.write(replace(_row(1), fallback="gpt-4o @ llm.example.edu"))
+    table = pq.read_table(writer.close())
+    # Same model name either way; only the fallback column tells the rows apart
+    assert table.column("model").to_pylist() == ["gpt-4o", "gpt-4o"]
+    assert table.column("fallback").to_pylist() == [None, "gpt-4o @ llm.example.edu"]
+
+
+def test_empty_export_is_still_a_valid_file(tmp_path):
+    writer = ResultWriter("College", path=str(tmp_path / "empty.parquet"))
+    assert pq.read_table(writer.close()).num_rows == 0
+    writer.discard()
+    assert not (tmp_path / "empty.parquet").exists()
@@ -0,0 +1,120 @@
+import time
+import types
+
+import openai
+import pytest
+
+import grading
+from failover import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, Endpoint, FailoverRouter, is_endpoint_fault
+
+
+def status_error(cls, status):
+    return cls("error", response=types.SimpleNamespace(status_code=status, headers={}, request=None), body=None)
+
+
+def reply(model):
+    message = types.SimpleNamespace(content="**Score: 80/100 | Letter Grade: B-**")
+    return types.SimpleNamespace(model=model + "-2024-08-06", choices=[types.SimpleNamespace(message=message)],
+                                 usage=types.SimpleNamespace(prompt_tokens=10, completion_tokens=5))
+
+
+class Transport:
+    """Answers every model except those listed in ``down``, which raise ``error``."""
+
+    def __init__(self, down=(), error=None):
+        self.down = set(down)
+        self.error = error or openai.APIConnectionError(request=None)
+        self.calls = []
+
+    def create(self, **request):
+        self.calls.append(request["model"])
+        if request["model"] in self.down:
+            raise self.error
+        return reply(request["model"])
+
+
+def breaker(**overrides):
+    return CircuitBreaker(**{"error_rate": 0.5, "window": 10, "min_requests": 4, "slow_seconds": 5, "cooldown": 0.2, **overrides})
+
+
+@pytest.fixture
+def route(monkeypatch):
+    def use(transport, router):
+        monkeypatch.setattr(grading, "_transport", transport)
+        monkeypatch.setattr(grading, "_router", router)
+        return transport
+
+    return use
+
+
+@pytest.mark.parametrize("error, fault", [
+    (openai.APIConnectionError(request=None), True),
+    (openai.APITimeoutError(request=None), True),
+    (status_error(openai.InternalServerError, 503), True),
+    (status_error(openai.RateLimitError, 429), False),
+    (status_error(openai.BadRequestError, 400), False),
+])
+def test_endpoint_faults(error, fault):
+    assert is_endpoint_fault(error) is fault
+
+
+def test_breaker_opens_probes_and_closes():
+    subject = breaker()
+    for _ in range(3):
+        subject.record(False, 0.1)
+    assert subject.state == CLOSED
+    subject.record(False, 0.1)
+    assert subject.state == OPEN and not subject.allow() and subject.retry_in() > 0
+    time.sleep(0.25)
+    # Half-open: exactly one probe goes through
+    assert subject.allow() and subject.state == HALF_OPEN and not subject.allow()
+    subject.record(True, 0.1)
+    assert subject.state == CLOSED and subject.stats()["error_rate"] == 0.0
+
+
+def test_slow_successes_count_against_the_endpoint():
+    subject = breaker(slow_seconds=1)
+    for _ in range(4):
+        subject.record(True, 2.0)
+    assert subject.state == OPEN and subject.failures == 0
+
+
+def test_primary_outage_fails_over_and_flags_the_fallback(route):
+    transport = route(Transport(down={"gpt-4o"}), FailoverRouter([Endpoint("gpt-4o", breaker=breaker()),
+                                                                  Endpoint("gpt-4o-mini", breaker=breaker())]))
+    results = [grading.grade_essay_with_feedback(f"essay {index}", "College") for index in range(10)]
+    assert {feedback.fallback for feedback in results} == {"gpt-4o-mini"}
+    # Once the breaker opens the primary isn't tried at all
+    assert transport.calls.count("gpt-4o") == 4
+    assert grading.failover_stats()["failovers"] == 10
+    transport.down.clear()
+    time.sleep(0.25)
+    recovered = grading.grade_essay_with_feedback("probe", "College")
+    assert recovered.fallback == "" and recovered.model == "gpt-4o-2024-08-06"
+
+
+def test_same_model_fallback_on_another_server_is_flagged(route, monkeypatch):
+    fallback = Endpoint("gpt-4o", "https://llm.example.edu/v1", "key", breaker=breaker())
+    monkeypatch.setattr(fallback, "send", lambda create, request: reply(request["model"]))
+    route(Transport(down={"gpt-4o"}), FailoverRouter([Endpoint("gpt-4o", breaker=breaker()), fallback]))
+    feedback = grading.grade_essay_with_feedback("An essay.", "College")
+    # Same model name as the primary: only the router knows a fallback answered
+    assert feedback.model == "gpt-4o-2024-08-06" and feedback.fallback == "gpt-4o @ llm.example.edu"
+
+
+def test_rate_limits_neither_fail_over_nor_open_the_breaker(route):
+    router = FailoverRouter([Endpoint("gpt-4o", breaker=breaker()), Endpoint("gpt-4o-mini", breaker=breaker())])
+    transport = route(Transport(down={"gpt-4o"}, error=status_error(openai.RateLimitError, 429)), router)
+    for _ in range(6):
+        with pytest.raises(grading.GradingError):
+            grading.grade_essay_with_feedback("An essay.", "College")
+    assert router.endpoints[0].breaker.state == CLOSED
+    assert "gpt-4o-mini" not in transport.calls
+
+
+def test_every_breaker_open_fails_fast():
+    router = FailoverRouter([Endpoint("gpt-4o", breaker=breaker(cooldown=60))])
+    for _ in range(4):
+        router.endpoints[0].breaker.record(False, 0.1)
+    with pytest.raises(CircuitOpenError, match="retrying it in"):
+        router.create(Transport().create, model="gpt-4o", messages=[])
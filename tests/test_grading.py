@@ -0,0 +1,85 @@
+import types
+
+import pytest
+
+import grading
+from grading import CRITERIA, GradingError, grade_essay_by_criteria, merge_criterion_feedback, parse_scores
+
+CRITERION_SCORES = {"thesis": 17, "evidence": 12, "organization": 15, "language": 16, "critical_thinking": 14}
+
+
+class FakeTransport:
+    """Answers each request with ``reply(system_prompt)`` and keeps the requests it was sent."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.requests = []
+
+    def create(self, **request):
+        self.requests.append(request)
+        text = self.reply(request["messages"][0]["content"])
+        if isinstance(text, Exception):
+            raise text
+        choices = [types.SimpleNamespace(message=types.SimpleNamespace(content=text)) for _ in range(request.get("n", 1))]
+        return types.SimpleNamespace(choices=choices, model=request["model"] + "-2024-08-06",
+                                     usage=types.SimpleNamespace(prompt_tokens=100, completion_tokens=50))
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    def use(reply):
+        fake = FakeTransport(reply)
+        monkeypatch.setattr(grading, "_transport", fake)
+        return fake
+
+    monkeypatch.setattr(grading, "_router", None)
+    return use
+
+
+def criterion_reply(prompt):
+    key = next(key for key in CRITERIA if grading.RUBRIC[key] in prompt)
+    return (f"SCORE: {CRITERION_SCORES[key]}/20\nCOMMENT: about {key}\nSTRENGTH: good {key}\n"
+            f"IMPROVEMENT: more {key}\n**ORIGINAL:** \"old\"\nREVISED: \"new\"\nWHY: clearer\n"
+            "IMMEDIATE ACTION: revise\nSKILL BUILDING: practice\nRESOURCE: a guide\nGROWTH: keep going")
+
+
+def test_criteria_are_graded_separately_and_merged(transport):
+    fake = transport(criterion_reply)
+    feedback = grade_essay_by_criteria("An essay.", "College")
+    assert len(fake.requests) == len(CRITERIA)
+    scores = parse_scores(feedback.text)
+    assert scores["overall"] == 74 and scores["letter_grade"] == "C"
+    assert {key: scores[key] for key in CRITERIA} == CRITERION_SCORES
+    assert (feedback.prompt_tokens, feedback.completion_tokens) == (500, 250)
+    # Weakest criterion leads the priority list and the next steps
+    assert "1. **Evidence & Analysis Quality (12/20):** more evidence" in feedback.text
+    assert "Focus next on **Evidence & Analysis Quality**" in feedback.text
+
+
+def test_criterion_without_score_fails_the_essay(transport):
+    transport(lambda prompt: "COMMENT: no score" if grading.RUBRIC["language"] in prompt else criterion_reply(prompt))
+    with pytest.raises(GradingError, match="Language Mastery & Style"):
+        grade_essay_by_criteria("An essay.", "College")
+
+
+def test_merge_leaves_out_fields_a_reply_missed():
+    results = {key: {"SCORE": float(score)} for key, score in CRITERION_SCORES.items()}
+    text = merge_criterion_feedback(results)
+    assert "Letter Grade: C | Performance Level: DEVELOPING" in text
+    assert "CONCRETE REVISION EXAMPLES" in text and "ORIGINAL" not in text
+
+
+SCORES_REPLY = (
+    "## 🎯 OVERALL GRADE\n**Score: 78/100 | Letter Grade: C+ | Performance Level: PROFICIENT**\n\n## 📊 SCORES\n"
+    + "".join(f"• **{label}:** [{score}]/20\n" for label, score in zip(CRITERIA.values(), CRITERION_SCORES.values()))
+    + "\n**Rationale:** Thin evidence.\n"
+)
+
+
+def test_scores_only_caps_the_reply_and_parses(transport):
+    fake = transport(lambda prompt: SCORES_REPLY)
+    feedback = grading.grade_essay_scores_only("An essay.", "College", max_tokens=150)
+    assert fake.requests[0]["max_tokens"] == 150
+    assert "SCORES-ONLY RESPONSE FORMAT" in fake.requests[0]["messages"][0]["content"]
+    scores = parse_scores(feedback.text)
+    assert (scores["overall"], scores["letter_grade"], scores["evidence"]) == (78, "C+", 12)
@@ -0,0 +1,104 @@
+import threading
+import time
+
+from hedging import Hedger, LatencyTracker
+from limiter import FairShareLimiter
+
+
+def test_latency_percentiles():
+    tracker = LatencyTracker(window=4)
+    assert tracker.percentile(0.5) is None
+    for seconds in (5.0, 1.0, 2.0, 3.0, 4.0):
+        tracker.record(seconds)
+    # The window keeps the last four samples
+    assert len(tracker) == 4
+    assert tracker.percentile(0.0) == 1.0
+    assert tracker.percentile(0.99) == 4.0
+
+
+def test_no_hedging_until_enough_samples():
+    hedger = Hedger(min_samples=3, budget=1.0)
+    assert hedger.call(lambda: "answer") == "answer"
+    assert hedger.hedge_delay() is None
+    assert hedger.stats()["hedged"] == 0
+
+
+def test_slow_primary_is_raced_by_a_duplicate():
+    hedger = Hedger(percentile=0.5, budget=1.0, min_samples=2)
+    for _ in range(4):
+        hedger.latencies.record(0.01)
+    calls = []
+    lock = threading.Lock()
+
+    def request():
+        with lock:
+            calls.append(None)
+            first = len(calls) == 1
+        time.sleep(1.0 if first else 0.01)
+        return "slow" if first else "fast"
+
+    assert hedger.call(request) == "fast"
+    stats = hedger.stats()
+    assert (stats["hedged"], stats["hedge_wins"]) == (1, 1)
+
+
+def test_budget_caps_duplicates():
+    hedger = Hedger(percentile=0.5, budget=0.0, min_samples=1)
+    hedger.latencies.record(0.001)
+    assert hedger.call(lambda: time.sleep(0.02) or "only") == "only"
+    assert hedger.stats()["hedged"] == 0
+
+
+def test_failed_first_finisher_falls_back_to_the_other_request():
+    hedger = Hedger(percentile=0.5, budget=1.0, min_samples=1)
+    hedger.latencies.record(0.01)
+    calls = []
+    lock = threading.Lock()
+
+    def request():
+        with lock:
+            calls.append(None)
+            first = len(calls) == 1
+        if first:
+            time.sleep(0.2)
+            return "primary"
+        raise RuntimeError("backup failed")
+
+    assert hedger.call(request) == "primary"
+
+
+def _straggler(calls, lock, first_seconds=0.3):
+    def request():
+        with lock:
+            calls.append(None)
+            first = len(calls) == 1
+        time.sleep(first_seconds if first else 0.01)
+        return "slow" if first else "fast"
+
+    return request
+
+
+def test_hedge_holds_a_limiter_slot_until_the_loser_finishes():
+    limiter = FairShareLimiter(2, reserved=0)
+    hedger = Hedger(percentile=0.5, budget=1.0, min_samples=1, limiter=limiter)
+    hedger.latencies.record(0.01)
+    # The caller runs inside its own slot, as a batch row does
+    with limiter.slot("teacher"):
+        assert hedger.call(_straggler([], threading.Lock())) == "fast"
+        assert limiter.stats()["in_flight"] == 2
+    # The slow primary is still running after the caller's slot is released
+    assert limiter.stats()["in_flight"] == 1
+    time.sleep(0.4)
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_no_hedge_without_a_free_slot():
+    limiter = FairShareLimiter(1, reserved=0)
+    hedger = Hedger(percentile=0.5, budget=1.0, min_samples=1, limiter=limiter)
+    hedger.latencies.record(0.01)
+    calls = []
+    with limiter.slot("teacher"):
+        assert hedger.call(_straggler(calls, threading.Lock(), 0.05)) == "slow"
+    assert len(calls) == 1
+    stats = hedger.stats()
+    assert (stats["hedged"], stats["skipped_busy"]) == (0, 1)
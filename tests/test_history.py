@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+from grading import GRADING_MODEL, Feedback
+from history import SCORES, HistoryStore, grade_and_record
+
+FEEDBACK = (
+    "## 🎯 OVERALL GRADE\n**Score: 84/100 | Letter Grade: B | Performance Level: PROFICIENT**\n"
+    "• **Thesis & Argument Development:** 17/20 - clear claim\n"
+)
+
+
+@pytest.fixture
+def history(tmp_path):
+    return HistoryStore(str(tmp_path / "history.db"))
+
+
+def test_record_parses_and_stores_scores(history):
+    essay_id = history.record("Schools should start later.", FEEDBACK, "College", student_id="S1", assignment_id="A1")
+    record = history.get(essay_id)
+    assert (record["overall_score"], record["letter_grade"], record["thesis_score"]) == (84.0, "B", 17.0)
+    assert record["mode"] == "full"
+    assert history.count() == 1
+
+
+def test_lookup_filters_by_student_and_assignment_newest_first(history):
+    history.record("one", FEEDBACK, "College", student_id="S1", assignment_id="A1", graded_at=1)
+    history.record("two", FEEDBACK, "College", student_id="S1", assignment_id="A2", graded_at=2)
+    history.record("three", FEEDBACK, "College", student_id="S2", assignment_id="A1", graded_at=3)
+    history.record("four", FEEDBACK, "College", student_id="S1", assignment_id="A1", graded_at=4)
+    assert [row["graded_at"] for row in history.lookup("S1", "A1")] == [4, 1]
+    assert [row["graded_at"] for row in history.lookup(assignment_id="A1")] == [4, 3, 1]
+
+
+def test_search_matches_essay_and_feedback_text(history):
+    history.record("The NCAA settlement hurts non-revenue sports.", FEEDBACK, "College", student_id="S1")
+    history.record("Homework should be optional.", FEEDBACK, "College", student_id="S2")
+    matches = history.search("settlement")
+    assert [match["student_id"] for match in matches] == ["S1"]
+    assert "**settlement**" in matches[0]["snippet"]
+    # Query syntax characters are treated as text, not FTS5 operators
+    assert history.search('"AND OR:') == []
+    assert len(history.search("clear claim")) == 2
+
+
+def test_result_cache_matches_the_requested_model_not_the_dated_one(history):
+    calls = []
+
+    def grade(essay, level, hedger=None):
+        calls.append(essay)
+        # The API answers with a dated snapshot of the requested model
+        return Feedback(FEEDBACK, model=GRADING_MODEL + "-2024-08-06")
+
+    first = grade_and_record("Schools should start later.", "College", history, "S1", grade_fn=grade, reuse=True)
+    second = grade_and_record("Schools should start later.\n", "College", history, "S2", grade_fn=grade, reuse=True)
+    assert len(calls) == 1
+    assert not first.cached and second.cached and second.model == GRADING_MODEL + "-2024-08-06"
+    assert history.cached("Schools should start later.", "College", model="gpt-4o-mini") is None
+    # A scores-only result never answers a full-feedback request
+    assert history.cached("Schools should start later.", "College", mode=SCORES) is None
+    grade_and_record("Schools should start later.", "College", history, "S3", grade_fn=grade)
+    assert len(calls) == 2
+
+
+def test_fallback_results_never_answer_the_primary_model(history):
+    calls = []
+
+    def grade(essay, level, hedger=None):
+        calls.append(essay)
+        return Feedback(FEEDBACK, model="gpt-4o-mini-2024-07-18", fallback="gpt-4o-mini" if len(calls) == 1 else "")
+
+    for _ in range(3):
+        grade_and_record("Schools should start later.", "College", history, "S1", grade_fn=grade, reuse=True)
+    assert len(calls) == 2
+    assert history.cached("Schools should start later.", "College", model="gpt-4o-mini") is not None
+
+
+def test_older_databases_gain_the_cache_columns(tmp_path):
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE graded_essays (id INTEGER PRIMARY KEY, student_id TEXT NOT NULL DEFAULT '', "
+                     "assignment_id TEXT NOT NULL DEFAULT '', level TEXT NOT NULL, model TEXT NOT NULL, "
+                     "graded_at REAL NOT NULL, essay TEXT NOT NULL, feedback TEXT NOT NULL, overall_score REAL, "
+                     "letter_grade TEXT, thesis_score REAL, evidence_score REAL, organization_score REAL, "
+                     "language_score REAL, critical_thinking_score REAL)")
+    history = HistoryStore(path)
+    history.record("An essay.", FEEDBACK, "College", model="gpt-4o-2024-08-06")
+    assert history.cached("An essay.", "College")["model"] == "gpt-4o-2024-08-06"
@@ -0,0 +1,83 @@
+import zipfile
+from io import BytesIO
+
+import pytest
+
+from ingest import IngestError, read_zip_submissions, student_id_from_filename
+
+DOCX_XML = (
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+    "<w:p><w:r><w:t>First paragraph.</w:t></w:r></w:p><w:p><w:r><w:t>Second paragraph.</w:t></w:r></w:p>"
+    "</w:body></w:document>"
+)
+
+
+def _docx() -> bytes:
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as docx:
+        docx.writestr("word/document.xml", DOCX_XML)
+    return buffer.getvalue()
+
+
+def _zip(members: dict) -> BytesIO:
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("alice.txt", "alice"),
+    ("Essays/alice.txt", "alice"),
+    ("Jane Doe_123456_assignsubmission_file_/essay.docx", "Jane Doe"),
+    ("submissions/Jane Doe_123456_assignsubmission_file_/essay.docx", "Jane Doe"),
+    ("Jane Doe_123456_assignsubmission_file_essay.docx", "Jane Doe"),
+    ("export\\doejane_LATE_12345_67890_essay.docx", "doejane"),
+    ("Period 3/doejane_12345_67890_final_draft.txt", "doejane"),
+    ("essay_2024_final.txt", "essay_2024_final"),
+])
+def test_student_id_from_filename(path, expected):
+    assert student_id_from_filename(path) == expected
+
+
+def test_read_zip_submissions_wrapped_moodle_export():
+    archive = _zip({
+        "submissions/Jane Doe_123456_assignsubmission_file_/essay.docx": _docx(),
+        "submissions/John Roe_654321_assignsubmission_file_/essay.txt": "My essay.",
+        "submissions/John Roe_654321_assignsubmission_file_/notes.pdf": b"%PDF",
+        "submissions/Empty Ann_111111_assignsubmission_file_/essay.txt": "   ",
+        "__MACOSX/submissions/._essay.txt": b"junk",
+    })
+    submissions, skipped = read_zip_submissions(archive, workers=1)
+    assert [(row["student_id"], row["essay"]) for row in submissions] == [
+        ("Jane Doe", "First paragraph.\n\nSecond paragraph."),
+        ("John Roe", "My essay."),
+    ]
+    assert sorted(reason for _, reason in skipped) == ["no text found", "unsupported file type"]
+
+
+def test_read_zip_submissions_rejects_non_zip():
+    with pytest.raises(IngestError):
+        read_zip_submissions(BytesIO(b"not a zip"), workers=1)
+
+
+def test_read_zip_submissions_skips_corrupt_and_encrypted_members():
+    archive = _zip({"alice.txt": "Alice wrote this essay.", "bob.txt": "Bob wrote this essay."})
+    data = bytearray(archive.getvalue())
+    # Flip a byte of Bob's stored data so its CRC check fails on read
+    offset = data.index(b"Bob wrote")
+    data[offset] ^= 0xFF
+    submissions, skipped = read_zip_submissions(BytesIO(bytes(data)), workers=1)
+    assert [row["student_id"] for row in submissions] == ["alice"]
+    assert skipped[0][0] == "bob.txt" and skipped[0][1].startswith("unreadable file")
+
+    encrypted = _zip({"carol.txt": "Carol wrote this essay."})
+    data = bytearray(encrypted.getvalue())
+    # Set the "encrypted" general-purpose flag in both the local and central headers
+    for signature in (b"PK\x03\x04", b"PK\x01\x02"):
+        header = data.index(signature)
+        data[header + (6 if signature == b"PK\x03\x04" else 8)] |= 0x01
+    submissions, skipped = read_zip_submissions(BytesIO(bytes(data)), workers=1)
+    assert submissions == [] and skipped == [("carol.txt", "encrypted file")]
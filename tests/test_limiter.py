@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from limiter import BULK, INTERACTIVE, FairShareLimiter, SlotCancelled
+
+
+def _wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def _queue(limiter, session_id, lane, granted):
+    def run():
+        with limiter.slot(session_id, lane):
+            granted.append(session_id)
+
+    waiting = limiter.stats()["waiting"]
+    thread = threading.Thread(target=run)
+    thread.start()
+    _wait_for(lambda: limiter.stats()["waiting"] == waiting + 1)
+    return thread
+
+
+def test_freed_slots_rotate_between_sessions():
+    limiter = FairShareLimiter(capacity=1, reserved=0)
+    holder = limiter.acquire("A")
+    granted = []
+    threads = [_queue(limiter, session, BULK, granted) for session in ("A", "A", "A", "B", "B")]
+    assert limiter.queue_position("B") == 2
+    limiter.release(holder)
+    for thread in threads:
+        thread.join(2)
+    assert granted == ["A", "B", "A", "B", "A"]
+
+
+def test_interactive_goes_first_and_bulk_never_takes_reserved_slot():
+    limiter = FairShareLimiter(capacity=2, reserved=1)
+    bulk = limiter.acquire("batch", BULK)
+    granted = []
+    queued_bulk = _queue(limiter, "batch", BULK, granted)
+    # The last slot is reserved, so the second bulk row waits while an interactive request walks in
+    interactive = limiter.acquire("teacher", INTERACTIVE, poll=0.01)
+    assert limiter.stats()["in_flight"] == 2
+    assert limiter.queue_position("teacher", INTERACTIVE) == 0
+    limiter.release(interactive)
+    assert granted == []
+    limiter.release(bulk)
+    queued_bulk.join(2)
+    assert granted == ["batch"]
+    assert limiter.lane_latency()[INTERACTIVE]["count"] == 1
+
+
+def test_cancelled_request_leaves_the_queue():
+    limiter = FairShareLimiter(capacity=1, reserved=0)
+    holder = limiter.acquire("A")
+    cancelled = threading.Event()
+    positions = []
+    cancelled_waits = []
+
+    def run():
+        try:
+            limiter.acquire("B", cancelled=cancelled, on_wait=positions.append, poll=0.01)
+        except SlotCancelled:
+            cancelled_waits.append(True)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    _wait_for(lambda: positions)
+    cancelled.set()
+    thread.join(2)
+    assert cancelled_waits == [True] and positions[0] == 1
+    assert limiter.stats()["waiting"] == 0
+    limiter.release(holder)
+    assert limiter.stats()["in_flight"] == 0
+
+
+@pytest.mark.parametrize("capacity, reserved, expected", [(4, 1, 1), (1, 1, 0), (3, 5, 2)])
+def test_reserved_slots_leave_bulk_at_least_one(capacity, reserved, expected):
+    assert FairShareLimiter(capacity, reserved).reserved == expected
+
+
+def test_try_acquire_leaves_reserved_slots_free():
+    limiter = FairShareLimiter(2, reserved=1)
+    ticket = limiter.try_acquire("hedge")
+    # Bulk may not take the reserved slot, even without waiting
+    assert ticket is not None and limiter.try_acquire("hedge") is None
+    limiter.release(ticket, record=False)
+    assert limiter.stats()["in_flight"] == 0
@@ -0,0 +1,68 @@
+import pytest
+
+from preflight import (INPUT_PRICE_PER_1M, OUTPUT_PRICE_PER_1M, clean_essay, clean_id, estimate_request_seconds,
+                       estimate_tokens, project, run_preflight)
+
+ESSAY = "Schools should start later because teenagers need more sleep to learn well."
+
+
+@pytest.mark.parametrize("value, problem", [
+    (None, "empty cell"),
+    (float("nan"), "empty cell"),
+    (42, "not text (int)"),
+    ("   ", "blank essay"),
+    ("too short", "fewer than 5 words"),
+])
+def test_clean_essay_rejects_ungradeable_cells(value, problem):
+    assert clean_essay(value) == (None, problem)
+
+
+@pytest.mark.parametrize("value, expected", [(12.0, "12"), (float("nan"), ""), (None, ""), (" S1 ", "S1")])
+def test_clean_id(value, expected):
+    assert clean_id(value) == expected
+
+
+def test_estimate_tokens_tracks_english_prose():
+    text = ESSAY * 20
+    assert 0.15 < estimate_tokens(text) / len(text) < 0.35
+
+
+def test_run_preflight_keeps_row_positions_and_reasons():
+    report = run_preflight([ESSAY, None, "too short", ESSAY], "College", student_ids=[7.0, "", "", "S4"])
+    assert [(row_id, student_id) for row_id, _, student_id, _ in report.rows] == [(0, "7"), (3, "S4")]
+    assert report.skipped == [(1, "empty cell"), (2, "fewer than 5 words")]
+    assert report.prompt_tokens == 2 * report.system_tokens + sum(report.essay_tokens.values())
+    assert report.completion_tokens == 2 * 1200
+    assert report.cost == pytest.approx(
+        (report.prompt_tokens * INPUT_PRICE_PER_1M + report.completion_tokens * OUTPUT_PRICE_PER_1M) / 1_000_000
+    )
+
+
+def test_concurrency_shortens_the_projection():
+    essays = [ESSAY] * 8
+    serial = run_preflight(essays, "College", concurrency=1)
+    parallel = run_preflight(essays, "College", concurrency=4)
+    assert serial.bottleneck == parallel.bottleneck == "concurrency"
+    assert serial.seconds == pytest.approx(8 * serial.row_seconds[0])
+    assert parallel.seconds == pytest.approx(2 * serial.row_seconds[0])
+
+
+def test_project_swaps_system_prompt_and_reply_length():
+    report = run_preflight([ESSAY, ESSAY], "College")
+    short = project(report, 100, "Score it.")
+    assert short.system_tokens < report.system_tokens
+    assert short.prompt_tokens == report.prompt_tokens - 2 * (report.system_tokens - short.system_tokens)
+    assert short.completion_tokens == 200
+    assert short.row_seconds[0] == pytest.approx(estimate_request_seconds(short.system_tokens + report.essay_tokens[0], 100))
+    # The original report is left as it was
+    assert report.completion_tokens == 2400
+
+
+def test_consistency_samples_multiply_tokens_and_cost_but_not_time():
+    report = run_preflight([ESSAY, ESSAY], "College", concurrency=2)
+    sampled = project(report, 1200, samples=5)
+    assert sampled.completion_tokens == 5 * report.completion_tokens
+    assert sampled.prompt_tokens == report.prompt_tokens
+    assert sampled.cost > report.cost
+    # The n replies come back from one request, generated side by side
+    assert sampled.row_seconds == report.row_seconds and sampled.seconds == report.seconds
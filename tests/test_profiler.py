@@ -0,0 +1,59 @@
+import contextvars
+import os
+import threading
+import time
+
+from profiler import RunProfiler, span
+
+
+def _in_thread(fn, *args):
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(fn, *args))
+    thread.start()
+    thread.join()
+
+
+def _record(name):
+    with span(name):
+        pass
+
+
+def test_spans_from_worker_threads_land_in_the_run(tmp_path):
+    profiler = RunProfiler(label="t", directory=str(tmp_path))
+    profiler.phase("grading")
+    _in_thread(_record, "API call")
+    profiler.finish()
+    assert [(phase, name) for phase, name, _ in profiler.spans] == [("grading", "API call")]
+    # Nothing is active once the run is finished
+    _record("after")
+    assert len(profiler.spans) == 1
+
+
+def test_late_spans_follow_the_hand_off(tmp_path):
+    first = RunProfiler(label="t", directory=str(tmp_path))
+    context = contextvars.copy_context()
+    first.finish()
+    second = RunProfiler(label="t", directory=str(tmp_path))
+    first.hand_off(second)
+    second.phase("poll wait")
+    context.run(_record, "API call")
+    assert first.spans == [] and [(phase, name) for phase, name, _ in second.spans] == [("poll wait", "API call")]
+    second.finish()
+    third = RunProfiler(label="t", directory=str(tmp_path))
+    second.hand_off(third)
+    context.run(_record, "API call")
+    assert len(third.spans) == 1
+    third.finish()
+
+
+def test_only_the_newest_runs_are_kept(tmp_path):
+    for _ in range(5):
+        RunProfiler(label="t", directory=str(tmp_path), keep=3).finish()
+        # Runs are named by their start time to the millisecond
+        time.sleep(0.002)
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_disabled_profiler_writes_nothing(tmp_path):
+    profiler = RunProfiler(False, directory=str(tmp_path))
+    _record("API call")
+    assert profiler.finish() is None and profiler.spans == [] and not os.listdir(tmp_path)
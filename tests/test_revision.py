@@ -0,0 +1,116 @@
+import types
+from functools import partial
+
+import pytest
+
+import grading
+from grading import Feedback, diff_paragraphs, prior_feedback_summary, split_paragraphs
+from history import FULL, REVISION, HistoryStore, grade_and_record
+from limiter import INTERACTIVE, FairShareLimiter
+
+DRAFT = "\n\n".join(f"Paragraph {index} says something about sleep and school start times." for index in range(1, 7))
+FEEDBACK = (
+    "## 🎯 OVERALL GRADE\n**Score: 72/100 | Letter Grade: C- | Performance Level: DEVELOPING**\n\n"
+    "## 💪 NOTABLE STRENGTHS\n- Clear topic\n\n"
+    "## 🎯 PRIORITY IMPROVEMENT AREAS\n1. Add evidence\n\n"
+    "## ✏️ CONCRETE REVISION EXAMPLES\n- ORIGINAL: old\n"
+)
+REVISED_FEEDBACK = "## 🎯 OVERALL GRADE\n**Score: 80/100 | Letter Grade: B- | Performance Level: PROFICIENT**\n"
+
+
+def revise(draft, index, text):
+    paragraphs = split_paragraphs(draft)
+    paragraphs[index] = text
+    return "\n\n".join(paragraphs)
+
+
+def test_split_paragraphs_falls_back_to_single_line_breaks():
+    assert split_paragraphs("One.\n\n  \nTwo.\n") == ["One.", "Two."]
+    assert split_paragraphs("One.\nTwo.\nThree.") == ["One.", "Two.", "Three."]
+
+
+def test_diff_reports_revised_added_and_removed_paragraphs():
+    revised = revise(DRAFT, 1, "Paragraph 2 now cites a 2019 sleep study.")
+    revised = revised.replace(split_paragraphs(DRAFT)[4] + "\n\n", "") + "\n\nA new conclusion."
+    diff = diff_paragraphs(DRAFT, revised)
+    assert [(change["kind"], change["paragraph"]) for change in diff["changes"]] == [
+        ("revised", 2), ("removed", 5), ("added", 6)
+    ]
+    assert diff["changes"][0]["before"].startswith("Paragraph 2 says")
+    assert (diff["paragraphs"], diff["previous_paragraphs"]) == (6, 6)
+    assert diff["changed_share"] == pytest.approx(0.5)
+
+
+def test_whitespace_only_edits_are_not_changes():
+    diff = diff_paragraphs(DRAFT, DRAFT.replace(" about", "   about").replace("\n\n", "\n\n\n"))
+    assert diff["changes"] == [] and diff["changed_share"] == 0
+
+
+def test_prior_feedback_summary_drops_sections_a_rescore_does_not_need():
+    summary = prior_feedback_summary(FEEDBACK)
+    assert "OVERALL GRADE" in summary and "PRIORITY IMPROVEMENT AREAS" in summary
+    assert "NOTABLE STRENGTHS" not in summary and "ORIGINAL: old" not in summary
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    requests = []
+
+    class Transport:
+        def create(self, **request):
+            requests.append(request)
+            message = types.SimpleNamespace(content=REVISED_FEEDBACK)
+            return types.SimpleNamespace(model=request["model"], choices=[types.SimpleNamespace(message=message)],
+                                         usage=types.SimpleNamespace(prompt_tokens=100, completion_tokens=50))
+
+    monkeypatch.setattr(grading, "_transport", Transport())
+    monkeypatch.setattr(grading, "_router", None)
+    store = HistoryStore(str(tmp_path / "history.db"))
+    store.requests = requests
+    store.record(DRAFT, FEEDBACK, "College", student_id="S1", assignment_id="A1")
+    return store
+
+
+def full_grade(essay, level, hedger=None):
+    return Feedback("full regrade")
+
+
+def test_small_revision_sends_only_the_changed_paragraphs(history):
+    revised = revise(DRAFT, 2, "Paragraph 3 now cites a 2019 sleep study.")
+    feedback = grade_and_record(revised, "College", history, "S1", "A1", grade_fn=full_grade, revision=True)
+    assert feedback.text == REVISED_FEEDBACK and feedback.revision["changed"] == 1
+    message = history.requests[0]["messages"][1]["content"]
+    assert "AFTER: Paragraph 3 now cites" in message and "Paragraph 5 says" not in message
+    assert history.requests[0]["max_tokens"] == grading.REVISION_MAX_TOKENS
+    assert history.lookup("S1", "A1")[0]["overall_score"] == 80
+    assert history.previous_submission("S1", "A1", "College")["mode"] == REVISION
+
+
+def test_unchanged_resubmission_reuses_the_earlier_feedback(history):
+    feedback = grade_and_record(DRAFT + "\n", "College", history, "S1", "A1", grade_fn=full_grade, revision=True)
+    assert feedback.cached and feedback.text == FEEDBACK and feedback.revision["changed"] == 0
+    assert history.requests == []
+
+
+def test_large_rewrite_is_graded_in_full(history):
+    rewrite = "\n\n".join(f"An entirely new paragraph {index} about homework." for index in range(6))
+    feedback = grade_and_record(rewrite, "College", history, "S1", "A1", grade_fn=full_grade, revision=True)
+    assert feedback.text == "full regrade" and feedback.revision is None
+    assert history.previous_submission("S1", "A1", "College")["mode"] == FULL
+
+
+def test_revision_request_takes_a_limiter_slot(history, monkeypatch):
+    limiter = FairShareLimiter(1, reserved=0)
+    seen = []
+    create = grading._transport.create
+
+    def counting(**request):
+        seen.append(limiter.stats()["in_flight"])
+        return create(**request)
+
+    monkeypatch.setattr(grading._transport, "create", counting)
+    revised = revise(DRAFT, 0, "Paragraph 1 now opens with a statistic.")
+    grade_and_record(revised, "College", history, "S1", "A1", grade_fn=full_grade, revision=True,
+                     slot=partial(limiter.slot, "teacher", INTERACTIVE))
+    # The slot is held while the revision request is in flight and released afterwards
+    assert seen == [1] and limiter.stats()["in_flight"] == 0
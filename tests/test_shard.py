@@ -0,0 +1,67 @@
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+import pytest
+
+import grading
+import shard
+from api import MockModel
+from export import ARROW, EXPORT_SCHEMA, PARQUET, ResultWriter
+from history import HistoryStore
+from limiter import FairShareLimiter
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setattr(grading, "_transport", MockModel(latency=0))
+    monkeypatch.setattr(grading, "_router", None)
+    essays = [("word " * (10 + 37 * row_id % 200)) + f"essay {row_id}" for row_id in range(20)]
+    essays[4] = "too short"
+    path = tmp_path / "essays.csv"
+    pd.DataFrame({"Essay": essays, "Student ID": [f"S{row_id}" for row_id in range(20)]}).to_csv(path, index=False)
+    return str(path)
+
+
+def _read(path, fmt):
+    if fmt == PARQUET:
+        return pq.read_table(path)
+    with ipc.open_file(path) as reader:
+        return reader.read_all()
+
+
+@pytest.mark.parametrize("fmt, leases", [(PARQUET, shard.SQLITE), (ARROW, shard.DIRECTORY)])
+def test_split_grade_and_merge_in_upload_order(tmp_path, source, fmt, leases):
+    directory = str(tmp_path / "run")
+    manifest = shard.split(source, directory, 3, "College", "scores", fmt=fmt, leases=leases)
+    assert manifest["shards"] == 3 and len(manifest["skipped"]) == 1
+    with pytest.raises(shard.ShardError):
+        shard.merge(directory, str(tmp_path / f"early.{fmt}"))
+    shard.run_worker(directory, "w0", FairShareLimiter(4, reserved=0), HistoryStore(str(tmp_path / "history.db")))
+    out = str(tmp_path / f"merged.{fmt}")
+    result = shard.merge(directory, out)
+    assert result["counts"] == {"graded": 19, "failed": 0, "skipped": 1}
+    table = _read(out, fmt)
+    assert table.column("row_id").to_pylist() == list(range(20))
+    assert table.column("status").to_pylist()[4] == "skipped"
+    # The sorted runs are spilled next to the output and cleaned up afterwards
+    assert not [path for path in tmp_path.iterdir() if path.name.startswith(".merge-")]
+
+
+def test_merge_keeps_the_latest_attempt_per_row(tmp_path, source):
+    directory = str(tmp_path / "run")
+    manifest = shard.split(source, directory, 2, "College", "scores")
+    shard.run_worker(directory, "w0", FairShareLimiter(4, reserved=0), HistoryStore(str(tmp_path / "history.db")))
+    # A row re-graded after the shard was published appears twice in its export
+    path = shard.output_path(directory, 0, manifest)
+    records = pq.read_table(path).to_pylist()
+    regraded = dict(records[0], feedback="second attempt", fallback="gpt-4o @ llm.example.edu", finished_at=max(record["finished_at"] for record in records)
+                    + pd.Timedelta(seconds=1))
+    writer = ResultWriter("College", PARQUET, path=path)
+    writer.append(regraded)
+    writer.close()
+    table = _read(shard.merge(directory, str(tmp_path / "merged.parquet"))["path"], PARQUET)
+    assert table.num_rows == 20
+    row = table.filter(pc.equal(table.column("row_id"), regraded["row_id"])).to_pylist()
+    assert [(record["feedback"], record["fallback"]) for record in row] == [("second attempt", "gpt-4o @ llm.example.edu")]
+    assert table.schema.equals(EXPORT_SCHEMA)
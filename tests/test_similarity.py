@@ -0,0 +1,48 @@
+import pytest
+
+from similarity import NearDuplicateIndex, shingles
+
+ESSAY = (
+    "Schools should start later in the morning because teenagers need more sleep to learn well. "
+    "Research from sleep scientists shows that adolescent body clocks shift later during puberty. "
+    "Districts that moved their start times saw better attendance, fewer car crashes and higher grades. "
+    "Critics worry about bus schedules and after-school jobs, but those problems can be solved with planning."
+)
+OTHER = (
+    "Homework in elementary school does little for learning and takes time away from play and family. "
+    "Studies find almost no link between homework and achievement for young children. "
+    "Teachers could replace it with reading for fun, which builds vocabulary without the stress."
+)
+
+
+@pytest.fixture
+def index(tmp_path):
+    return NearDuplicateIndex(str(tmp_path / "similarity.db"))
+
+
+def test_shingles_are_word_windows():
+    assert shingles("one two three four five six", size=5) == {"one two three four five", "two three four five six"}
+
+
+def test_near_duplicate_is_found_and_unrelated_essay_is_not(index):
+    index.add(ESSAY, "S1", "A1")
+    index.add(OTHER, "S2", "A1")
+    edited = ESSAY.replace("higher grades", "better grades overall")
+    matches = index.query(edited)
+    assert [match["student_id"] for match in matches] == ["S1"]
+    assert matches[0]["similarity"] > 0.6
+
+
+def test_check_and_add_many_checks_an_upload_against_itself(index):
+    results = index.check_and_add_many([(ESSAY, "S1", "A1"), (OTHER, "S2", "A1"), (ESSAY, "S3", "A1")])
+    assert results[0] == [] and results[1] == []
+    assert [match["student_id"] for match in results[2]] == ["S1"]
+    # Re-checking the same submission doesn't match itself
+    assert [match["student_id"] for match in index.check_and_add(ESSAY, "S1", "A1")] == ["S3"]
+    assert len(index) == 3
+
+
+def test_overlap_estimate():
+    assert NearDuplicateIndex.overlap(1.0, 100, 100) == 1.0
+    assert NearDuplicateIndex.overlap(0.0, 100, 100) == 0.0
+    assert NearDuplicateIndex.overlap(0.5, 0, 100) == 0.0